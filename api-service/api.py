@@ -1,21 +1,76 @@
 from flask import Flask, request, jsonify
 import requests
+from upstream import client_from_env
+from resilience import RESILIENCE_COUNTERS
+from rate_limit import (
+    RATE_LIMIT_COUNTERS, install_rate_limits, limiter_from_env
+)
+from tokens import VerifiedTokenCache, keyring_from_env
+from serving import serve, serving_mode
+from instrumentation import instrument_app, register_stats
+from log_config import configure_logging
+from tracing import trace_app
+from fastjson import install_json_provider
+from proxy import (
+    body_headers, conditional_headers, install_load_shedding,
+    install_proxy_limits, request_body, stream_response
+)
+import jwt
 import os
 import logging
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+# Set up logging (LOG_LEVEL, LOG_FORMAT, LOG_DEBUG_SAMPLE_RATE)
+configure_logging("api")
 
 app = Flask(__name__)
+install_json_provider(app)
+install_proxy_limits(app)
+install_load_shedding(app)
+instrument_app(app, "api")
+trace_app(app, "api", edge=True)
 
 # Authentication Service URL
 AUTH_SERVICE_URL = os.environ.get("AUTH_SERVICE_URL", "http://auth:8090")
 
+# Keep-alive client reused by every route forwarding to the auth service
+auth_client = client_from_env("auth", AUTH_SERVICE_URL)
+
+# Catalogue Service URL, called directly on read paths once the token has
+# been verified locally
+CATALOGUE_SERVICE_URL = os.environ.get(
+    "CATALOGUE_SERVICE_URL",
+    "http://catalogue:8091"
+    )
+catalogue_client = client_from_env("catalogue", CATALOGUE_SERVICE_URL)
+
+# JWT verification keys (same configuration as the auth service) and the
+# cache of already verified tokens
+token_cache = VerifiedTokenCache(
+    keyring_from_env(),
+    maxsize=int(os.environ.get("JWT_CACHE_SIZE", "10000"))
+)
+
+# Function to find the user a request is charged to (None when the token
+# is missing or invalid: the route itself rejects those)
+def request_user_id():
+    token = request.headers.get('Authorization')
+    if not token:
+        return None
+    try:
+        return token_cache.verify(token).get('user_id')
+    except jwt.InvalidTokenError:
+        return None
+
+# Per-IP and per-user budgets for login, register and the movie routes
+# (RATE_LIMIT_* variables), checked before anything is forwarded
+rate_limiter = limiter_from_env()
+install_rate_limits(app, rate_limiter, request_user_id)
+
 @app.route('/api/testauth', methods=['GET'])
 def api_testauth():
     try:
-        response = requests.get(f"{AUTH_SERVICE_URL}/auth/test-db")
-        return jsonify(response.json()), response.status_code
+        response = auth_client.get("/auth/test-db", stream=True)
+        return stream_response(response)
     except requests.exceptions.RequestException as e:
         return jsonify(
             {
@@ -29,11 +84,16 @@ def api_register():
     """
     Register a new user. This forwards the request to the auth service.
     """
-    data = request.get_json()
     try:
-        # Forward registration to the authentication service
-        response = requests.post(f"{AUTH_SERVICE_URL}/auth/register", json=data)
-        return jsonify(response.json()), response.status_code
+        # Stream the request to the authentication service and the
+        # answer (including any Retry-After) back
+        response = auth_client.post(
+            "/auth/register",
+            headers=body_headers(),
+            data=request_body(),
+            stream=True
+        )
+        return stream_response(response)
     except requests.exceptions.RequestException as e:
         return jsonify(
             {
@@ -47,11 +107,16 @@ def api_login():
     """
     Login a user. This forwards the request to the authentication service.
     """
-    data = request.get_json()
     try:
-        # Forward login request to the authentication service
-        response = requests.post(f"{AUTH_SERVICE_URL}/auth/login", json=data)
-        return jsonify(response.json()), response.status_code
+        # Stream the request to the authentication service and the
+        # answer (including any Retry-After) back
+        response = auth_client.post(
+            "/auth/login",
+            headers=body_headers(),
+            data=request_body(),
+            stream=True
+        )
+        return stream_response(response)
     except requests.exceptions.RequestException as e:
         return jsonify(
             {
@@ -60,99 +125,181 @@ def api_login():
             }
             ), 500
 
+# Export pool and cache counters on /metrics
+register_stats(
+    "upstream", "upstream",
+    lambda: {
+        "auth": auth_client.stats(),
+        "catalogue": catalogue_client.stats()
+    },
+    counters=("requests", "errors", "connections_checked_out",
+              "connections_new", "connections_reused")
+    + RESILIENCE_COUNTERS
+)
+register_stats(
+    "token_cache", "cache",
+    lambda: {"jwt": token_cache.stats()},
+    counters=("hits", "misses", "evictions")
+)
+if rate_limiter is not None:
+    register_stats(
+        "rate_limit", "budget", rate_limiter.stats,
+        counters=RATE_LIMIT_COUNTERS
+    )
+
+# Verify a token locally, returning (claims, None) or (None, error response)
+def verify_token(token):
+    try:
+        return token_cache.verify(token), None
+    except jwt.ExpiredSignatureError:
+        return None, (jsonify({"error": "Token has expired"}), 401)
+    except jwt.InvalidTokenError:
+        return None, (jsonify({"error": "Invalid token"}), 401)
+
 @app.route('/api/protected', methods=['GET'])
 def api_protected():
     """
     Example of a protected route requiring token authentication.
+    The token is verified locally, without a round trip to auth.
     """
     token = request.headers.get('Authorization')
     if not token:
         return jsonify({"message": "Token is missing"}), 401
 
-    logging.debug(f"Token received in api.py: {token}")  # Log the token
+    claims, error = verify_token(token)
+    if error:
+        return error
 
-    # Forward the token to the authentication service for validation
+    return jsonify(
+        {
+            "message": "Token is valid",
+            "data": {
+                "message": "This is protected data",
+                "user_id": claims['user_id']
+            }
+        }
+        ), 200
+    
+@app.route('/api/movies', methods=['GET'])
+def get_movies():
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"message": "Token is missing"}), 401
+
+    claims, error = verify_token(token)
+    if error:
+        return error
+
+    # Read path goes straight to the catalogue with the verified user_id
     try:
-        response = requests.get(
-            f"{AUTH_SERVICE_URL}/auth/protected",
-            headers={"Authorization": token}
-            )
-        if response.status_code == 200:
-            # If token is valid, perform business logic or call another pod
-            return jsonify(
-                {
-                    "message": "Token is valid",
-                    "data": response.json()
-                }
-                ), 200
-        else:
-            return jsonify(response.json()), response.status_code
+        # Paging/filter parameters and cursors are passed through untouched,
+        # as are If-None-Match and Accept-Encoding
+        response = catalogue_client.get(
+            "/catalogue/movies",
+            params=request.args,
+            headers=conditional_headers(request.headers),
+            json={"user_id": claims.get('user_id')},
+            stream=True
+        )
+        logging.debug("Response has code: %s", response.status_code)
+
+        # The catalogue's JSON (or 304) is streamed through as-is
+        return stream_response(response)
+
     except requests.exceptions.RequestException as e:
         return jsonify(
             {
-                "error": "Unable to connect to auth service",
+                "error": "Unable to connect to catalogue service",
                 "details": str(e)
             }
-            ), 500
-    
-@app.route('/api/movies', methods=['GET'])
-def get_movies():
+        ), 500
+
+@app.route('/api/movies/search', methods=['GET'])
+def search_movies():
+    """
+    Search the user's movies by name (?q=...&mode=prefix|fulltext|trigram,
+    plus the list's genre/year filters, limit and after). Like the other
+    read paths, this goes straight to the catalogue.
+    """
     token = request.headers.get('Authorization')
     if not token:
         return jsonify({"message": "Token is missing"}), 401
+
+    claims, error = verify_token(token)
+    if error:
+        return error
+
     try:
-        response = requests.get(
-            f"{AUTH_SERVICE_URL}/auth/movies",
-            headers={"Authorization": token}
+        response = catalogue_client.get(
+            "/catalogue/movies/search",
+            params=request.args,
+            json={"user_id": claims.get('user_id')},
+            stream=True
         )
-        logging.debug("Response has code: " + str(response.status_code))
-        logging.debug("Response content: " + response.text)
+        return stream_response(response)
+    except requests.exceptions.RequestException as e:
+        return jsonify(
+            {
+                "error": "Unable to connect to catalogue service",
+                "details": str(e)
+            }
+        ), 500
 
-        if response.status_code == 200:
-            try:
-                response_data = response.json()
-                return jsonify(response_data), response.status_code
-            except ValueError:
-                logging.error("Error parsing response as JSON")
-                return jsonify(
-                    {
-                        "error": "Invalid JSON response from auth service"
-                    }
-                ), 500
+@app.route('/api/movies/export', methods=['GET'])
+def export_movies():
+    """
+    Stream the user's whole catalogue as NDJSON (or CSV with ?format=csv).
+    Like the other read paths, this goes straight to the catalogue.
+    """
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"message": "Token is missing"}), 401
 
-        else:
-            return jsonify(response.json()), response.status_code
+    claims, error = verify_token(token)
+    if error:
+        return error
 
+    try:
+        upstream = catalogue_client.get(
+            "/catalogue/movies/export",
+            params={
+                "user_id": claims.get('user_id'),
+                "format": request.args.get('format', 'ndjson')
+            },
+            stream=True
+        )
     except requests.exceptions.RequestException as e:
         return jsonify(
             {
-                "error": "Unable to connect to auth service",
+                "error": "Unable to connect to catalogue service",
                 "details": str(e)
             }
         ), 500
 
+    # Relay chunks as they arrive instead of buffering the export
+    return stream_response(upstream)
+
 @app.route('/api/movies', methods=['POST'])
 def post_movie():
     token = request.headers.get('Authorization')
     if not token:
         return jsonify({"message": "Token is missing"}), 401
     try:
-        data = request.get_json()
-        response = requests.post(
-            f"{AUTH_SERVICE_URL}/auth/movies",
-            headers={"Authorization": token},
-            json=data
+        response = auth_client.post(
+            "/auth/movies",
+            headers=body_headers({"Authorization": token}),
+            data=request_body(),
+            stream=True
             )
         if response.status_code == 201:
             # If token is valid, perform business logic or call another pod
-            return jsonify(
-                {
-                    "message": "Token is valid", 
-                    "Added movie": response.json()
-                 }
-                ), response.status_code
+            return stream_response(
+                response,
+                envelope={"message": "Token is valid"},
+                key="Added movie"
+            )
         else:
-            return jsonify(response.json()), response.status_code
+            return stream_response(response)
     except requests.exceptions.RequestException as e:
         return jsonify(
             {
@@ -167,23 +314,116 @@ def delete_movie():
     if not token:
         return jsonify({"message": "Token is missing"}), 401
     try:
-        data = request.get_json()
-        response = requests.delete(
-            f"{AUTH_SERVICE_URL}/auth/movies",
-            headers={"Authorization": token},
-            json=data
+        response = auth_client.delete(
+            "/auth/movies",
+            headers=body_headers({"Authorization": token}),
+            data=request_body(),
+            stream=True
         )
         if response.status_code == 200:
-            return jsonify(
-                {
-                    "message": "Token is valid",
-                    "Deleted movie": response.json()
-                }
-            ), response.status_code
+            return stream_response(
+                response,
+                envelope={"message": "Token is valid"},
+                key="Deleted movie"
+            )
         elif response.status_code == 404:
+            response.close()
             return jsonify({"error": "Movie not found"}), 404
         else:
-            return jsonify(response.json()), response.status_code
+            return stream_response(response)
+    except requests.exceptions.RequestException as e:
+        return jsonify(
+            {
+                "error": "Unable to connect to auth service",
+                "details": str(e)
+            }
+        ), 500
+
+@app.route('/api/movies/bulk', methods=['POST'])
+def import_movies_bulk():
+    """
+    Import a JSON array or NDJSON stream of movies. The body is streamed
+    to the auth service as it arrives.
+    """
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"message": "Token is missing"}), 401
+    try:
+        response = auth_client.post(
+            "/auth/movies/bulk",
+            headers=body_headers({"Authorization": token}),
+            data=request_body(),
+            stream=True
+        )
+        if response.status_code == 200:
+            return stream_response(
+                response,
+                envelope={"message": "Token is valid"},
+                key="Imported movies"
+            )
+        else:
+            return stream_response(response)
+    except requests.exceptions.RequestException as e:
+        return jsonify(
+            {
+                "error": "Unable to connect to auth service",
+                "details": str(e)
+            }
+        ), 500
+
+@app.route('/api/movies/batch', methods=['POST'])
+def run_movie_batch():
+    """
+    Apply an ordered list of add/delete operations in one round trip:
+    {"operations": [{"op": "add", "name": ..., "genre": ..., "year": ...},
+    {"op": "delete", "name": ..., "year": ...}], "atomic": false}
+    """
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"message": "Token is missing"}), 401
+    try:
+        response = auth_client.post(
+            "/auth/movies/batch",
+            headers=body_headers({"Authorization": token}),
+            data=request_body(),
+            stream=True
+        )
+        if response.status_code in (200, 409):
+            return stream_response(
+                response,
+                envelope={"message": "Token is valid"},
+                key="Batch results"
+            )
+        else:
+            return stream_response(response)
+    except requests.exceptions.RequestException as e:
+        return jsonify(
+            {
+                "error": "Unable to connect to auth service",
+                "details": str(e)
+            }
+        ), 500
+
+@app.route('/api/movies/bulk', methods=['DELETE'])
+def delete_movies_bulk():
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"message": "Token is missing"}), 401
+    try:
+        response = auth_client.delete(
+            "/auth/movies/bulk",
+            headers=body_headers({"Authorization": token}),
+            data=request_body(),
+            stream=True
+        )
+        if response.status_code == 200:
+            return stream_response(
+                response,
+                envelope={"message": "Token is valid"},
+                key="Deleted movies"
+            )
+        else:
+            return stream_response(response)
     except requests.exceptions.RequestException as e:
         return jsonify(
             {
@@ -192,5 +432,34 @@ def delete_movie():
             }
         ), 500
 
+# Route to inspect upstream connection reuse counters
+@app.route('/api/stats', methods=['GET'])
+def service_stats():
+    return jsonify(
+        {
+            "upstreams": {
+                "auth": auth_client.stats(),
+                "catalogue": catalogue_client.stats()
+            },
+            "token_cache": token_cache.stats(),
+            "rate_limit": rate_limiter.stats() if rate_limiter else None
+        }
+    ), 200
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=8080)
\ No newline at end of file
+    # API_GATEWAY_MODE=async serves the asyncio gateway (api_async.py)
+    # with the same routes instead of this threaded Flask app
+    async_gateway = os.environ.get("API_GATEWAY_MODE", "sync") == "async"
+
+    # SERVE_MODE=development keeps the single-process debug servers
+    if serving_mode() == "development":
+        if async_gateway:
+            import uvicorn
+            uvicorn.run("api_async:app", host='0.0.0.0', port=8080)
+        else:
+            app.run(debug=True, host='0.0.0.0', port=8080)
+    elif async_gateway:
+        serve("api_async:app", 8080,
+              worker_class="uvicorn.workers.UvicornWorker")
+    else:
+        serve(app, 8080)
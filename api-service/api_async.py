@@ -0,0 +1,672 @@
+"""
+Asyncio gateway mode for the api service.
+
+Exposes the same /api/* routes and response shapes as api.py, but runs as
+an ASGI app and forwards to the auth service through a pooled
+httpx.AsyncClient, so an in-flight request waiting on auth only costs a
+coroutine instead of a worker thread. Selected with
+API_GATEWAY_MODE=async (see api.py).
+"""
+from quart import Quart, Response, g, request, jsonify
+import asyncio
+import httpx
+from werkzeug.exceptions import RequestEntityTooLarge
+import jwt
+import math
+import os
+import time
+import weakref
+from tokens import VerifiedTokenCache, keyring_from_env
+from instrumentation import (
+    ERRORS, REQUEST_LATENCY, REQUESTS_IN_FLIGHT, UPSTREAM_LATENCY,
+    metrics_payload, register_stats
+)
+from log_config import configure_logging
+from fastjson import PASSTHROUGH, envelope_prefix, is_json
+from proxy import (
+    CHUNK_SIZE, MAX_REQUEST_BYTES, conditional_headers, copy_headers
+)
+from resilience import (
+    FAILURE_STATUSES, RESILIENCE_COUNTERS, UpstreamUnavailable,
+    breaker_from_env, bulkhead_from_env, release_once
+)
+from rate_limit import (
+    RATE_LIMIT_COUNTERS, LocalBackend, client_ip, group_for, limiter_from_env
+)
+from tracing import configure, start_server_span, tag_response, tracer
+import logging
+
+# Set up logging (LOG_LEVEL, LOG_FORMAT, LOG_DEBUG_SAMPLE_RATE)
+configure_logging("api")
+
+app = Quart(__name__)
+if MAX_REQUEST_BYTES:
+    app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_BYTES
+configure("api")
+
+# Authentication Service URL
+AUTH_SERVICE_URL = os.environ.get("AUTH_SERVICE_URL", "http://auth:8090")
+
+# Async client settings (shared with the sync client where they overlap)
+UPSTREAM_MAX_CONNECTIONS = int(
+    os.environ.get("UPSTREAM_ASYNC_MAX_CONNECTIONS", "1000")
+)
+UPSTREAM_POOL_SIZE = int(os.environ.get("UPSTREAM_POOL_SIZE", "100"))
+UPSTREAM_CONNECT_TIMEOUT = float(
+    os.environ.get("UPSTREAM_CONNECT_TIMEOUT", "2")
+)
+UPSTREAM_READ_TIMEOUT = float(os.environ.get("UPSTREAM_READ_TIMEOUT", "10"))
+UPSTREAM_RETRIES = int(os.environ.get("UPSTREAM_RETRIES", "2"))
+
+# Catalogue Service URL, called directly on read paths once the token has
+# been verified locally
+CATALOGUE_SERVICE_URL = os.environ.get(
+    "CATALOGUE_SERVICE_URL",
+    "http://catalogue:8091"
+    )
+
+token_cache = VerifiedTokenCache(
+    keyring_from_env(),
+    maxsize=int(os.environ.get("JWT_CACHE_SIZE", "10000"))
+)
+
+
+# The user a request is charged to (None when the token is missing or
+# invalid: the route itself rejects those)
+def request_user_id():
+    token = request.headers.get('Authorization')
+    if not token:
+        return None
+    try:
+        return token_cache.verify(token).get('user_id')
+    except jwt.InvalidTokenError:
+        return None
+
+
+# Same budgets as api.py (RATE_LIMIT_* variables)
+rate_limiter = limiter_from_env()
+if rate_limiter is not None:
+    register_stats(
+        "rate_limit", "budget", rate_limiter.stats,
+        counters=RATE_LIMIT_COUNTERS
+    )
+
+clients = {}
+upstream_stats = {
+    "auth": {"requests": 0, "errors": 0},
+    "catalogue": {"requests": 0, "errors": 0},
+}
+
+# Per-upstream circuit breakers and bulkheads, as in upstream.py
+breakers = {name: breaker_from_env(name) for name in upstream_stats}
+bulkheads = {name: bulkhead_from_env() for name in upstream_stats}
+
+
+def upstream_snapshot(name):
+    stats = dict(upstream_stats[name])
+    stats.update(breakers[name].stats())
+    stats.update(bulkheads[name].stats())
+    return stats
+
+
+register_stats(
+    "upstream", "upstream",
+    lambda: {name: upstream_snapshot(name) for name in upstream_stats},
+    counters=("requests", "errors") + RESILIENCE_COUNTERS
+)
+
+
+def new_client(base_url):
+    return httpx.AsyncClient(
+        base_url=base_url,
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_POOL_SIZE,
+        ),
+        timeout=httpx.Timeout(
+            UPSTREAM_READ_TIMEOUT,
+            connect=UPSTREAM_CONNECT_TIMEOUT,
+        ),
+        # Connection-level retries only: requests are never replayed
+        transport=httpx.AsyncHTTPTransport(retries=UPSTREAM_RETRIES),
+    )
+
+
+@app.before_serving
+async def open_clients():
+    clients["auth"] = new_client(AUTH_SERVICE_URL)
+    clients["catalogue"] = new_client(CATALOGUE_SERVICE_URL)
+
+
+@app.after_serving
+async def close_clients():
+    for client in clients.values():
+        await client.aclose()
+
+
+@app.before_request
+async def start_timer():
+    g.request_started = time.perf_counter()
+    REQUESTS_IN_FLIGHT.labels("api").inc()
+    g.trace_span, g.trace_token = start_server_span(
+        request.method, request.path, request.headers, edge=True
+    )
+
+
+# Registered after start_timer, so a 429 is still timed and traced
+@app.before_request
+async def check_rate_limit():
+    group = group_for(request.path)
+    if rate_limiter is None or group is None:
+        return None
+    ip = client_ip(request.remote_addr,
+                   request.headers.get("X-Forwarded-For"))
+    user_id = request_user_id() if rate_limiter.limits_users(group) else None
+    if isinstance(rate_limiter.backend, LocalBackend):
+        wait = rate_limiter.check(group, ip, user_id)
+    else:
+        # A shared backend is a network round trip: keep it off the loop
+        wait = await asyncio.to_thread(rate_limiter.check, group, ip, user_id)
+    if wait:
+        response = jsonify({"error": "Too many requests, retry later"})
+        response.headers["Retry-After"] = str(max(1, math.ceil(wait)))
+        return response, 429
+    return None
+
+
+@app.after_request
+async def record_latency(response):
+    started = g.pop("request_started", None)
+    route = request.url_rule.rule if request.url_rule else None
+    if started is not None:
+        REQUEST_LATENCY.labels(
+            "api", request.method, route or "unmatched", response.status_code
+        ).observe(time.perf_counter() - started)
+    span = g.get("trace_span")
+    if span is not None:
+        tag_response(span, request.method, route, response)
+    return response
+
+
+@app.teardown_request
+async def finish(error):
+    if error is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        ERRORS.labels("api", route).inc()
+    REQUESTS_IN_FLIGHT.labels("api").dec()
+    span = g.pop("trace_span", None)
+    token = g.pop("trace_token", None)
+    if span is not None:
+        tracer.end_span(span, error=error)
+    if token is not None:
+        tracer.deactivate(token)
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    payload, content_type = metrics_payload()
+    return Response(payload, content_type=content_type)
+
+
+async def forward(method, path, upstream="auth", **kwargs):
+    # Never wait for a bulkhead slot: that would block the event loop
+    bulkhead = bulkheads[upstream]
+    if not bulkhead.acquire(wait=0):
+        raise UpstreamUnavailable(upstream, "overloaded", 1)
+    release_slot = release_once(bulkhead.release)
+    try:
+        breakers[upstream].before_call()
+        response = await send(method, path, upstream, **kwargs)
+    except BaseException:
+        release_slot()
+        raise
+    # The body is still to come: hold the slot until the response is
+    # closed, which httpx also does once the body has been read
+    aclose = response.aclose
+
+    async def aclose_and_release():
+        try:
+            await aclose()
+        finally:
+            release_slot()
+
+    response.aclose = aclose_and_release
+    weakref.finalize(response, release_slot)
+    return response
+
+
+async def send(method, path, upstream, **kwargs):
+    stats = upstream_stats[upstream]
+    stats["requests"] += 1
+    breaker = breakers[upstream]
+    started = time.perf_counter()
+    status = "error"
+    with tracer.span(
+        f"{upstream} {method} {path}", kind="client",
+        attributes={"peer.service": upstream, "http.method": method}
+    ) as span:
+        kwargs["headers"] = tracer.inject(dict(kwargs.get("headers") or {}))
+        client = clients[upstream]
+        try:
+            # Responses are streamed: relay() or aclose() must follow
+            response = await client.send(
+                client.build_request(method, path, **kwargs), stream=True
+            )
+            status = response.status_code
+            span.attributes["http.status_code"] = status
+        except httpx.HTTPError:
+            stats["errors"] += 1
+            breaker.record_failure()
+            raise
+        except BaseException:
+            breaker.record_neutral()
+            raise
+        finally:
+            UPSTREAM_LATENCY.labels(upstream, method, status).observe(
+                time.perf_counter() - started
+            )
+        if status in FAILURE_STATUSES:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+
+# Verify a token locally, returning (claims, None) or (None, error response)
+def verify_token(token):
+    try:
+        return token_cache.verify(token), None
+    except jwt.ExpiredSignatureError:
+        return None, (jsonify({"error": "Token has expired"}), 401)
+    except jwt.InvalidTokenError:
+        return None, (jsonify({"error": "Invalid token"}), 401)
+
+
+def auth_unavailable(e):
+    return jsonify(
+        {
+            "error": "Unable to connect to auth service",
+            "details": str(e)
+        }
+    ), 500
+
+
+# Relay a streamed upstream response chunk by chunk, optionally nesting
+# its JSON body under `key` next to `envelope` (see proxy.stream_response)
+async def relay(upstream, status=None, envelope=None, key=None):
+    status = status or upstream.status_code
+    expects_json = envelope is not None or is_json(upstream)
+    if expects_json and (not PASSTHROUGH or not is_json(upstream)):
+        try:
+            await upstream.aread()
+            data = upstream.json()
+        except ValueError:
+            logging.error("Upstream answered %s with a non-JSON body",
+                          upstream.status_code)
+            return jsonify(
+                {"error": "Invalid JSON response from upstream service"}
+            ), 500
+        finally:
+            await upstream.aclose()
+        if envelope is not None:
+            data = dict(envelope, **{key: data})
+        return jsonify(data), status
+
+    if envelope is None:
+        chunks = upstream.aiter_raw(CHUNK_SIZE)
+        headers = copy_headers(upstream)
+    else:
+        chunks = upstream.aiter_bytes(CHUNK_SIZE)
+        headers = copy_headers(upstream, keep=(), drop=("content-encoding",))
+
+    async def body():
+        try:
+            if envelope is not None:
+                yield envelope_prefix(envelope, key)
+            async for chunk in chunks:
+                yield chunk
+            if envelope is not None:
+                yield b"}"
+        finally:
+            await upstream.aclose()
+
+    return Response(body(), status=status, headers=headers)
+
+
+# Stream the incoming body upstream, counting bytes so chunked uploads
+# without a Content-Length are limited too
+async def request_body():
+    received = 0
+    async for chunk in request.body:
+        received += len(chunk)
+        if MAX_REQUEST_BYTES and received > MAX_REQUEST_BYTES:
+            raise RequestEntityTooLarge()
+        yield chunk
+
+
+def body_headers(headers=None):
+    headers = dict(headers or {})
+    headers.setdefault(
+        "Content-Type", request.content_type or "application/json"
+    )
+    if request.content_length is not None:
+        headers["Content-Length"] = str(request.content_length)
+    return headers
+
+
+@app.errorhandler(UpstreamUnavailable)
+async def upstream_unavailable(error):
+    response = jsonify(
+        {
+            "error": f"Upstream {error.upstream} service unavailable",
+            "reason": error.reason
+        }
+    )
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 503
+
+
+@app.errorhandler(RequestEntityTooLarge)
+async def too_large(error):
+    return jsonify(
+        {"error": "Request body too large", "limit_bytes": MAX_REQUEST_BYTES}
+    ), 413
+
+
+@app.route('/api/testauth', methods=['GET'])
+async def api_testauth():
+    try:
+        response = await forward("GET", "/auth/test-db")
+        return await relay(response)
+    except httpx.HTTPError as e:
+        return auth_unavailable(e)
+
+
+@app.route('/api/register', methods=['POST'])
+async def api_register():
+    """
+    Register a new user. This forwards the request to the auth service.
+    """
+    try:
+        # Any Retry-After from auth is passed on with the other headers
+        response = await forward(
+            "POST",
+            "/auth/register",
+            headers=body_headers(),
+            content=request_body()
+        )
+        return await relay(response)
+    except httpx.HTTPError as e:
+        return auth_unavailable(e)
+
+
+@app.route('/api/login', methods=['POST'])
+async def api_login():
+    """
+    Login a user. This forwards the request to the authentication service.
+    """
+    try:
+        # Any Retry-After from auth is passed on with the other headers
+        response = await forward(
+            "POST",
+            "/auth/login",
+            headers=body_headers(),
+            content=request_body()
+        )
+        return await relay(response)
+    except httpx.HTTPError as e:
+        return auth_unavailable(e)
+
+
+@app.route('/api/protected', methods=['GET'])
+async def api_protected():
+    """
+    Example of a protected route requiring token authentication.
+    The token is verified locally, without a round trip to auth.
+    """
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"message": "Token is missing"}), 401
+
+    claims, error = verify_token(token)
+    if error:
+        return error
+
+    return jsonify(
+        {
+            "message": "Token is valid",
+            "data": {
+                "message": "This is protected data",
+                "user_id": claims['user_id']
+            }
+        }
+    ), 200
+
+
+@app.route('/api/movies', methods=['GET'])
+async def get_movies():
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"message": "Token is missing"}), 401
+
+    claims, error = verify_token(token)
+    if error:
+        return error
+
+    try:
+        response = await forward(
+            "GET",
+            "/catalogue/movies",
+            upstream="catalogue",
+            params=list(request.args.items(multi=True)),
+            headers=conditional_headers(request.headers),
+            json={"user_id": claims.get('user_id')}
+        )
+        logging.debug("Response has code: %s", response.status_code)
+        return await relay(response)
+    except httpx.HTTPError as e:
+        return jsonify(
+            {
+                "error": "Unable to connect to catalogue service",
+                "details": str(e)
+            }
+        ), 500
+
+
+@app.route('/api/movies/search', methods=['GET'])
+async def search_movies():
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"message": "Token is missing"}), 401
+
+    claims, error = verify_token(token)
+    if error:
+        return error
+
+    try:
+        response = await forward(
+            "GET",
+            "/catalogue/movies/search",
+            upstream="catalogue",
+            params=list(request.args.items(multi=True)),
+            json={"user_id": claims.get('user_id')}
+        )
+        return await relay(response)
+    except httpx.HTTPError as e:
+        return jsonify(
+            {
+                "error": "Unable to connect to catalogue service",
+                "details": str(e)
+            }
+        ), 500
+
+
+@app.route('/api/movies/export', methods=['GET'])
+async def export_movies():
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"message": "Token is missing"}), 401
+
+    claims, error = verify_token(token)
+    if error:
+        return error
+
+    try:
+        upstream = await forward(
+            "GET",
+            "/catalogue/movies/export",
+            upstream="catalogue",
+            params={
+                "user_id": claims.get('user_id'),
+                "format": request.args.get('format', 'ndjson')
+            }
+        )
+    except httpx.HTTPError as e:
+        return jsonify(
+            {
+                "error": "Unable to connect to catalogue service",
+                "details": str(e)
+            }
+        ), 500
+
+    # Relay chunks as they arrive instead of buffering the export
+    return await relay(upstream)
+
+
+@app.route('/api/movies', methods=['POST'])
+async def post_movie():
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"message": "Token is missing"}), 401
+    try:
+        response = await forward(
+            "POST",
+            "/auth/movies",
+            headers=body_headers({"Authorization": token}),
+            content=request_body()
+        )
+        if response.status_code == 201:
+            return await relay(
+                response,
+                envelope={"message": "Token is valid"},
+                key="Added movie"
+            )
+        return await relay(response)
+    except httpx.HTTPError as e:
+        return auth_unavailable(e)
+
+
+@app.route('/api/movies', methods=['DELETE'])
+async def delete_movie():
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"message": "Token is missing"}), 401
+    try:
+        response = await forward(
+            "DELETE",
+            "/auth/movies",
+            headers=body_headers({"Authorization": token}),
+            content=request_body()
+        )
+        if response.status_code == 200:
+            return await relay(
+                response,
+                envelope={"message": "Token is valid"},
+                key="Deleted movie"
+            )
+        elif response.status_code == 404:
+            await response.aclose()
+            return jsonify({"error": "Movie not found"}), 404
+        return await relay(response)
+    except httpx.HTTPError as e:
+        return auth_unavailable(e)
+
+
+@app.route('/api/movies/bulk', methods=['POST'])
+async def import_movies_bulk():
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"message": "Token is missing"}), 401
+
+    try:
+        response = await forward(
+            "POST",
+            "/auth/movies/bulk",
+            headers=body_headers({"Authorization": token}),
+            content=request_body()
+        )
+        if response.status_code == 200:
+            return await relay(
+                response,
+                envelope={"message": "Token is valid"},
+                key="Imported movies"
+            )
+        return await relay(response)
+    except httpx.HTTPError as e:
+        return auth_unavailable(e)
+
+
+@app.route('/api/movies/batch', methods=['POST'])
+async def run_movie_batch():
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"message": "Token is missing"}), 401
+
+    try:
+        response = await forward(
+            "POST",
+            "/auth/movies/batch",
+            headers=body_headers({"Authorization": token}),
+            content=request_body()
+        )
+        if response.status_code in (200, 409):
+            return await relay(
+                response,
+                envelope={"message": "Token is valid"},
+                key="Batch results"
+            )
+        return await relay(response)
+    except httpx.HTTPError as e:
+        return auth_unavailable(e)
+
+
+@app.route('/api/movies/bulk', methods=['DELETE'])
+async def delete_movies_bulk():
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"message": "Token is missing"}), 401
+    try:
+        response = await forward(
+            "DELETE",
+            "/auth/movies/bulk",
+            headers=body_headers({"Authorization": token}),
+            content=request_body()
+        )
+        if response.status_code == 200:
+            return await relay(
+                response,
+                envelope={"message": "Token is valid"},
+                key="Deleted movies"
+            )
+        return await relay(response)
+    except httpx.HTTPError as e:
+        return auth_unavailable(e)
+
+
+# Route to inspect upstream usage counters
+@app.route('/api/stats', methods=['GET'])
+async def service_stats():
+    upstreams = {
+        name: dict(
+            upstream_snapshot(name),
+            base_url=str(clients[name].base_url), mode="async"
+        )
+        for name in upstream_stats
+    }
+    return jsonify(
+        {
+            "upstreams": upstreams,
+            "token_cache": token_cache.stats(),
+            "rate_limit": rate_limiter.stats() if rate_limiter else None
+        }
+    ), 200
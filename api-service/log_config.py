@@ -0,0 +1,156 @@
+"""
+Structured, non-blocking logging shared by the three services.
+
+Records are emitted as one JSON object per line. Request threads only put
+the (unformatted) record on an in-memory queue; a background listener
+thread formats and writes it, so a slow stderr never stalls a request.
+Debug records can be sampled to keep high-volume paths cheap.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from tracing import tracer
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord(
+    "", logging.INFO, "", 0, "", (), None
+))) | {"message", "asctime", "trace_id", "service"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format a record (and any `extra=` fields) as a single JSON line."""
+
+    def __init__(self, service):
+        super().__init__()
+        self.service = service
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime(
+                "%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)
+            ) + ".%03dZ" % record.msecs,
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """Let through only `rate` of the DEBUG records."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room instead of raising queue.Full: stopping with a
+        # full queue (at exit, after a burst) must still drain it
+        self.queue.put(self._sentinel)
+
+
+class BackgroundHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that hands records to a QueueListener thread without
+    formatting them first, and drops (and counts) records instead of
+    blocking when the queue is full. The listener is (re)started lazily in
+    each process, so it survives pre-forking servers.
+    """
+
+    def __init__(self, target, max_queue):
+        super().__init__(queue.Queue(max_queue))
+        self.target = target
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                # A forked child inherits the queue but not the thread
+                self.queue = queue.Queue(self.max_queue)
+                self._listener = _Listener(
+                    self.queue, self.target, respect_handler_level=True
+                )
+                self._listener.start()
+                self._pid = os.getpid()
+
+    def prepare(self, record):
+        # Keep msg/args unmerged: the listener thread formats the record.
+        # Capture what only the calling thread knows (the trace context).
+        span = tracer.current_span()
+        record.trace_id = span.trace_id if span is not None else None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._pid = None
+
+
+def configure_logging(service):
+    """
+    Replace the root logger's handlers with a background JSON handler
+    configured from the LOG_* environment variables.
+    """
+    level = os.environ.get("LOG_LEVEL", "INFO").upper()
+    stream = logging.StreamHandler(sys.stderr)
+    if os.environ.get("LOG_FORMAT", "json") == "json":
+        stream.setFormatter(JsonFormatter(service))
+    else:
+        stream.setFormatter(logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s: %(message)s"
+        ))
+
+    handler = BackgroundHandler(
+        stream, int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+    )
+    handler.addFilter(DebugSampler(
+        float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+    ))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    # Drain whatever is still queued when the process exits
+    atexit.register(handler.stop)
+    return handler
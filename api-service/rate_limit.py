@@ -0,0 +1,301 @@
+"""
+Token-bucket rate limiting at the api edge.
+
+Each budget is a bucket of `capacity` tokens refilled at `capacity /
+period` tokens per second; a request takes one token from the bucket of
+its client IP and, once authenticated, one from the bucket of its
+user_id; a request either budget denies is charged to neither. Login,
+register and the movie routes have separate budgets (RATE_LIMIT_*
+variables). Buckets live in-process by default, so with
+several workers or replicas each one enforces its own share; the Redis
+backend keeps them in one store shared by all of them.
+"""
+import collections
+import logging
+import math
+import os
+import threading
+import time
+
+from flask import jsonify, request
+
+# Budget: a bucket of `capacity` tokens refilled at `rate` tokens/second
+Rate = collections.namedtuple("Rate", ["capacity", "rate"])
+
+# Route -> budget group; every /api/movies route shares the movies budget
+EXACT_ROUTES = {"/api/login": "login", "/api/register": "register"}
+PREFIX_ROUTES = (("/api/movies", "movies"),)
+
+# Default budgets as "<requests>/<seconds>" per group and key kind. The
+# per-IP ones leave room for clients sharing an address: behind the
+# cluster's NodePort, every client shows up as the node's IP (see README)
+DEFAULT_LIMITS = {
+    ("login", "ip"): "60/60",
+    ("register", "ip"): "20/60",
+    ("movies", "ip"): "600/60",
+    ("movies", "user"): "300/60",
+}
+
+
+def parse_rate(value):
+    """Parse "<requests>/<seconds>" into a Rate, or None if disabled."""
+    if not value or value.strip() in ("0", "off"):
+        return None
+    try:
+        count, _, period = value.partition("/")
+        count, period = float(count), float(period or 1)
+    except ValueError:
+        raise ValueError(f"Invalid rate limit {value!r}, "
+                         "expected <requests>/<seconds>")
+    if count <= 0 or period <= 0:
+        return None
+    return Rate(count, count / period)
+
+
+def group_for(path):
+    group = EXACT_ROUTES.get(path)
+    if group is not None:
+        return group
+    for prefix, group in PREFIX_ROUTES:
+        if path == prefix or path.startswith(prefix + "/"):
+            return group
+    return None
+
+
+class LocalBackend:
+    """
+    In-process buckets, least recently used ones evicted past `maxsize`.
+
+    Implements the same take()/refund() interface as RedisBackend, so it
+    doubles as a local stand-in for it in development.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, limit):
+        """Take a token; return 0 if allowed, else seconds to wait."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (limit.capacity, now))
+            tokens = min(limit.capacity,
+                         tokens + (now - updated) * limit.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / limit.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def refund(self, key, limit):
+        """Give back a token taken from `key`'s bucket."""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                tokens, updated = bucket
+                self._buckets[key] = (min(limit.capacity, tokens + 1),
+                                      updated)
+
+    def size(self):
+        with self._lock:
+            return len(self._buckets)
+
+
+# Refill and take atomically on the server, using the server's clock so
+# every replica agrees on elapsed time
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+# Give a token back, without refilling the bucket past its capacity
+REFUND_SCRIPT = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if tokens then
+    tokens = math.min(tonumber(ARGV[1]), tokens + 1)
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens))
+end
+return 0
+"""
+
+
+class RedisBackend:
+    """
+    Buckets shared by every api replica and worker. Needs the optional
+    `redis` package; idle buckets expire once they would be full again.
+    """
+
+    def __init__(self, url, prefix="ratelimit:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(TAKE_SCRIPT)
+        self._refund = self.client.register_script(REFUND_SCRIPT)
+
+    def take(self, key, limit):
+        return float(self._take(
+            keys=[self.prefix + key], args=[limit.capacity, limit.rate]
+        ))
+
+    def refund(self, key, limit):
+        self._refund(keys=[self.prefix + key], args=[limit.capacity])
+
+    def size(self):
+        return None
+
+
+class RateLimiter:
+    """
+    Charge requests to per-IP and per-user budgets. A failing backend lets
+    requests through (and counts the error) rather than rejecting them.
+    """
+
+    def __init__(self, backend, limits):
+        self.backend = backend
+        self.limits = limits
+        self._lock = threading.Lock()
+        self._stats = {
+            f"{group}_{kind}": {"allowed": 0, "limited": 0,
+                                "backend_errors": 0}
+            for group, kind in limits
+        }
+
+    def _take(self, group, kind, key):
+        limit = self.limits[(group, kind)]
+        try:
+            wait = self.backend.take(f"{group}:{kind}:{key}", limit)
+        except Exception:
+            logging.exception("Rate limit backend failed")
+            wait, outcome = 0.0, "backend_errors"
+        else:
+            outcome = "limited" if wait else "allowed"
+        with self._lock:
+            self._stats[f"{group}_{kind}"][outcome] += 1
+        return wait
+
+    def _refund(self, group, kind, key):
+        try:
+            self.backend.refund(f"{group}:{kind}:{key}",
+                                self.limits[(group, kind)])
+        except Exception:
+            logging.exception("Rate limit backend failed")
+
+    def check(self, group, ip, user_id=None):
+        """
+        Charge a request of `group` to its budgets. Returns 0 if it may
+        proceed, else the seconds until the exhausted bucket has a token.
+        Budgets are charged in turn, and a denied request is not charged
+        at all: the tokens already taken for it are given back.
+        """
+        charged = []
+        for kind, key in (("ip", ip), ("user", user_id)):
+            if key is None or (group, kind) not in self.limits:
+                continue
+            wait = self._take(group, kind, key)
+            if wait:
+                for charged_kind, charged_key in charged:
+                    self._refund(group, charged_kind, charged_key)
+                return wait
+            charged.append((kind, key))
+        return 0.0
+
+    def limits_users(self, group):
+        return (group, "user") in self.limits
+
+    def stats(self):
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+
+# Counters among the per-budget stats
+RATE_LIMIT_COUNTERS = ("allowed", "limited", "backend_errors")
+
+
+# Build the limiter from the RATE_LIMIT_* environment variables
+def limiter_from_env():
+    if os.environ.get("RATE_LIMIT_ENABLED", "1") in ("0", "false"):
+        return None
+    limits = {}
+    for (group, kind), default in DEFAULT_LIMITS.items():
+        name = f"RATE_LIMIT_{group.upper()}_{kind.upper()}"
+        limit = parse_rate(os.environ.get(name, default))
+        if limit is not None:
+            limits[(group, kind)] = limit
+
+    if os.environ.get("RATE_LIMIT_BACKEND", "local") == "redis":
+        backend = RedisBackend(
+            os.environ.get("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+        )
+    else:
+        backend = LocalBackend(
+            maxsize=int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000"))
+        )
+    return RateLimiter(backend, limits)
+
+
+# Number of proxies in front of the api whose X-Forwarded-For is trusted
+TRUSTED_PROXIES = int(os.environ.get("RATE_LIMIT_TRUSTED_PROXIES", "0"))
+
+
+def client_ip(remote_addr, forwarded_for):
+    """
+    The client address: the X-Forwarded-For entry added by the outermost
+    trusted proxy, or the peer address when no proxy is trusted.
+    """
+    if TRUSTED_PROXIES and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(",")]
+        if len(hops) >= TRUSTED_PROXIES:
+            return hops[-TRUSTED_PROXIES]
+    return remote_addr
+
+
+def too_many_requests(wait):
+    response = jsonify({"error": "Too many requests, retry later"})
+    response.headers["Retry-After"] = str(max(1, math.ceil(wait)))
+    return response, 429
+
+
+def install_rate_limits(app, limiter, user_id):
+    """
+    Charge every rate-limited route of `app` before it runs, answering 429
+    with Retry-After once a budget is spent. `user_id()` returns the
+    authenticated user of the current request, or None.
+    """
+    if limiter is None:
+        return
+
+    def check_rate_limit():
+        group = group_for(request.path)
+        if group is None:
+            return None
+        ip = client_ip(request.remote_addr,
+                       request.headers.get("X-Forwarded-For"))
+        # Only pay for the token check where a per-user budget applies
+        user = user_id() if limiter.limits_users(group) else None
+        wait = limiter.check(group, ip, user)
+        if wait:
+            return too_many_requests(wait)
+        return None
+
+    app.before_request(check_rate_limit)
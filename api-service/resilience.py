@@ -0,0 +1,214 @@
+"""
+Circuit breaker and bulkhead guarding the calls to one upstream service.
+
+The breaker opens after UPSTREAM_BREAKER_FAILURES consecutive failures
+(connection errors, timeouts, 502 and 504 answers) and then rejects calls
+outright for UPSTREAM_BREAKER_RESET seconds. After that it lets
+UPSTREAM_BREAKER_TRIAL_CALLS calls through (half-open): a success closes
+it again, a failure re-opens it. A 503 means the upstream is shedding
+load itself and answered quickly, so it does not count against it.
+
+The bulkhead caps the calls in flight to the upstream at
+UPSTREAM_MAX_CONCURRENCY per process, so a slow upstream can hold at most
+that many workers. Rejected calls raise UpstreamUnavailable, which the
+services answer with 503 and Retry-After instead of queuing.
+"""
+import math
+import os
+import threading
+import time
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+# Numeric state exported as the upstream_circuit_state gauge
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Answers that count as a failed call (timeouts and connection errors are
+# counted by the caller)
+FAILURE_STATUSES = frozenset([502, 504])
+
+
+class UpstreamUnavailable(Exception):
+    """
+    Raised instead of calling an upstream whose circuit is open
+    (`reason` "circuit_open") or whose bulkhead is full ("overloaded");
+    `retry_after` is a hint in seconds.
+    """
+
+    def __init__(self, upstream, reason, retry_after):
+        super().__init__(f"{upstream} service unavailable ({reason})")
+        self.upstream = upstream
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=5, reset_timeout=10.0,
+                 trial_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.trial_calls = trial_calls
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trials = 0
+        self._stats = {"circuit_opened": 0, "rejected_open": 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh()
+            return self._state
+
+    def _refresh(self):
+        if (self._state == OPEN
+                and time.monotonic() - self._opened_at >= self.reset_timeout):
+            self._state = HALF_OPEN
+            self._trials = 0
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._failures = 0
+        self._stats["circuit_opened"] += 1
+
+    def before_call(self):
+        """Admit a call, or raise UpstreamUnavailable if the circuit is
+        open (or half-open with all trial calls taken)."""
+        with self._lock:
+            self._refresh()
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and self._trials < self.trial_calls:
+                self._trials += 1
+                return
+            self._stats["rejected_open"] += 1
+            remaining = self.reset_timeout - (
+                time.monotonic() - self._opened_at
+            )
+        raise UpstreamUnavailable(
+            self.name, "circuit_open", max(1, math.ceil(remaining))
+        )
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self._state == HALF_OPEN:
+                self._state = CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._open()
+            elif self._state == CLOSED:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._open()
+
+    def record_neutral(self):
+        """A call that ended without saying anything about the upstream
+        (e.g. the client's own body was rejected): free its trial slot."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._trials:
+                self._trials -= 1
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            stats = dict(self._stats)
+            stats["circuit"] = self._state
+            stats["circuit_state"] = STATE_CODES[self._state]
+            stats["consecutive_failures"] = self._failures
+        return stats
+
+
+class Bulkhead:
+    """
+    Bounded number of concurrent calls. acquire() waits at most `wait`
+    seconds for a slot (0: never blocks) and returns whether it got one.
+    A limit of 0 disables the bulkhead.
+    """
+
+    def __init__(self, limit, wait=0.0):
+        self.limit = limit
+        self.wait = wait
+        self._slots = threading.BoundedSemaphore(limit) if limit else None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+
+    def acquire(self, wait=None):
+        if self._slots is not None:
+            wait = self.wait if wait is None else wait
+            if wait > 0:
+                acquired = self._slots.acquire(timeout=wait)
+            else:
+                acquired = self._slots.acquire(blocking=False)
+            if not acquired:
+                with self._lock:
+                    self._rejected += 1
+                return False
+        with self._lock:
+            self._in_flight += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "max_concurrency": self.limit,
+                "rejected_full": self._rejected,
+            }
+
+
+def release_once(release):
+    """
+    Wrap a bulkhead's release() for a call whose slot may be freed from
+    several places (response closed, body read, garbage collected):
+    only the first call releases.
+    """
+    lock = threading.Lock()
+    released = []
+
+    def release_slot():
+        with lock:
+            if released:
+                return
+            released.append(True)
+        release()
+
+    return release_slot
+
+
+# Counters among the breaker and bulkhead stats (the rest are gauges)
+RESILIENCE_COUNTERS = ("circuit_opened", "rejected_open", "rejected_full")
+
+
+# Build the breaker for `name` from the UPSTREAM_BREAKER_* variables
+def breaker_from_env(name):
+    return CircuitBreaker(
+        name,
+        failure_threshold=int(
+            os.environ.get("UPSTREAM_BREAKER_FAILURES", "5")
+        ),
+        reset_timeout=float(os.environ.get("UPSTREAM_BREAKER_RESET", "10")),
+        trial_calls=int(os.environ.get("UPSTREAM_BREAKER_TRIAL_CALLS", "1")),
+    )
+
+
+# Build a bulkhead from UPSTREAM_MAX_CONCURRENCY / UPSTREAM_BULKHEAD_WAIT
+def bulkhead_from_env():
+    return Bulkhead(
+        int(os.environ.get("UPSTREAM_MAX_CONCURRENCY", "64")),
+        wait=float(os.environ.get("UPSTREAM_BULKHEAD_WAIT", "0")),
+    )
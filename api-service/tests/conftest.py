@@ -0,0 +1,70 @@
+import importlib
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# The service's modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(HERE))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def gunicorn_upstream():
+    """
+    Base URL of tests/echo_upstream.py served by gunicorn, which (unlike
+    the Flask development server) rejects malformed request framing. The
+    gthread worker keeps connections alive, as the services' own do.
+    """
+    pytest.importorskip("gunicorn")
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "--chdir", HERE,
+         "--bind", f"127.0.0.1:{port}", "--workers", "1",
+         "--worker-class", "gthread", "--threads", "4",
+         "--graceful-timeout", "1",
+         "echo_upstream:app"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.2).close()
+            break
+        except OSError:
+            if server.poll() is not None or time.monotonic() > deadline:
+                server.kill()
+                pytest.fail("gunicorn upstream did not start")
+            time.sleep(0.05)
+    yield f"http://127.0.0.1:{port}"
+    server.terminate()
+    server.wait(5)
+
+
+@pytest.fixture(scope="session")
+def upstream_env(gunicorn_upstream):
+    # Both upstreams are the echo server; settings are read on import
+    os.environ.update({
+        "AUTH_SERVICE_URL": gunicorn_upstream,
+        "CATALOGUE_SERVICE_URL": gunicorn_upstream,
+        "RATE_LIMIT_ENABLED": "0",
+        "UPSTREAM_RETRIES": "0",
+        "JWT_SECRET": "test-secret-" + "x" * 20,
+    })
+
+
+@pytest.fixture(scope="session")
+def api(upstream_env):
+    """api.py, forwarding to the echo server."""
+    pytest.importorskip("jwt")
+    return importlib.import_module("api")
@@ -0,0 +1,56 @@
+"""
+WSGI app answering every request with what it received, as JSON.
+
+/status/<code> answers with that status instead, and /hits/<path> with
+how many requests <path> has received. Like the catalogue's list route,
+it answers If-None-Match: CURRENT_ETAG with a 304, and gzips its answer
+for clients accepting (only) gzip.
+"""
+import collections
+import gzip
+import json
+import threading
+
+hits = collections.Counter()
+hits_lock = threading.Lock()
+
+CURRENT_ETAG = 'W/"current"'
+
+
+def app(environ, start_response):
+    body = environ["wsgi.input"].read()
+    path = environ["PATH_INFO"]
+    if path.startswith("/hits/"):
+        with hits_lock:
+            count = hits[path[len("/hits"):]]
+        return respond(start_response, "200 OK", {"hits": count})
+    with hits_lock:
+        hits[path] += 1
+    if environ.get("HTTP_IF_NONE_MATCH") == CURRENT_ETAG:
+        start_response("304 Not Modified", [("ETag", CURRENT_ETAG)])
+        return []
+    status = "200 OK"
+    if path.startswith("/status/"):
+        status = path[len("/status/"):] + " Status"
+    return respond(start_response, status, {
+        "method": environ["REQUEST_METHOD"],
+        "path": path,
+        "content_length": environ.get("CONTENT_LENGTH") or None,
+        "transfer_encoding": environ.get("HTTP_TRANSFER_ENCODING"),
+        "authorization": environ.get("HTTP_AUTHORIZATION"),
+        "traceparent": environ.get("HTTP_TRACEPARENT"),
+        "if_none_match": environ.get("HTTP_IF_NONE_MATCH"),
+        "accept_encoding": environ.get("HTTP_ACCEPT_ENCODING"),
+        "body": body.decode("utf-8"),
+    }, gzipped=environ.get("HTTP_ACCEPT_ENCODING") == "gzip")
+
+
+def respond(start_response, status, data, gzipped=False):
+    payload = json.dumps(data).encode("utf-8")
+    headers = [("Content-Type", "application/json")]
+    if gzipped:
+        payload = gzip.compress(payload)
+        headers.append(("Content-Encoding", "gzip"))
+    headers.append(("Content-Length", str(len(payload))))
+    start_response(status, headers)
+    return [payload]
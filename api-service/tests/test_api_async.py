@@ -0,0 +1,68 @@
+import asyncio
+import importlib
+import json
+
+import pytest
+
+pytest.importorskip("quart")
+pytest.importorskip("httpx")
+pytest.importorskip("jwt")
+
+
+@pytest.fixture(scope="module")
+def api_async(upstream_env):
+    return importlib.import_module("api_async")
+
+
+def call(api_async, method, path, **kwargs):
+    """Serve one request (with the upstream clients opened) as
+    (status, JSON body)."""
+    async def serve():
+        async with api_async.app.test_app() as test_app:
+            response = await test_app.test_client().open(
+                path, method=method, **kwargs
+            )
+            return response.status_code, await response.get_json()
+
+    return asyncio.run(serve())
+
+
+@pytest.mark.parametrize("method, path, upstream_path", [
+    ("POST", "/api/register", "/auth/register"),
+    ("POST", "/api/login", "/auth/login"),
+    ("POST", "/api/movies", "/auth/movies"),
+])
+def test_body_is_forwarded_to_auth(api_async, method, path, upstream_path):
+    body = json.dumps({"username": "ann", "password": "secret"})
+    # Sent as a client would, with its length (the test client omits it)
+    status, seen = call(
+        api_async, method, path, data=body,
+        headers={"Content-Type": "application/json",
+                 "Content-Length": str(len(body)),
+                 "Authorization": "Bearer token"},
+    )
+
+    assert status == 200
+    if "method" not in seen:
+        seen = next(v for v in seen.values() if isinstance(v, dict))
+    assert seen["method"] == method
+    assert seen["path"] == upstream_path
+    assert seen["content_length"] == str(len(body))
+    assert seen["transfer_encoding"] is None
+    assert seen["body"] == body
+
+
+def test_relayed_call_frees_its_bulkhead_slot(api_async):
+    bulkhead = api_async.bulkheads["auth"]
+    call(api_async, "POST", "/api/login", json={"username": "ann"})
+
+    assert bulkhead.stats()["in_flight"] == 0
+
+
+def test_full_bulkhead_sheds_the_call(api_async, monkeypatch):
+    bulkhead = api_async.bulkheads["auth"]
+    monkeypatch.setattr(bulkhead, "acquire", lambda wait=None: False)
+    status, body = call(api_async, "POST", "/api/login",
+                        json={"username": "ann"})
+
+    assert status == 503
@@ -0,0 +1,46 @@
+import gzip
+import json
+
+import pytest
+
+pytest.importorskip("requests")
+
+from echo_upstream import CURRENT_ETAG  # noqa: E402
+
+
+@pytest.fixture
+def get(api):
+    token = api.token_cache.keyring.sign({"user_id": 7})
+    client = api.app.test_client()
+
+    def get(path, **headers):
+        return client.get(path, headers=dict(headers, Authorization=token))
+    return get
+
+
+def test_validators_reach_the_catalogue(get):
+    seen = get("/api/movies", **{"If-None-Match": 'W/"old"'}).get_json()
+
+    assert seen["if_none_match"] == 'W/"old"'
+    # Relayed bodies are not decoded, so nothing the client can't read
+    # is asked for
+    assert seen["accept_encoding"] == "identity"
+
+
+def test_not_modified_is_relayed(get):
+    response = get("/api/movies", **{"If-None-Match": CURRENT_ETAG})
+
+    assert response.status_code == 304
+    assert response.get_data() == b""
+    assert response.headers["ETag"] == CURRENT_ETAG
+
+
+def test_compressed_bodies_are_relayed_undecoded(get):
+    response = get("/api/movies", **{"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert int(response.headers["Content-Length"]) == \
+        len(response.get_data())
+    seen = json.loads(gzip.decompress(response.get_data()))
+    assert seen["path"] == "/catalogue/movies"
+    assert seen["accept_encoding"] == "gzip"
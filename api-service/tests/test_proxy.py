@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+pytest.importorskip("requests")
+
+
+@pytest.fixture
+def client(api):
+    return api.app.test_client()
+
+
+def echoed(response):
+    # Some routes nest the upstream answer under an envelope key
+    data = response.get_json()
+    if "method" in data:
+        return data
+    return next(value for value in data.values() if isinstance(value, dict))
+
+
+@pytest.mark.parametrize("method, path, upstream_path", [
+    ("POST", "/api/register", "/auth/register"),
+    ("POST", "/api/login", "/auth/login"),
+    ("POST", "/api/movies", "/auth/movies"),
+    ("DELETE", "/api/movies", "/auth/movies"),
+    ("POST", "/api/movies/bulk", "/auth/movies/bulk"),
+    ("POST", "/api/movies/batch", "/auth/movies/batch"),
+])
+def test_body_reaches_gunicorn_with_one_framing_header(
+        client, method, path, upstream_path):
+    body = json.dumps({"username": "ann", "password": "secret"})
+    response = client.open(
+        path, method=method, data=body,
+        headers={"Content-Type": "application/json",
+                 "Authorization": "Bearer token"},
+    )
+
+    assert response.status_code == 200, response.data[:200]
+    seen = echoed(response)
+    assert seen["method"] == method
+    assert seen["path"] == upstream_path
+    assert seen["content_length"] == str(len(body))
+    assert seen["transfer_encoding"] is None
+    assert seen["body"] == body
+
+
+def test_body_larger_than_a_chunk_is_streamed_whole(client):
+    rows = [{"name": f"Movie {i}", "genre": "Drama", "year": 2000}
+            for i in range(5000)]
+    body = json.dumps(rows)
+    assert len(body) > 64 * 1024
+
+    response = client.post(
+        "/api/movies/bulk", data=body,
+        headers={"Content-Type": "application/json",
+                 "Authorization": "Bearer token"},
+    )
+
+    assert response.status_code == 200
+    seen = echoed(response)
+    assert seen["content_length"] == str(len(body))
+    assert seen["body"] == body
@@ -0,0 +1,188 @@
+import os
+import uuid
+
+import pytest
+from flask import Flask
+
+import rate_limit
+from rate_limit import (
+    LocalBackend, Rate, RateLimiter, RedisBackend, parse_rate
+)
+
+
+class FailingBackend:
+    def take(self, key, limit):
+        raise ConnectionError("backend down")
+
+
+def limited_app(limiter):
+    app = Flask(__name__)
+    rate_limit.install_rate_limits(app, limiter, lambda: None)
+
+    @app.route("/api/login", methods=["POST"])
+    def login():
+        return "ok"
+
+    @app.route("/health")
+    def health():
+        return "ok"
+
+    return app.test_client()
+
+
+def test_rates_are_parsed():
+    assert parse_rate("10/60") == Rate(10.0, 10 / 60.0)
+    assert parse_rate("5") == Rate(5.0, 5.0)
+    assert parse_rate("off") is None
+    assert parse_rate("0/60") is None
+    with pytest.raises(ValueError, match="Invalid rate limit"):
+        parse_rate("ten/minute")
+
+
+@pytest.mark.parametrize("path, group", [
+    ("/api/login", "login"),
+    ("/api/register", "register"),
+    ("/api/movies", "movies"),
+    ("/api/movies/search", "movies"),
+    ("/api/moviesX", None),
+    ("/api/validate", None),
+])
+def test_routes_map_to_budget_groups(path, group):
+    assert rate_limit.group_for(path) == group
+
+
+def test_buckets_refill_over_time(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("rate_limit.time.monotonic", lambda: now[0])
+    backend = LocalBackend()
+    limit = Rate(2, 1.0)
+
+    assert backend.take("k", limit) == 0
+    assert backend.take("k", limit) == 0
+    assert backend.take("k", limit) == pytest.approx(1.0)
+    now[0] += 0.5
+    assert backend.take("k", limit) == pytest.approx(0.5)
+    now[0] += 0.5
+    assert backend.take("k", limit) == 0
+
+
+def test_least_recently_used_buckets_are_evicted():
+    backend = LocalBackend(maxsize=2)
+    for key in ("a", "b", "a", "c"):
+        backend.take(key, Rate(1, 0.001))
+
+    assert backend.size() == 2
+    # "b" was evicted and starts over with a full bucket
+    assert backend.take("b", Rate(1, 0.001)) == 0
+    assert backend.take("c", Rate(1, 0.001)) > 0
+
+
+def test_the_stricter_budget_decides():
+    limiter = RateLimiter(LocalBackend(), {
+        ("movies", "ip"): Rate(10, 1.0),
+        ("movies", "user"): Rate(1, 1.0),
+    })
+
+    assert limiter.check("movies", "10.0.0.1", user_id=7) == 0
+    assert limiter.check("movies", "10.0.0.1", user_id=7) > 0
+    assert limiter.check("movies", "10.0.0.1", user_id=8) == 0
+    assert limiter.stats()["movies_user"] == {
+        "allowed": 2, "limited": 1, "backend_errors": 0
+    }
+
+
+def test_a_request_denied_per_user_keeps_its_ip_token():
+    backend = LocalBackend()
+    limiter = RateLimiter(backend, {
+        ("movies", "ip"): Rate(2, 0.001),
+        ("movies", "user"): Rate(1, 0.001),
+    })
+    assert limiter.check("movies", "10.0.0.1", user_id=7) == 0
+    ip_bucket = backend._buckets["movies:ip:10.0.0.1"][0]
+
+    assert limiter.check("movies", "10.0.0.1", user_id=7) > 0
+
+    assert backend._buckets["movies:ip:10.0.0.1"][0] == \
+        pytest.approx(ip_bucket, abs=0.01)
+    # The IP's second token is still there for another user
+    assert limiter.check("movies", "10.0.0.1", user_id=8) == 0
+
+
+def test_a_request_denied_per_ip_is_not_charged_to_the_user():
+    backend = LocalBackend()
+    limiter = RateLimiter(backend, {
+        ("movies", "ip"): Rate(1, 0.001),
+        ("movies", "user"): Rate(5, 0.001),
+    })
+    limiter.check("movies", "10.0.0.1", user_id=7)
+
+    assert limiter.check("movies", "10.0.0.1", user_id=7) > 0
+
+    assert backend._buckets["movies:user:7"][0] == pytest.approx(4,
+                                                                 abs=0.01)
+    assert limiter.stats()["movies_user"]["allowed"] == 1
+
+
+def test_a_failing_backend_lets_requests_through():
+    limiter = RateLimiter(FailingBackend(), {("login", "ip"): Rate(1, 1.0)})
+
+    assert limiter.check("login", "10.0.0.1") == 0
+    assert limiter.stats()["login_ip"]["backend_errors"] == 1
+
+
+def test_forwarded_for_is_only_trusted_behind_proxies(monkeypatch):
+    forwarded = "6.6.6.6, 203.0.113.9, 10.0.0.2"
+    assert rate_limit.client_ip("10.0.0.3", forwarded) == "10.0.0.3"
+
+    monkeypatch.setattr(rate_limit, "TRUSTED_PROXIES", 2)
+    assert rate_limit.client_ip("10.0.0.3", forwarded) == "203.0.113.9"
+    assert rate_limit.client_ip("10.0.0.3", "1.2.3.4") == "10.0.0.3"
+
+
+def test_spent_budgets_answer_429():
+    client = limited_app(
+        RateLimiter(LocalBackend(), {("login", "ip"): Rate(2, 1 / 60.0)})
+    )
+    for _ in range(2):
+        assert client.post("/api/login").status_code == 200
+
+    response = client.post("/api/login")
+
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["Retry-After"]) <= 60
+    assert client.get("/health").status_code == 200
+    assert client.post("/api/login", environ_base={
+        "REMOTE_ADDR": "10.0.0.9"
+    }).status_code == 200
+
+
+def test_limits_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_ENABLED", "1")
+    monkeypatch.setenv("RATE_LIMIT_LOGIN_IP", "3/1")
+    monkeypatch.setenv("RATE_LIMIT_MOVIES_USER", "off")
+
+    limits = rate_limit.limiter_from_env().limits
+
+    assert limits[("login", "ip")] == Rate(3.0, 3.0)
+    assert ("movies", "user") not in limits
+    monkeypatch.setenv("RATE_LIMIT_ENABLED", "0")
+    assert rate_limit.limiter_from_env() is None
+
+
+def test_redis_buckets_are_shared():
+    redis = pytest.importorskip("redis")
+    url = os.environ.get("RATE_LIMIT_REDIS_URL", "redis://localhost:6379/0")
+    prefix = f"ratelimit-test-{uuid.uuid4().hex}:"
+    first, second = (RedisBackend(url, prefix=prefix) for _ in range(2))
+    try:
+        first.client.ping()
+    except redis.exceptions.ConnectionError:
+        pytest.skip(f"No Redis server at {url}")
+    try:
+        assert first.take("k", Rate(1, 0.01)) == 0
+        assert second.take("k", Rate(1, 0.01)) > 0
+        first.refund("k", Rate(1, 0.01))
+        assert second.take("k", Rate(1, 0.01)) == 0
+    finally:
+        for name in first.client.scan_iter(prefix + "*"):
+            first.client.delete(name)
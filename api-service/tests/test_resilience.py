@@ -0,0 +1,153 @@
+import threading
+
+import pytest
+
+import resilience
+from resilience import Bulkhead, CircuitBreaker, UpstreamUnavailable
+
+
+class Clock:
+    """Stands in for the time module; advanced by hand."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience, "time", clock)
+    return clock
+
+
+def open_breaker(clock, trial_calls=1):
+    breaker = CircuitBreaker("catalogue", failure_threshold=3,
+                             reset_timeout=10, trial_calls=trial_calls)
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    return breaker
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("catalogue", failure_threshold=3)
+    for _ in range(2):
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == resilience.CLOSED
+
+    breaker.record_failure()
+
+    assert breaker.state == resilience.OPEN
+    assert breaker.stats()["circuit_opened"] == 1
+
+
+def test_open_breaker_rejects_until_the_reset(clock):
+    breaker = open_breaker(clock)
+    clock.now += 2.5
+
+    with pytest.raises(UpstreamUnavailable) as raised:
+        breaker.before_call()
+
+    assert raised.value.reason == "circuit_open"
+    assert raised.value.retry_after == 8
+    assert breaker.stats()["rejected_open"] == 1
+
+
+def test_half_open_breaker_admits_trial_calls(clock):
+    breaker = open_breaker(clock, trial_calls=2)
+    clock.now += 10
+
+    breaker.before_call()
+    breaker.before_call()
+    with pytest.raises(UpstreamUnavailable):
+        breaker.before_call()
+    assert breaker.state == resilience.HALF_OPEN
+
+    breaker.record_success()
+    assert breaker.state == resilience.CLOSED
+
+
+def test_failed_trial_reopens_the_breaker(clock):
+    breaker = open_breaker(clock)
+    clock.now += 10
+    breaker.before_call()
+
+    breaker.record_failure()
+
+    assert breaker.state == resilience.OPEN
+    assert breaker.stats()["circuit_opened"] == 2
+
+
+def test_neutral_trial_frees_its_place(clock):
+    breaker = open_breaker(clock)
+    clock.now += 10
+    breaker.before_call()
+
+    breaker.record_neutral()
+
+    breaker.before_call()
+    assert breaker.state == resilience.HALF_OPEN
+
+
+def test_bulkhead_rejects_beyond_its_limit():
+    bulkhead = Bulkhead(2)
+
+    assert bulkhead.acquire()
+    assert bulkhead.acquire()
+    assert not bulkhead.acquire()
+    bulkhead.release()
+    assert bulkhead.acquire()
+    assert bulkhead.stats() == {
+        "in_flight": 2, "max_concurrency": 2, "rejected_full": 1
+    }
+
+
+def test_bulkhead_waits_for_a_slot():
+    bulkhead = Bulkhead(1, wait=5)
+    bulkhead.acquire()
+    threading.Timer(0.05, bulkhead.release).start()
+
+    assert bulkhead.acquire()
+    assert not bulkhead.acquire(wait=0.01)
+
+
+def test_bulkhead_of_zero_is_unbounded():
+    bulkhead = Bulkhead(0)
+
+    assert all(bulkhead.acquire() for _ in range(100))
+    assert bulkhead.stats()["in_flight"] == 100
+
+
+def test_slot_is_released_once():
+    bulkhead = Bulkhead(1)
+    bulkhead.acquire()
+    release = resilience.release_once(bulkhead.release)
+
+    release()
+    release()
+
+    assert bulkhead.stats()["in_flight"] == 0
+    assert bulkhead.acquire()
+    assert not bulkhead.acquire()
+
+
+def test_open_circuit_answers_503(api, monkeypatch):
+    breaker = CircuitBreaker("catalogue", failure_threshold=1,
+                             reset_timeout=30)
+    breaker.record_failure()
+    monkeypatch.setattr(api.catalogue_client, "breaker", breaker)
+    token = api.token_cache.keyring.sign({"user_id": 7})
+
+    response = api.app.test_client().get(
+        "/api/movies", headers={"Authorization": token}
+    )
+
+    assert response.status_code == 503
+    assert response.get_json()["reason"] == "circuit_open"
+    assert int(response.headers["Retry-After"]) >= 29
@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+# Modules copied into every service that uses them (README: "Shared
+# modules"), since each image is built from its own service directory
+SHARED_MODULES = {
+    "fastjson.py": ("api", "auth", "catalogue"),
+    "instrumentation.py": ("api", "auth", "catalogue"),
+    "log_config.py": ("api", "auth", "catalogue"),
+    "serving.py": ("api", "auth", "catalogue"),
+    "tracing.py": ("api", "auth", "catalogue"),
+    "proxy.py": ("api", "auth"),
+    "resilience.py": ("api", "auth"),
+    "tokens.py": ("api", "auth"),
+    "upstream.py": ("api", "auth"),
+    "db_pool.py": ("auth", "catalogue"),
+    "migrations.py": ("auth", "catalogue"),
+}
+
+
+@pytest.mark.parametrize("module", sorted(SHARED_MODULES))
+def test_copies_are_identical(module):
+    paths = [os.path.join(ROOT, f"{service}-service", module)
+             for service in SHARED_MODULES[module]]
+    if not all(os.path.exists(path) for path in paths):
+        pytest.skip("not run from a checkout with all the services")
+    contents = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            contents[os.path.relpath(path, ROOT)] = f.read()
+
+    assert len(set(contents.values())) == 1, (
+        f"{module} differs between "
+        + ", ".join(sorted(contents)) + "; copy one over the others"
+    )
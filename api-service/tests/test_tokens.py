@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+jwt = pytest.importorskip("jwt")
+
+from tokens import (  # noqa: E402
+    KeyRing, VerifiedTokenCache, keyring_from_env, parse_keys
+)
+
+# HS256 secrets of the recommended 32 bytes
+S1, S2, S3 = ("1" * 32, "2" * 32, "3" * 32)
+
+
+def test_parse_keys():
+    assert list(parse_keys(f"new:{S2}, old:{S1},").items()) == \
+        [("new", S2), ("old", S1)]
+    with pytest.raises(ValueError):
+        parse_keys("new")
+    with pytest.raises(ValueError):
+        KeyRing(parse_keys(f"old:{S1}"), "new")
+
+
+def test_tokens_of_a_rotated_out_key_stay_valid_until_dropped():
+    old = KeyRing(parse_keys(f"old:{S1}"), "old")
+    token = old.sign({"user_id": 1})
+    rotated = KeyRing(parse_keys(f"new:{S2},old:{S1}"), "new")
+
+    assert rotated.verify(token) == {"user_id": 1}
+    assert jwt.get_unverified_header(rotated.sign({}))["kid"] == "new"
+    with pytest.raises(jwt.InvalidTokenError):
+        KeyRing(parse_keys(f"new:{S2}"), "new").verify(token)
+
+
+def test_legacy_tokens_use_the_default_key(monkeypatch):
+    monkeypatch.delenv("JWT_KEYS", raising=False)
+    monkeypatch.setenv("JWT_SECRET", S3)
+    token = jwt.encode({"user_id": 1}, S3, algorithm="HS256")
+
+    assert keyring_from_env().verify(token) == {"user_id": 1}
+
+
+def test_cache_serves_verified_claims_until_exp(monkeypatch):
+    keyring = KeyRing(parse_keys(f"k:{S1}"), "k")
+    cache = VerifiedTokenCache(keyring, maxsize=1)
+    exp = int(time.time()) + 60
+    token = keyring.sign({"user_id": 1, "exp": exp})
+
+    assert cache.verify(token)["user_id"] == 1
+    assert cache.verify(token)["user_id"] == 1
+    assert cache.stats()["hits"] == 1
+
+    # Past exp the entry is dropped and the token verified again
+    monkeypatch.setattr("tokens.time.time", lambda: exp + 1)
+    cache.verify(token)
+    assert cache.stats()["misses"] == 2
+
+
+def test_cache_never_stores_rejections():
+    keyring = KeyRing(parse_keys(f"k:{S1}"), "k")
+    cache = VerifiedTokenCache(keyring)
+    bad = KeyRing(parse_keys(f"k:{S2}"), "k").sign({"user_id": 1})
+
+    for _ in range(2):
+        with pytest.raises(jwt.InvalidTokenError):
+            cache.verify(bad)
+    assert cache.stats()["size"] == 0
+
+
+def test_reads_skip_the_auth_hop(api):
+    token = api.token_cache.keyring.sign({"user_id": 7})
+    response = api.app.test_client().get(
+        "/api/movies?limit=5", headers={"Authorization": token}
+    )
+
+    seen = response.get_json()
+    assert seen["path"] == "/catalogue/movies"
+    assert '"user_id": 7' in seen["body"]
+
+
+def test_invalid_token_is_rejected_locally(api):
+    token = KeyRing(parse_keys(f"default:{S3}"), "default").sign({})
+    response = api.app.test_client().get(
+        "/api/movies", headers={"Authorization": token}
+    )
+
+    assert response.status_code == 401
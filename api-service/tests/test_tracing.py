@@ -0,0 +1,108 @@
+import json
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+
+import tracing  # noqa: E402
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+TRACEPARENT = f"00-{TRACE_ID}-{PARENT_ID}-01"
+
+
+@pytest.fixture
+def client(api):
+    return api.app.test_client()
+
+
+def test_traceparent_is_parsed():
+    assert tracing.parse_traceparent(TRACEPARENT) == (
+        TRACE_ID, PARENT_ID, True
+    )
+    assert tracing.parse_traceparent(
+        f"00-{TRACE_ID}-{PARENT_ID}-00"
+    )[2] is False
+
+
+@pytest.mark.parametrize("value", [
+    None, "", "garbage", f"00-{TRACE_ID}-{PARENT_ID}",
+    f"00-{'0' * 32}-{PARENT_ID}-01", f"00-{TRACE_ID}-{'0' * 16}-01",
+    f"00-{'x' * 32}-{PARENT_ID}-01",
+])
+def test_invalid_traceparents_are_ignored(value):
+    assert tracing.parse_traceparent(value) is None
+
+
+def test_child_spans_join_the_current_trace():
+    tracer = tracing.Tracer("test")
+    root = tracer.start_span("root")
+    token = tracer.activate(root)
+    try:
+        with tracer.span("child") as child:
+            headers = tracer.inject({})
+    finally:
+        tracer.deactivate(token)
+
+    assert child.trace_id == root.trace_id
+    assert child.parent_id == root.span_id
+    assert headers["traceparent"] == child.traceparent()
+    assert tracer.current_span() is None
+
+
+def test_child_span_records_only_inside_a_sampled_trace():
+    tracer = tracing.Tracer("test")
+
+    with tracer.child_span("migrate") as span:
+        assert span is None
+
+
+def test_sampled_spans_are_exported_in_the_background(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    tracer = tracing.Tracer("test", tracing.FileExporter(str(path)),
+                            flush_interval=0.01)
+    unsampled = tracer.start_span("skipped", parent=(TRACE_ID, None, False))
+    tracer.end_span(unsampled)
+    with tracer.span("work"):
+        pass
+
+    deadline = time.monotonic() + 5
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [span["name"] for span in spans] == ["work"]
+    assert spans[0]["service"] == "test"
+
+
+def test_the_trace_continues_upstream(client):
+    response = client.post("/api/login", json={}, headers={
+        "traceparent": TRACEPARENT
+    })
+
+    seen = tracing.parse_traceparent(response.get_json()["traceparent"])
+    assert seen[0] == TRACE_ID
+    # The upstream's parent is the api's client span, not the caller's
+    assert seen[1] != PARENT_ID
+    assert response.headers["X-Request-ID"] == TRACE_ID
+
+
+def test_the_edge_adopts_a_request_id_as_trace_id(client):
+    request_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+    response = client.post("/api/login", json={}, headers={
+        "X-Request-ID": request_id
+    })
+
+    trace_id = request_id.replace("-", "")
+    assert response.headers["X-Request-ID"] == trace_id
+    seen = tracing.parse_traceparent(response.get_json()["traceparent"])
+    assert seen[0] == trace_id
+
+
+def test_each_request_without_context_starts_a_trace(client):
+    first = client.post("/api/login", json={})
+    second = client.post("/api/login", json={})
+
+    assert first.headers["X-Request-ID"] != second.headers["X-Request-ID"]
+    assert tracing.parse_traceparent(first.headers["traceparent"])
@@ -0,0 +1,77 @@
+import pytest
+
+pytest.importorskip("requests")
+
+from resilience import Bulkhead, UpstreamUnavailable  # noqa: E402
+from upstream import UpstreamClient  # noqa: E402
+
+
+@pytest.fixture
+def client(gunicorn_upstream):
+    client = UpstreamClient("echo", gunicorn_upstream, retries=0)
+    client.bulkhead = Bulkhead(1)
+    return client
+
+
+def hits(client, path):
+    return client.session.get(f"{client.base_url}/hits{path}").json()["hits"]
+
+
+def in_flight(client):
+    return client.bulkhead.stats()["in_flight"]
+
+
+def test_buffered_call_frees_its_slot_on_return(client):
+    response = client.get("/movies")
+
+    assert response.status_code == 200
+    assert in_flight(client) == 0
+
+
+def test_streamed_call_holds_its_slot_until_closed(client):
+    response = client.get("/export", stream=True)
+
+    assert in_flight(client) == 1
+    with pytest.raises(UpstreamUnavailable) as rejected:
+        client.get("/movies")
+    assert rejected.value.reason == "overloaded"
+
+    response.close()
+    assert in_flight(client) == 0
+    response.close()
+    assert in_flight(client) == 0
+
+
+def test_streamed_call_frees_its_slot_once_read(client):
+    response = client.get("/export", stream=True)
+    body = b"".join(response.iter_content(16))
+
+    assert b"/export" in body
+    assert in_flight(client) == 0
+
+
+def test_failed_call_frees_its_slot(client):
+    client.base_url = "http://127.0.0.1:9"
+
+    with pytest.raises(Exception):
+        client.get("/movies", stream=True)
+    assert in_flight(client) == 0
+
+
+def test_connections_are_kept_alive(client):
+    for _ in range(3):
+        client.get("/movies")
+
+    stats = client.stats()
+    assert stats["connections_new"] == 1
+    assert stats["connections_reused"] == 2
+
+
+def test_only_idempotent_calls_are_retried(gunicorn_upstream):
+    client = UpstreamClient("echo", gunicorn_upstream, retries=2,
+                            backoff_factor=0)
+    assert client.get("/status/503").status_code == 503
+    assert hits(client, "/status/503") == 3
+
+    assert client.post("/status/502").status_code == 502
+    assert hits(client, "/status/502") == 1
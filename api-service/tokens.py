@@ -0,0 +1,124 @@
+import collections
+import hashlib
+import os
+import threading
+import time
+
+import jwt
+
+JWT_ALGORITHM = "HS256"
+
+# Kid used for tokens issued before key rotation existed (no `kid` header)
+LEGACY_KID = "default"
+
+
+# Parse "kid1:secret1,kid2:secret2" into an ordered {kid: secret} mapping
+def parse_keys(spec):
+    keys = collections.OrderedDict()
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        kid, sep, secret = item.partition(":")
+        if not sep or not kid or not secret:
+            raise ValueError(f"Invalid JWT key entry: {kid or item!r}")
+        keys[kid] = secret
+    return keys
+
+
+class KeyRing:
+    """
+    HS256 signing keys indexed by `kid`.
+
+    New tokens are signed with the active key and carry its kid in the
+    header; tokens are verified against whichever key their kid names, so
+    a key can be rotated out by first adding the new one, switching the
+    active kid, and dropping the old one once its tokens have expired.
+    """
+
+    def __init__(self, keys, active_kid):
+        if active_kid not in keys:
+            raise ValueError(f"Active JWT kid {active_kid!r} has no key")
+        self.keys = keys
+        self.active_kid = active_kid
+
+    def sign(self, payload):
+        return jwt.encode(
+            payload,
+            self.keys[self.active_kid],
+            algorithm=JWT_ALGORITHM,
+            headers={"kid": self.active_kid},
+        )
+
+    def verify(self, token):
+        """
+        Return the token's claims, raising jwt.ExpiredSignatureError or
+        jwt.InvalidTokenError like jwt.decode() does.
+        """
+        kid = jwt.get_unverified_header(token).get("kid", LEGACY_KID)
+        secret = self.keys.get(kid)
+        if secret is None:
+            raise jwt.InvalidTokenError(f"Unknown key id {kid!r}")
+        return jwt.decode(token, secret, algorithms=[JWT_ALGORITHM])
+
+
+class VerifiedTokenCache:
+    """
+    LRU cache of verified token claims keyed by the token's SHA-256.
+
+    Entries expire at the token's own `exp`, so a cached token is never
+    accepted past the point jwt.decode() would have rejected it.
+    """
+
+    def __init__(self, keyring, maxsize=10000):
+        self.keyring = keyring
+        self.maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def verify(self, token):
+        key = hashlib.sha256(token.encode("utf-8")).digest()
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                claims, expires_at = entry
+                if expires_at is None or now < expires_at:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return claims
+                del self._entries[key]
+            self._stats["misses"] += 1
+
+        # Verify outside the lock; errors propagate and are never cached
+        claims = self.keyring.verify(token)
+        expires_at = claims.get("exp")
+
+        with self._lock:
+            self._entries[key] = (claims, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+        return claims
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, size=len(self._entries),
+                        max_size=self.maxsize)
+
+
+# Build the key ring from JWT_KEYS / JWT_ACTIVE_KID, falling back to the
+# single legacy JWT_SECRET
+def keyring_from_env():
+    spec = os.environ.get("JWT_KEYS")
+    if spec:
+        keys = parse_keys(spec)
+        active_kid = os.environ.get("JWT_ACTIVE_KID", next(iter(keys)))
+    else:
+        secret = os.environ.get("JWT_SECRET", "my_secret_key")
+        keys = collections.OrderedDict([(LEGACY_KID, secret)])
+        active_kid = LEGACY_KID
+    return KeyRing(keys, active_kid)
+
@@ -0,0 +1,373 @@
+"""
+Minimal W3C trace-context tracing shared by the three services.
+
+The api edge starts a trace for every request (or continues the caller's
+`traceparent`), each hop records a server span, and upstream calls and DB
+statements record child spans. The trace context travels in the
+`traceparent` header; responses carry the trace id as X-Request-ID.
+Finished spans are batched on a background thread and written to a
+JSON-lines file or POSTed to an OTLP/HTTP (JSON) collector.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import threading
+import time
+import urllib.request
+
+TRACEPARENT_HEADER = "traceparent"
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# The span active in the current thread/task
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind",
+                 "sampled", "attributes", "start_ns", "end_ns", "error")
+
+    def __init__(self, name, trace_id, parent_id, sampled, kind="internal",
+                 attributes=None):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.sampled = sampled
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def traceparent(self):
+        flags = "01" if self.sampled else "00"
+        return f"00-{self.trace_id}-{self.span_id}-{flags}"
+
+    def to_dict(self, service):
+        return {
+            "service": service,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def parse_traceparent(value):
+    """Return (trace_id, parent_span_id, sampled) or None if invalid."""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16)
+        int(parts[2], 16)
+        flags = int(parts[3][:2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+class FileExporter:
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, service, spans):
+        with open(self.path, "a") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(service)) + "\n")
+
+
+class OtlpHttpExporter:
+    """POST spans to an OTLP/HTTP collector using the JSON encoding."""
+
+    KINDS = {"internal": 1, "server": 2, "client": 3}
+
+    def __init__(self, endpoint, timeout=2.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def _attributes(self, attributes):
+        return [
+            {"key": key, "value": {"stringValue": str(value)}}
+            for key, value in attributes.items()
+        ]
+
+    def export(self, service, spans):
+        body = {
+            "resourceSpans": [{
+                "resource": {
+                    "attributes": self._attributes({"service.name": service})
+                },
+                "scopeSpans": [{
+                    "scope": {"name": "movie-catalogue"},
+                    "spans": [
+                        {
+                            "traceId": span.trace_id,
+                            "spanId": span.span_id,
+                            "parentSpanId": span.parent_id or "",
+                            "name": span.name,
+                            "kind": self.KINDS.get(span.kind, 1),
+                            "startTimeUnixNano": str(span.start_ns),
+                            "endTimeUnixNano": str(span.end_ns),
+                            "attributes": self._attributes(span.attributes),
+                            "status": {"code": 2 if span.error else 1,
+                                       "message": span.error or ""},
+                        }
+                        for span in spans
+                    ],
+                }],
+            }]
+        }
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        urllib.request.urlopen(request, timeout=self.timeout).close()
+
+
+class Tracer:
+    """
+    Creates spans and hands finished, sampled ones to a background export
+    thread so request threads never wait on the exporter.
+    """
+
+    def __init__(self, service, exporter=None, sample_ratio=1.0,
+                 batch_size=256, flush_interval=1.0, max_queue=10000):
+        self.service = service
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(max_queue)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def current_span(self):
+        return _current_span.get()
+
+    def start_span(self, name, kind="internal", parent=None,
+                   attributes=None):
+        """
+        Start a span as a child of `parent` (a parse_traceparent() tuple),
+        else of the current span, else as the root of a new trace.
+        """
+        if parent is None:
+            current = _current_span.get()
+            if current is not None:
+                parent = (current.trace_id, current.span_id, current.sampled)
+        if parent is None:
+            trace_id = secrets.token_hex(16)
+            parent_id = None
+            sampled = random.random() < self.sample_ratio
+        else:
+            trace_id, parent_id, sampled = parent
+        return Span(name, trace_id, parent_id, sampled, kind, attributes)
+
+    def activate(self, span):
+        return _current_span.set(span)
+
+    def deactivate(self, token):
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Token from another context (e.g. a streamed response finished
+            # elsewhere): just clear the current span
+            _current_span.set(None)
+
+    def end_span(self, span, error=None):
+        span.end_ns = time.time_ns()
+        if error is not None:
+            span.error = str(error)
+        if span.sampled and self.exporter is not None:
+            self._ensure_thread()
+            try:
+                self._queue.put_nowait(span)
+            except queue.Full:
+                self.dropped += 1
+
+    @contextlib.contextmanager
+    def span(self, name, kind="internal", attributes=None):
+        """Record a child span of the current span around a block."""
+        span = self.start_span(name, kind, attributes=attributes)
+        token = self.activate(span)
+        try:
+            yield span
+        except Exception as e:
+            self.end_span(span, error=e)
+            raise
+        else:
+            self.end_span(span)
+        finally:
+            self.deactivate(token)
+
+    def child_span(self, name, kind="internal", attributes=None):
+        """
+        Like span(), but only records inside a sampled trace, so work done
+        outside a request (start-up migrations) does not start traces.
+        """
+        current = _current_span.get()
+        if current is None or not current.sampled:
+            return contextlib.nullcontext()
+        return self.span(name, kind, attributes)
+
+    def inject(self, headers):
+        """Add the current span's traceparent to outgoing headers."""
+        span = _current_span.get()
+        if span is not None:
+            headers[TRACEPARENT_HEADER] = span.traceparent()
+        return headers
+
+    def _ensure_thread(self):
+        # (Re)start the export thread lazily, including after a fork
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._export_loop, name="trace-exporter",
+                    daemon=True
+                )
+                self._thread.start()
+
+    def _export_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.exporter.export(self.service, batch)
+            except Exception as e:
+                logging.warning("Dropping %d spans: %s", len(batch), e)
+
+
+# Build a tracer from the TRACE_* environment variables
+def tracer_from_env(service):
+    exporter_name = os.environ.get("TRACE_EXPORTER", "none")
+    if exporter_name == "file":
+        exporter = FileExporter(
+            os.environ.get("TRACE_FILE", f"/tmp/traces-{service}.jsonl")
+        )
+    elif exporter_name == "otlp":
+        exporter = OtlpHttpExporter(os.environ.get(
+            "TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"
+        ))
+    else:
+        exporter = None
+    return Tracer(
+        service,
+        exporter,
+        sample_ratio=float(os.environ.get("TRACE_SAMPLE_RATIO", "1.0")),
+    )
+
+
+# Process-wide tracer, configured by trace_app()
+tracer = Tracer("unknown")
+
+
+def configure(service):
+    """Point the process-wide tracer at the TRACE_* settings."""
+    configured = tracer_from_env(service)
+    tracer.service = configured.service
+    tracer.exporter = configured.exporter
+    tracer.sample_ratio = configured.sample_ratio
+
+
+def start_server_span(method, path, headers, edge=False):
+    """
+    Start and activate the server span of an incoming request, continuing
+    the caller's traceparent. At the `edge`, an X-Request-ID without a
+    traceparent is accepted as the trace id. Returns (span, token).
+    """
+    parent = parse_traceparent(headers.get(TRACEPARENT_HEADER))
+    if parent is None and edge:
+        parent = _parent_from_request_id(headers.get(REQUEST_ID_HEADER))
+    span = tracer.start_span(
+        f"{method} {path}", kind="server", parent=parent,
+        attributes={"http.method": method, "http.target": path}
+    )
+    return span, tracer.activate(span)
+
+
+def tag_response(span, method, route, response):
+    # Name the span after the matched route (not the raw path, which would
+    # explode span cardinality) and hand the ids back to the caller
+    if route is not None:
+        span.name = f"{method} {route}"
+    span.attributes["http.status_code"] = response.status_code
+    response.headers[REQUEST_ID_HEADER] = span.trace_id
+    response.headers[TRACEPARENT_HEADER] = span.traceparent()
+
+
+def trace_app(app, service, edge=False):
+    """
+    Record a server span per request of a Flask app.
+    """
+    from flask import g, request
+
+    configure(service)
+
+    def start():
+        g.trace_span, g.trace_token = start_server_span(
+            request.method, request.path, request.headers, edge
+        )
+
+    def add_headers(response):
+        span = g.get("trace_span")
+        if span is not None:
+            route = request.url_rule.rule if request.url_rule else None
+            tag_response(span, request.method, route, response)
+        return response
+
+    def finish(error):
+        span = g.pop("trace_span", None)
+        token = g.pop("trace_token", None)
+        if span is not None:
+            tracer.end_span(span, error=error)
+        if token is not None:
+            tracer.deactivate(token)
+
+    app.before_request(start)
+    app.after_request(add_headers)
+    app.teardown_request(finish)
+
+
+def _parent_from_request_id(request_id):
+    # A 32-hex-digit request id (e.g. a UUID) becomes the trace id, so
+    # client-side logs and traces line up
+    if not request_id:
+        return None
+    candidate = request_id.replace("-", "").lower()
+    if len(candidate) != 32:
+        return None
+    try:
+        int(candidate, 16)
+    except ValueError:
+        return None
+    return candidate, None, random.random() < tracer.sample_ratio
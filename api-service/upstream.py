@@ -0,0 +1,215 @@
+import os
+import threading
+import time
+import weakref
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+from instrumentation import UPSTREAM_LATENCY
+from resilience import (
+    FAILURE_STATUSES, UpstreamUnavailable, breaker_from_env,
+    bulkhead_from_env, release_once
+)
+from tracing import tracer
+
+# Only methods that are safe to replay are retried after the request was
+# sent. DELETE is left out on purpose: replaying a delete whose response
+# was lost would turn a success into a 404.
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS"])
+RETRY_STATUSES = (502, 503, 504)
+
+
+class _Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {
+            "requests": 0,
+            "connections_checked_out": 0,
+            "connections_new": 0,
+            "errors": 0,
+        }
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._values[name] += amount
+
+    def snapshot(self):
+        with self._lock:
+            values = dict(self._values)
+        values["connections_reused"] = (
+            values["connections_checked_out"] - values["connections_new"]
+        )
+        return values
+
+
+def _hold_until_body_done(response, release_slot):
+    # urllib3 releases the connection once the body has been read to the
+    # end, and requests does when the response is closed; the slot goes
+    # with it. A response dropped unread frees it when collected.
+    raw = response.raw
+    release_conn = raw.release_conn
+
+    def release_conn_and_slot():
+        try:
+            release_conn()
+        finally:
+            release_slot()
+
+    raw.release_conn = release_conn_and_slot
+    weakref.finalize(response, release_slot)
+
+
+def _counting_pool(base, counters):
+    # urllib3 hands out an idle keep-alive connection from _get_conn() and
+    # only calls _new_conn() when none is available, which lets us tell
+    # reused connections apart from freshly opened ones.
+    class CountingConnectionPool(base):
+        def _get_conn(self, timeout=None):
+            counters.increment("connections_checked_out")
+            return super()._get_conn(timeout=timeout)
+
+        def _new_conn(self):
+            counters.increment("connections_new")
+            return super()._new_conn()
+
+    return CountingConnectionPool
+
+
+class UpstreamClient:
+    """
+    Keep-alive HTTP client for a single upstream service.
+
+    Wraps a requests.Session whose adapter keeps up to `pool_size`
+    connections open to the upstream, applies (connect, read) timeouts to
+    every call and retries idempotent requests with exponential backoff.
+    Calls go through a circuit breaker and a bulkhead, and raise
+    UpstreamUnavailable when either rejects them. A call opened with
+    `stream=True` holds its bulkhead slot until the body has been read or
+    the response closed.
+    """
+
+    def __init__(self, name, base_url, pool_size=10, connect_timeout=2.0,
+                 read_timeout=10.0, retries=2, backoff_factor=0.2):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self._counters = _Counters()
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=retry,
+            pool_block=False,
+        )
+        adapter.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool, self._counters),
+            "https": _counting_pool(HTTPSConnectionPool, self._counters),
+        }
+
+        # Circuit breaker and bulkhead (UPSTREAM_BREAKER_*,
+        # UPSTREAM_MAX_CONCURRENCY); see resilience.py
+        self.breaker = breaker_from_env(name)
+        self.bulkhead = bulkhead_from_env()
+
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        # Shed the call right away rather than queue behind a slow upstream
+        if not self.bulkhead.acquire():
+            raise UpstreamUnavailable(self.name, "overloaded", 1)
+        release_slot = release_once(self.bulkhead.release)
+        try:
+            self.breaker.before_call()
+            response = self._send(method, path, **kwargs)
+        except BaseException:
+            release_slot()
+            raise
+        if kwargs.get("stream"):
+            # The body is still to come from the upstream
+            _hold_until_body_done(response, release_slot)
+        else:
+            release_slot()
+        return response
+
+    def _send(self, method, path, **kwargs):
+        self._counters.increment("requests")
+        started = time.perf_counter()
+        status = "error"
+        with tracer.span(
+            f"{self.name} {method} {path}", kind="client",
+            attributes={"peer.service": self.name, "http.method": method}
+        ) as span:
+            # Propagate the trace to the upstream via this client span
+            headers = dict(kwargs.get("headers") or {})
+            kwargs["headers"] = tracer.inject(headers)
+            try:
+                response = self.session.request(
+                    method, f"{self.base_url}{path}", **kwargs
+                )
+                status = response.status_code
+                span.attributes["http.status_code"] = status
+            except requests.exceptions.RequestException:
+                self._counters.increment("errors")
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                # e.g. the client's own body was too large: says nothing
+                # about the upstream
+                self.breaker.record_neutral()
+                raise
+            finally:
+                UPSTREAM_LATENCY.labels(self.name, method, status).observe(
+                    time.perf_counter() - started
+                )
+            if status in FAILURE_STATUSES:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            return response
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def stats(self):
+        stats = self._counters.snapshot()
+        stats.update(self.breaker.stats())
+        stats.update(self.bulkhead.stats())
+        stats["base_url"] = self.base_url
+        return stats
+
+
+# Build an upstream client from the UPSTREAM_* environment variables
+def client_from_env(name, base_url):
+    return UpstreamClient(
+        name,
+        base_url,
+        pool_size=int(os.environ.get("UPSTREAM_POOL_SIZE", "10")),
+        connect_timeout=float(
+            os.environ.get("UPSTREAM_CONNECT_TIMEOUT", "2")
+        ),
+        read_timeout=float(os.environ.get("UPSTREAM_READ_TIMEOUT", "10")),
+        retries=int(os.environ.get("UPSTREAM_RETRIES", "2")),
+        backoff_factor=float(os.environ.get("UPSTREAM_BACKOFF", "0.2")),
+    )
@@ -1,18 +1,39 @@
 from flask import Flask, jsonify, request
-import requests
+from werkzeug.exceptions import RequestEntityTooLarge
 import psycopg2
 import jwt
 import datetime
 from psycopg2 import OperationalError
+from db_pool import DB_POOL_COUNTERS, pool_from_env
+from migrations import run_migrations
+import schema
+from serving import serve, server_processes, serving_mode
+from instrumentation import instrument_app, register_stats
+from log_config import configure_logging
+from tracing import trace_app
+from fastjson import install_json_provider
+from proxy import (
+    body_headers, conditional_headers, install_load_shedding,
+    install_proxy_limits, request_body, stream_response
+)
+from upstream import client_from_env
+from resilience import RESILIENCE_COUNTERS, UpstreamUnavailable
+from tokens import keyring_from_env
+from hashing import HashQueueFull, pool_from_env as hashing_pool_from_env
 import os
-import bcrypt
 import base64
 import logging
+import time
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+# Set up logging (LOG_LEVEL, LOG_FORMAT, LOG_DEBUG_SAMPLE_RATE)
+configure_logging("auth")
 
 app = Flask(__name__)
+install_json_provider(app)
+install_proxy_limits(app)
+install_load_shedding(app)
+instrument_app(app, "auth")
+trace_app(app, "auth")
 
 # Catalogue Service URL
 CATALOGUE_SERVICE_URL = os.environ.get(
@@ -20,67 +41,119 @@ CATALOGUE_SERVICE_URL = os.environ.get(
     "http://catalogue:8091"
     )
 
+# Keep-alive client reused by every route forwarding to the catalogue
+catalogue_client = client_from_env("catalogue", CATALOGUE_SERVICE_URL)
+
 # Database configuration (read from environment variables)
 DB_HOST = os.environ.get("PGHOST", "postgres")
 DB_USER = os.environ.get("PGUSER", "admin")
 DB_PASSWORD = os.environ.get("PGPASSWORD", "admin")
 DB_NAME = os.environ.get("PGDATABASE", "movieApp")
-JWT_SECRET = "my_secret_key"  # ideally envv in prod
 
-# Function to establish a database connection
+# Server processes (WEB_WORKERS), between which the database connections
+# and bcrypt processes of this instance are split
+SERVER_PROCESSES = server_processes()
+
+# bcrypt worker processes (BCRYPT_WORKERS/BCRYPT_ROUNDS/BCRYPT_MAX_PENDING)
+hashing_pool = hashing_pool_from_env(processes=SERVER_PROCESSES)
+
+# JWT signing keys (JWT_KEYS/JWT_ACTIVE_KID, or the legacy JWT_SECRET)
+jwt_keys = keyring_from_env()
+
+DB_CONNECTION_PARAMS = {
+    "host": DB_HOST,
+    "port": 5432,
+    "database": DB_NAME,
+    "user": DB_USER,
+    "password": DB_PASSWORD,
+}
+
+# Shared connection pool (bounds configured via DB_POOL_* variables)
+db_pool = pool_from_env(DB_CONNECTION_PARAMS, processes=SERVER_PROCESSES)
+
+# Export pool counters on /metrics
+register_stats(
+    "db_pool", "pool",
+    lambda: {"postgres": db_pool.stats()},
+    counters=DB_POOL_COUNTERS
+)
+register_stats(
+    "upstream", "upstream",
+    lambda: {"catalogue": catalogue_client.stats()},
+    counters=("requests", "errors", "connections_checked_out",
+              "connections_new", "connections_reused")
+    + RESILIENCE_COUNTERS
+)
+register_stats(
+    "bcrypt", "pool",
+    lambda: {"hashing": hashing_pool.stats()},
+    counters=("hashes", "checks", "rehashes", "rejected")
+)
+
+# Function to check out a pooled database connection
 def get_db_connection():
-    connection_params = {
-        "host": DB_HOST,
-        "port": 5432,
-        "database": DB_NAME,
-        "user": DB_USER,
-        "password": DB_PASSWORD,
-    }
     try:
-        conn = psycopg2.connect(**connection_params)
+        conn = db_pool.getconn()
         return conn, None  # Connection succeeded, return it
     except OperationalError as e:
         return None, {
             "error": 
                 f"Error connecting to the database: {str(e)}",
-                "parameters": connection_params
+                "parameters": DB_CONNECTION_PARAMS
             }
 
-# Function to initialize 'users't able in the database
-def initialize_table():
-    conn, _ = get_db_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-
-            # Create `users` table
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS users (
-                    id SERIAL PRIMARY KEY,
-                    username VARCHAR(255) UNIQUE NOT NULL,
-                    password VARCHAR(255) NOT NULL
-                )
-                """
-            )
-
-            conn.commit()  # Save changes
-            cur.close()
-            return True
-        finally:
-            conn.close()
-    return False
+# Function to hand a connection back to the pool
+def release_db_connection(conn):
+    db_pool.putconn(conn)
 
+# Function to bring the database schema up to date (see schema.py)
+def initialize_schema():
+    conn, error_info = get_db_connection()
+    if not conn:
+        logging.debug("Database not reachable yet: %s", error_info["error"])
+        return False
+    try:
+        applied = run_migrations(conn, schema.COMPONENT, schema.MIGRATIONS)
+        logging.debug("Applied schema migrations: %s", applied)
+        return True
+    except psycopg2.Error as e:
+        logging.error("Schema migration failed: %s", e)
+        return False
+    finally:
+        release_db_connection(conn)
+
+
+# 429 response telling the client when the hashing queue should have room
+def hashing_busy(error):
+    response = jsonify(
+        {
+            "error": "Too many concurrent password checks, retry later"
+        }
+    )
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 429
 
 # Route to test the database connection
 @app.route('/auth/test-db', methods=['GET'])
 def test_db_connection():
     conn, error_info = get_db_connection()
     if conn:
+        release_db_connection(conn)
         return jsonify({"message": "Database connected."}), 200
     # If connection failed, return debug info
     return jsonify(error_info), 500
 
+# Route to inspect connection pool usage and exhaustion counters
+@app.route('/auth/stats', methods=['GET'])
+def service_stats():
+    return jsonify(
+        {
+            "db_pool": db_pool.stats(),
+            "hashing": hashing_pool.stats(),
+            "upstreams": {"catalogue": catalogue_client.stats()}
+        }
+    ), 200
+
 # User Registration
 @app.route('/auth/register', methods=['POST'])
 def register():
@@ -93,23 +166,36 @@ def register():
 
     # Check if user already exists
     conn, error_info = get_db_connection()
+    if not conn:
+        return jsonify(error_info), 500
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM users WHERE username = %s", (username,))
+        existing_user = cur.fetchone()
+        cur.close()
+    except psycopg2.Error as e:
+        return jsonify({"error": f"Error inserting user: {str(e)}"}), 500
+    finally:
+        # Hand the connection back before the (slow) hashing starts
+        release_db_connection(conn)
+
+    if existing_user:
+        return jsonify({"error": "Username already exists"}), 400
+
+    # Hash password in the worker pool
+    try:
+        hashed_password = hashing_pool.hash_password(password)
+    except HashQueueFull as e:
+        return hashing_busy(e)
+
+    # Base64 encode the bcrypt hash before storing in the database
+    encoded_hash = base64.b64encode(hashed_password).decode('utf-8')
+
+    # Save user to the database
+    conn, error_info = get_db_connection()
     if conn:
         try:
             cur = conn.cursor()
-            # Check if username already exists
-            cur.execute("SELECT id FROM users WHERE username = %s", (username,))
-            existing_user = cur.fetchone()
-
-            if existing_user:
-                return jsonify({"error": "Username already exists"}), 400
-
-            # Hash password
-            hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-
-            # Base64 encode the bcrypt hash before storing in the database
-            encoded_hash = base64.b64encode(hashed_password).decode('utf-8')
-
-            # Save user to the database
             cur.execute("""
                 INSERT INTO users (username, password)
                 VALUES (%s, %s)
@@ -130,13 +216,44 @@ def register():
                         }
                 }
             ), 201
+        except psycopg2.IntegrityError:
+            # Registered concurrently while we were hashing
+            return jsonify({"error": "Username already exists"}), 400
         except psycopg2.Error as e:
             return jsonify({"error": f"Error inserting user: {str(e)}"}), 500
         finally:
-            conn.close()
+            release_db_connection(conn)
 
     return jsonify(error_info), 500
 
+# Re-hash a password whose bcrypt cost differs from BCRYPT_ROUNDS. Best
+# effort: the login succeeds either way.
+def rehash_password(user_id, password, old_encoded_hash):
+    try:
+        hashed_password = hashing_pool.hash_password(password)
+    except HashQueueFull:
+        return
+    encoded_hash = base64.b64encode(hashed_password).decode('utf-8')
+
+    conn, error_info = get_db_connection()
+    if not conn:
+        logging.warning("Skipping rehash: %s", error_info["error"])
+        return
+    try:
+        cur = conn.cursor()
+        # Only replace the hash we verified against
+        cur.execute(
+            "UPDATE users SET password = %s WHERE id = %s AND password = %s",
+            (encoded_hash, user_id, old_encoded_hash)
+        )
+        conn.commit()
+        cur.close()
+        hashing_pool.record_rehash()
+    except psycopg2.Error as e:
+        logging.warning("Rehash of user %s failed: %s", user_id, e)
+    finally:
+        release_db_connection(conn)
+
 # User Login
 @app.route('/auth/login', methods=['POST'])
 def login():
@@ -149,46 +266,54 @@ def login():
 
     # Retrieve user from database
     conn, error_info = get_db_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-            cur.execute(
-                "SELECT id, username, password FROM users WHERE username = %s",
-                (username,)
-            )
-            user = cur.fetchone()
+    if not conn:
+        return jsonify(error_info), 500
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT id, username, password FROM users WHERE username = %s",
+            (username,)
+        )
+        user = cur.fetchone()
+        cur.close()
+    except psycopg2.Error as e:
+        return jsonify({"error": f"Database error: {str(e)}"}), 500
+    finally:
+        # Hand the connection back before the (slow) hash check starts
+        release_db_connection(conn)
 
-            logging.debug(f"Row for {username} in the database is {user}")
-            
-            # Handle case when user does not exist
-            if not user:
-                return jsonify({"error": "User does not exist"}), 404
+    logging.debug("Row for %s found in the database: %s", username,
+                  user is not None)
 
-            # Retrieve the encoded hash from the database
-            encoded_hash_from_db = user[2]  # user[2] is the password column
+    # Handle case when user does not exist
+    if not user:
+        return jsonify({"error": "User does not exist"}), 404
 
-            # Decode the base64 hash
-            decoded_hash = base64.b64decode(encoded_hash_from_db)
+    # Retrieve the encoded hash from the database
+    encoded_hash_from_db = user[2]  # user[2] is the password column
 
-            cur.close()
+    # Decode the base64 hash
+    decoded_hash = base64.b64decode(encoded_hash_from_db)
 
-            if user and bcrypt.checkpw(password.encode('utf-8'), decoded_hash):
-                # Password match, generate JWT token
-                payload = {
-                    "user_id": user[0],
-                    "exp": datetime.datetime.now(datetime.timezone.utc) 
-                            + datetime.timedelta(hours=1)  # Token expiry
-                }
-                token = jwt.encode(payload, JWT_SECRET, algorithm="HS256")
-                return jsonify({"token": token}), 200
-            else:
-                return jsonify({"error": "Invalid credentials"}), 401
-        except psycopg2.Error as e:
-            return jsonify({"error": f"Database error: {str(e)}"}), 500
-        finally:
-            conn.close()
+    try:
+        password_matches = hashing_pool.check_password(password, decoded_hash)
+    except HashQueueFull as e:
+        return hashing_busy(e)
 
-    return jsonify(error_info), 500
+    if not password_matches:
+        return jsonify({"error": "Invalid credentials"}), 401
+
+    if hashing_pool.needs_rehash(decoded_hash):
+        rehash_password(user[0], password, encoded_hash_from_db)
+
+    # Password match, generate JWT token
+    payload = {
+        "user_id": user[0],
+        "exp": datetime.datetime.now(datetime.timezone.utc) 
+                + datetime.timedelta(hours=1)  # Token expiry
+    }
+    token = jwt_keys.sign(payload)
+    return jsonify({"token": token}), 200
 
 @app.route('/auth/movies', methods=['GET'])
 def get_movies():
@@ -197,20 +322,77 @@ def get_movies():
         return jsonify({"error": "Token is missing"}), 401
 
     try:
-        decoded_token = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+        decoded_token = jwt_keys.verify(token)
         user_id = decoded_token.get('user_id')
         jsonData = {"user_id": user_id}
-        response = requests.get(
-            f"{CATALOGUE_SERVICE_URL}/catalogue/movies",
-            json = jsonData
+        # Paging/filter parameters and cursors are passed through untouched,
+        # as are If-None-Match and Accept-Encoding
+        response = catalogue_client.get(
+            "/catalogue/movies",
+            params=request.args,
+            headers=conditional_headers(request.headers),
+            json = jsonData,
+            stream=True
         )
-        logging.debug("Response from catalogue is: " + response.text)
-        return jsonify(response.json()), response.status_code
+        logging.debug("Catalogue answered %s", response.status_code)
+        # The catalogue's JSON (or 304) is streamed through as-is
+        return stream_response(response)
     except jwt.ExpiredSignatureError:
         return jsonify({"error": "Token has expired"}), 401
     except jwt.InvalidTokenError:
         return jsonify({"error": "Invalid token"}), 401
     
+@app.route('/auth/movies/search', methods=['GET'])
+def search_movies():
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"error": "Token is missing"}), 401
+
+    try:
+        decoded_token = jwt_keys.verify(token)
+        user_id = decoded_token.get('user_id')
+        # q, mode, filters and cursors are passed through untouched
+        response = catalogue_client.get(
+            "/catalogue/movies/search",
+            params=request.args,
+            json={"user_id": user_id},
+            stream=True
+        )
+        return stream_response(response)
+    except jwt.ExpiredSignatureError:
+        return jsonify({"error": "Token has expired"}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({"error": "Invalid token"}), 401
+
+@app.route('/auth/movies/export', methods=['GET'])
+def export_movies():
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"error": "Token is missing"}), 401
+
+    try:
+        decoded_token = jwt_keys.verify(token)
+        user_id = decoded_token.get('user_id')
+        upstream = catalogue_client.get(
+            "/catalogue/movies/export",
+            params={
+                "user_id": user_id,
+                "format": request.args.get('format', 'ndjson')
+            },
+            stream=True
+        )
+    except jwt.ExpiredSignatureError:
+        return jsonify({"error": "Token has expired"}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({"error": "Invalid token"}), 401
+    except UpstreamUnavailable:
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    # Relay chunks as they arrive instead of buffering the export
+    return stream_response(upstream)
+
 @app.route('/auth/movies', methods=['POST'])
 def add_movie():
     # Get the token from Authorization header
@@ -233,7 +415,7 @@ def add_movie():
 
     try:
         # Decode the token
-        decoded_token = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+        decoded_token = jwt_keys.verify(token)
         user_id = decoded_token.get('user_id')
 
         # Prepare data to send to the catalogue service
@@ -245,26 +427,29 @@ def add_movie():
         }
 
         # Send POST request to the catalogue service to add the movie
-        response = requests.post(
-            f"{CATALOGUE_SERVICE_URL}/catalogue/movies",
-            json=jsonData
+        response = catalogue_client.post(
+            "/catalogue/movies",
+            json=jsonData,
+            stream=True
         )
 
         # Return the response from the catalogue service
         if response.status_code == 201:  # If successful
-            return jsonify(response.json()), 201
+            return stream_response(response)
         else:
-            return jsonify(
-                {
-                    "error": "Failed to add movie",
-                    "details": response.json()
-                }
-            ), 500
+            return stream_response(
+                response,
+                status=500,
+                envelope={"error": "Failed to add movie"},
+                key="details"
+            )
 
     except jwt.ExpiredSignatureError:
         return jsonify({"error": "Token has expired"}), 401
     except jwt.InvalidTokenError:
         return jsonify({"error": "Invalid token"}), 401
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
@@ -285,7 +470,7 @@ def delete_movie():
 
     try:
         # Decode the token
-        decoded_token = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+        decoded_token = jwt_keys.verify(token)
         user_id = decoded_token.get('user_id')
 
         # Prepare data to send to the catalogue service
@@ -296,28 +481,143 @@ def delete_movie():
         }
 
         # Send DELETE request to the catalogue service to delete the movie
-        response = requests.delete(
-            f"{CATALOGUE_SERVICE_URL}/catalogue/movies",
-            json=jsonData
+        response = catalogue_client.delete(
+            "/catalogue/movies",
+            json=jsonData,
+            stream=True
         )
 
         # Return the response from the catalogue service
         if response.status_code == 200:  # If successful
-            return jsonify(response.json()), 200
+            return stream_response(response)
         elif response.status_code == 404:  # If movie not found
+            response.close()
             return jsonify({"error": "Movie not found"}), 404
         else:
-            return jsonify(
-                {
-                    "error": "Failed to delete movie",
-                    "details": response.json()
-                }
-            ), 500
+            return stream_response(
+                response,
+                status=500,
+                envelope={"error": "Failed to delete movie"},
+                key="details"
+            )
+
+    except jwt.ExpiredSignatureError:
+        return jsonify({"error": "Token has expired"}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({"error": "Invalid token"}), 401
+    except UpstreamUnavailable:
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/auth/movies/bulk', methods=['POST'])
+def import_movies_bulk():
+    # Get the token from Authorization header
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"error": "Token is missing"}), 401
+
+    try:
+        # Decode the token
+        decoded_token = jwt_keys.verify(token)
+        user_id = decoded_token.get('user_id')
+
+        # Stream the JSON array / NDJSON body through to the catalogue
+        # service chunk by chunk instead of parsing it here
+        response = catalogue_client.post(
+            "/catalogue/movies/bulk",
+            params={"user_id": user_id},
+            headers=body_headers(),
+            data=request_body(),
+            stream=True
+        )
+        return stream_response(response)
+
+    except jwt.ExpiredSignatureError:
+        return jsonify({"error": "Token has expired"}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({"error": "Invalid token"}), 401
+    except (RequestEntityTooLarge, UpstreamUnavailable):
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/auth/movies/batch', methods=['POST'])
+def run_movie_batch():
+    # Get the token from Authorization header
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"error": "Token is missing"}), 401
+
+    try:
+        # Decode the token once for the whole batch
+        decoded_token = jwt_keys.verify(token)
+        user_id = decoded_token.get('user_id')
+
+        # Stream the operation list through to the catalogue service,
+        # which runs it in a single transaction
+        response = catalogue_client.post(
+            "/catalogue/movies/batch",
+            params={"user_id": user_id},
+            headers=body_headers(),
+            data=request_body(),
+            stream=True
+        )
+        return stream_response(response)
+
+    except jwt.ExpiredSignatureError:
+        return jsonify({"error": "Token has expired"}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({"error": "Invalid token"}), 401
+    except (RequestEntityTooLarge, UpstreamUnavailable):
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/auth/movies/bulk', methods=['DELETE'])
+def delete_movies_bulk():
+    # Get the token from Authorization header
+    token = request.headers.get('Authorization')
+    if not token:
+        return jsonify({"error": "Token is missing"}), 401
+
+    # Get the list of (name, year) pairs from the request body
+    data = request.get_json()
+    movies = data.get('movies')
+
+    if not isinstance(movies, list) or not movies:
+        return jsonify({"error": "A non-empty list of movies is required"}), 400
+
+    try:
+        # Decode the token
+        decoded_token = jwt_keys.verify(token)
+        user_id = decoded_token.get('user_id')
+
+        # Send one DELETE request for the whole list to the catalogue service
+        response = catalogue_client.delete(
+            "/catalogue/movies/bulk",
+            json={"user_id": user_id, "movies": movies},
+            stream=True
+        )
+
+        # Return the response from the catalogue service
+        if response.status_code in (200, 400):
+            return stream_response(response)
+        else:
+            return stream_response(
+                response,
+                status=500,
+                envelope={"error": "Failed to delete movies"},
+                key="details"
+            )
 
     except jwt.ExpiredSignatureError:
         return jsonify({"error": "Token has expired"}), 401
     except jwt.InvalidTokenError:
         return jsonify({"error": "Invalid token"}), 401
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -329,10 +629,8 @@ def protected():
     if not token:
         return jsonify({"error": "Token is missing"}), 401
     
-    logging.debug(f"Token received in auth.py: {token}")  # Log the token
-
     try:
-        decoded_token = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+        decoded_token = jwt_keys.verify(token)
         return jsonify(
             {
                 "message": "This is protected data",
@@ -345,8 +643,15 @@ def protected():
         return jsonify({"error": "Invalid token"}), 401
 
 if __name__ == '__main__':
-    logging.debug("Trying to initialize 'users' table in database...")
-    while not initialize_table():
-        pass
-    logging.debug("'users' table created in database.")
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    logging.debug("Migrating 'users' schema in database...")
+    while not initialize_schema():
+        time.sleep(1)
+    logging.debug("'users' schema is up to date.")
+    # Workers are forked from this process: don't hand them its connections
+    db_pool.closeall()
+
+    # SERVE_MODE=development keeps the single-process debug server
+    if serving_mode() == "development":
+        app.run(debug=True, host='0.0.0.0', port=5000)
+    else:
+        serve(app, 5000, workers=SERVER_PROCESSES)
@@ -0,0 +1,316 @@
+import collections
+import logging
+import os
+import threading
+import time
+
+import psycopg2
+from psycopg2 import OperationalError
+from psycopg2 import extensions
+
+from instrumentation import DB_POOL_CHECKOUT_LATENCY, DB_QUERY_LATENCY
+from tracing import tracer
+
+# Statement kinds used as the db_query_duration_seconds label
+STATEMENT_KINDS = frozenset(
+    ["SELECT", "INSERT", "UPDATE", "DELETE", "COPY", "CREATE", "TRUNCATE"]
+)
+
+
+# Monotonic keys of ConnectionPool.stats(), for metrics exporters
+DB_POOL_COUNTERS = ("checkouts", "connections_created", "connections_closed",
+                    "health_check_failures", "waits", "wait_time_total",
+                    "timeouts")
+
+
+class PoolTimeout(OperationalError):
+    """
+    Raised when no connection became available within the wait timeout.
+    Subclasses OperationalError so callers that already handle connection
+    failures keep working unchanged.
+    """
+
+
+def _statement_kind(query):
+    if not isinstance(query, (str, bytes)):
+        return "OTHER"  # psycopg2.sql.Composed and friends
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    words = query.split(None, 1)
+    kind = words[0].upper() if words else ""
+    return kind if kind in STATEMENT_KINDS else "OTHER"
+
+
+class TimedCursor(extensions.cursor):
+    """Cursor recording each statement's duration by statement kind."""
+
+    def execute(self, query, vars=None):
+        kind = _statement_kind(query)
+        started = time.perf_counter()
+        try:
+            with tracer.child_span(f"db {kind}", kind="client",
+                                   attributes={"db.statement": kind}):
+                return super().execute(query, vars)
+        finally:
+            DB_QUERY_LATENCY.labels(kind).observe(
+                time.perf_counter() - started
+            )
+
+    def copy_expert(self, sql, file, size=8192):
+        started = time.perf_counter()
+        try:
+            with tracer.child_span("db COPY", kind="client",
+                                   attributes={"db.statement": "COPY"}):
+                return super().copy_expert(sql, file, size)
+        finally:
+            DB_QUERY_LATENCY.labels("COPY").observe(
+                time.perf_counter() - started
+            )
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of psycopg2 connections.
+
+    Connections are opened lazily up to `maxconn`. When the pool is
+    exhausted, callers wait in a FIFO queue for up to `wait_timeout`
+    seconds before PoolTimeout is raised. Idle connections above `minconn`
+    are closed once they have been unused for `idle_timeout` seconds, and
+    connections idle for longer than `health_check_interval` are pinged
+    with `SELECT 1` before being handed out.
+    """
+
+    def __init__(self, connection_params, minconn=1, maxconn=10,
+                 idle_timeout=300.0, wait_timeout=5.0,
+                 health_check_interval=30.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Invalid pool bounds: min=%s max=%s"
+                             % (minconn, maxconn))
+        self.connection_params = connection_params
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.health_check_interval = health_check_interval
+
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._reset_state()
+
+    def _reset_state(self):
+        # Idle connections as (conn, last_used) pairs, most recent on the
+        # right so checkout reuses the warmest connection first
+        self._idle = collections.deque()
+        self._in_use = set()
+        self._opening = 0
+        self._waiters = 0
+        self._pid = os.getpid()
+        self._stats = {
+            "checkouts": 0,
+            "connections_created": 0,
+            "connections_closed": 0,
+            "health_check_failures": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "timeouts": 0,
+            "max_waiters": 0,
+        }
+
+    def _check_fork(self):
+        # Connections must never be shared with a parent process (e.g. a
+        # pre-forking server). Drop them without closing: closing would
+        # terminate the parent's session on the shared socket.
+        if self._pid != os.getpid():
+            self._reset_state()
+
+    def _connect(self):
+        conn = psycopg2.connect(cursor_factory=TimedCursor,
+                                **self.connection_params)
+        with self._lock:
+            self._stats["connections_created"] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        self._stats["connections_closed"] += 1
+
+    def _is_healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _prune_idle(self, now):
+        # Close connections above `minconn` that outlived the idle timeout.
+        # The oldest idle connections sit on the left of the deque.
+        while (self._idle
+               and len(self._idle) + len(self._in_use) > self.minconn
+               and now - self._idle[0][1] > self.idle_timeout):
+            conn, _ = self._idle.popleft()
+            self._discard(conn)
+
+    def getconn(self, timeout=None):
+        """
+        Check out a connection, waiting up to `timeout` seconds
+        (default: the pool's wait timeout) if the pool is exhausted.
+        """
+        if timeout is None:
+            timeout = self.wait_timeout
+
+        started = time.perf_counter()
+        try:
+            return self._getconn(timeout)
+        finally:
+            DB_POOL_CHECKOUT_LATENCY.observe(time.perf_counter() - started)
+
+    def _getconn(self, timeout):
+        while True:
+            with self._lock:
+                self._check_fork()
+                self._prune_idle(time.monotonic())
+
+                if (not self._idle
+                        and len(self._in_use) + self._opening >= self.maxconn):
+                    self._wait(timeout)
+
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    self._in_use.add(conn)
+                    self._stats["checkouts"] += 1
+                    new = False
+                else:
+                    self._opening += 1
+                    new = True
+
+            if new:
+                try:
+                    conn = self._connect()
+                except psycopg2.Error:
+                    with self._lock:
+                        self._opening -= 1
+                        self._available.notify()
+                    raise
+                with self._lock:
+                    self._opening -= 1
+                    self._in_use.add(conn)
+                    self._stats["checkouts"] += 1
+                return conn
+
+            if self._is_healthy(conn, last_used):
+                return conn
+
+            # Broken connection: drop it and try again with the same budget
+            logging.debug("Discarding unhealthy pooled connection")
+            with self._lock:
+                self._in_use.discard(conn)
+                self._stats["health_check_failures"] += 1
+                self._discard(conn)
+                self._available.notify()
+
+    def _wait(self, timeout):
+        # Called with the lock held. Blocks until a connection is returned
+        # or a slot frees up, raising PoolTimeout on expiry.
+        self._waiters += 1
+        self._stats["waits"] += 1
+        self._stats["max_waiters"] = max(self._stats["max_waiters"],
+                                         self._waiters)
+        started = time.monotonic()
+        deadline = started + timeout
+        try:
+            while (not self._idle
+                   and len(self._in_use) + self._opening >= self.maxconn):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(
+                        "Connection pool exhausted (max %d) after waiting "
+                        "%.1fs" % (self.maxconn, timeout)
+                    )
+                self._available.wait(remaining)
+        finally:
+            self._waiters -= 1
+            self._stats["wait_time_total"] += time.monotonic() - started
+
+    def putconn(self, conn, close=False):
+        """
+        Return a connection to the pool. Any open transaction is rolled
+        back; broken connections are closed instead of being reused.
+        """
+        with self._lock:
+            if self._pid != os.getpid() or conn not in self._in_use:
+                return
+            self._in_use.discard(conn)
+
+        if not close and not conn.closed:
+            try:
+                status = conn.get_transaction_status()
+                if status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+
+        with self._lock:
+            if close or conn.closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+
+    def closeall(self):
+        with self._lock:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+            for conn in list(self._in_use):
+                self._discard(conn)
+            self._in_use.clear()
+            self._available.notify_all()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(
+                {
+                    "min_size": self.minconn,
+                    "max_size": self.maxconn,
+                    "size": len(self._idle) + len(self._in_use),
+                    "idle": len(self._idle),
+                    "in_use": len(self._in_use),
+                    "waiting": self._waiters,
+                }
+            )
+        return stats
+
+
+# Build a pool from the DB_POOL_* environment variables. Without
+# DB_POOL_MAX, the DB_MAX_CONNECTIONS a service instance may open in total
+# are split between its `processes` server processes.
+def pool_from_env(connection_params, processes=1):
+    maxconn = os.environ.get("DB_POOL_MAX")
+    if maxconn:
+        maxconn = int(maxconn)
+    else:
+        total = int(os.environ.get("DB_MAX_CONNECTIONS", "20"))
+        maxconn = max(1, total // processes)
+    return ConnectionPool(
+        connection_params,
+        minconn=min(int(os.environ.get("DB_POOL_MIN", "1")), maxconn),
+        maxconn=maxconn,
+        idle_timeout=float(os.environ.get("DB_POOL_IDLE_TIMEOUT", "300")),
+        wait_timeout=float(os.environ.get("DB_POOL_WAIT_TIMEOUT", "5")),
+        health_check_interval=float(
+            os.environ.get("DB_POOL_HEALTH_CHECK_INTERVAL", "30")
+        ),
+    )
@@ -0,0 +1,93 @@
+"""
+Fast JSON encoding for the Flask apps and byte pass-through for proxies.
+
+FastJSONProvider swaps Flask's json module for orjson when it is installed
+(JSON_PROVIDER=auto, the default, or orjson), producing the same JSON
+values as Flask's default provider. envelope_prefix() lets the proxies
+nest an already encoded upstream body in a response envelope without
+decoding it; they relay upstream JSON verbatim unless JSON_PASSTHROUGH=0.
+"""
+import json
+import logging
+import os
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_MIMETYPE = "application/json"
+PASSTHROUGH = os.environ.get("JSON_PASSTHROUGH", "1") not in ("0", "false")
+
+
+def dumps(obj):
+    """Encode to compact JSON bytes with the fastest available encoder."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson. Dates, decimals and the other
+    types orjson would format differently go through Flask's default()
+    so responses decode to what the default provider would send. The
+    bytes differ: there is no whitespace, and non-ASCII characters are
+    sent as UTF-8 where the default provider (ensure_ascii) escapes them
+    as \\uXXXX.
+    """
+
+    def _options(self):
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Callers asking for json.dumps options get the stdlib encoder
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(
+            obj, default=self.default, option=self._options()
+        ).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        options = self._options() | orjson.OPT_APPEND_NEWLINE
+        body = orjson.dumps(obj, default=self.default, option=options)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def install_json_provider(app):
+    """Use FastJSONProvider for `app` as selected by JSON_PROVIDER."""
+    choice = os.environ.get("JSON_PROVIDER", "auto")
+    if choice == "std":
+        return
+    if orjson is None:
+        if choice == "orjson":
+            logging.warning("JSON_PROVIDER=orjson but orjson is not "
+                            "installed; using the standard library")
+        return
+    app.json_provider_class = FastJSONProvider
+    app.json = FastJSONProvider(app)
+
+
+def is_json(upstream):
+    content_type = upstream.headers.get("Content-Type", "")
+    return content_type.split(";", 1)[0].strip() == JSON_MIMETYPE
+
+
+def envelope_prefix(envelope, key):
+    """
+    Encode `envelope` plus a last `key` field, up to where that field's
+    value goes: ({"message": "ok"}, "body") -> b'{"message":"ok","body":'
+    """
+    encoded = dumps(dict(envelope, **{key: None}))
+    return encoded[:-len(b"null}")]
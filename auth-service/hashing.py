@@ -0,0 +1,137 @@
+import concurrent.futures
+import math
+import os
+import threading
+import time
+
+import bcrypt
+
+
+class HashQueueFull(Exception):
+    """
+    Raised when too many hashes are already queued; `retry_after` is the
+    estimated number of seconds until the queue drains.
+    """
+
+    def __init__(self, retry_after):
+        super().__init__("Password hashing queue is full")
+        self.retry_after = retry_after
+
+
+# Worker-process entry points (module level so they can be pickled)
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+def hash_rounds(hashed):
+    # bcrypt hashes look like b"$2b$12$<salt+hash>"
+    try:
+        return int(hashed.split(b"$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class HashingPool:
+    """
+    Runs bcrypt in a bounded pool of worker processes so CPU-bound hashing
+    neither holds the GIL nor a request thread's place in line.
+
+    At most `max_pending` hashes may be queued or running; beyond that
+    calls fail fast with HashQueueFull instead of piling up requests.
+    """
+
+    def __init__(self, workers, rounds=12, max_pending=None):
+        self.workers = workers
+        self.rounds = rounds
+        self.max_pending = max_pending or workers * 4
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._pending = 0
+        # Moving average of one hash's duration, for Retry-After estimates
+        self._avg_seconds = 0.25
+        self._stats = {"hashes": 0, "checks": 0, "rehashes": 0,
+                       "rejected": 0}
+
+    def _get_executor(self):
+        # Created lazily, and again after a fork: worker processes are not
+        # shared between server processes
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _retry_after(self):
+        waves = math.ceil(self._pending / float(self.workers))
+        return max(1, math.ceil(waves * self._avg_seconds))
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["rejected"] += 1
+                retry_after = self._retry_after()
+            raise HashQueueFull(retry_after)
+        with self._lock:
+            self._pending += 1
+        started = time.monotonic()
+        try:
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self._pending -= 1
+                self._avg_seconds = 0.9 * self._avg_seconds + 0.1 * elapsed
+            self._slots.release()
+
+    def hash_password(self, password):
+        """Return the bcrypt hash (bytes) of a str password."""
+        hashed = self._run(_hashpw, password.encode('utf-8'), self.rounds)
+        with self._lock:
+            self._stats["hashes"] += 1
+        return hashed
+
+    def check_password(self, password, hashed):
+        matches = self._run(_checkpw, password.encode('utf-8'), hashed)
+        with self._lock:
+            self._stats["checks"] += 1
+        return matches
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) != self.rounds
+
+    def record_rehash(self):
+        with self._lock:
+            self._stats["rehashes"] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                workers=self.workers,
+                rounds=self.rounds,
+                max_pending=self.max_pending,
+                pending=self._pending,
+                avg_seconds=round(self._avg_seconds, 4),
+            )
+
+
+# Build the hashing pool from the BCRYPT_* environment variables; by
+# default the CPUs are split between the `processes` server processes
+def pool_from_env(processes=1):
+    workers = int(os.environ.get(
+        "BCRYPT_WORKERS", max(1, (os.cpu_count() or 1) // processes)
+    ))
+    max_pending = os.environ.get("BCRYPT_MAX_PENDING")
+    return HashingPool(
+        workers,
+        rounds=int(os.environ.get("BCRYPT_ROUNDS", "12")),
+        max_pending=int(max_pending) if max_pending else None,
+    )
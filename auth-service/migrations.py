@@ -0,0 +1,102 @@
+import collections
+import logging
+
+import psycopg2
+
+# Serializes migration runs across every replica and service sharing the
+# database (pg_advisory_xact_lock key)
+MIGRATION_LOCK_ID = 7243001
+
+# A schema change: `apply` is a list of SQL statements or a callable taking
+# a cursor. Migrations must be idempotent (IF NOT EXISTS etc.) so a schema
+# created before versioning existed can be adopted safely. A `batched`
+# migration's callable does one batch of work per call and returns True
+# once there is none left; each batch commits on its own, so a long
+# migration holds no single huge transaction and resumes where it stopped.
+Migration = collections.namedtuple(
+    "Migration", ["version", "description", "apply", "batched"],
+    defaults=(False,)
+)
+
+
+def _ensure_version_table(conn):
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            component VARCHAR(64) NOT NULL,
+            version INT NOT NULL,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (component, version)
+        )
+        """
+    )
+    conn.commit()
+    cur.close()
+
+
+def current_version(cur, component):
+    cur.execute(
+        "SELECT COALESCE(MAX(version), 0) FROM schema_version "
+        "WHERE component = %s",
+        (component,)
+    )
+    return cur.fetchone()[0]
+
+
+def run_migrations(conn, component, migrations):
+    """
+    Apply every migration of `component` newer than its recorded version,
+    in order, each in its own transaction. Returns the applied versions.
+    """
+    versions = [m.version for m in migrations]
+    if versions != sorted(set(versions)):
+        raise ValueError(f"Migrations for {component} are not strictly ordered")
+
+    try:
+        _ensure_version_table(conn)
+    except psycopg2.IntegrityError:
+        # Another replica created the table concurrently
+        conn.rollback()
+
+    applied = []
+    for migration in migrations:
+        cur = conn.cursor()
+        try:
+            while True:
+                cur.execute("SELECT pg_advisory_xact_lock(%s)",
+                            (MIGRATION_LOCK_ID,))
+                # Re-read under the lock: another replica may have got
+                # here first
+                if current_version(cur, component) >= migration.version:
+                    conn.rollback()
+                    break
+
+                logging.info("Applying %s migration %d: %s", component,
+                             migration.version, migration.description)
+                if migration.batched:
+                    # Commit the batch and take the next one under a
+                    # fresh lock
+                    if not migration.apply(cur):
+                        conn.commit()
+                        continue
+                elif callable(migration.apply):
+                    migration.apply(cur)
+                else:
+                    for statement in migration.apply:
+                        cur.execute(statement)
+                cur.execute(
+                    "INSERT INTO schema_version "
+                    "(component, version, description) VALUES (%s, %s, %s)",
+                    (component, migration.version, migration.description)
+                )
+                conn.commit()
+                applied.append(migration.version)
+                break
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+    return applied
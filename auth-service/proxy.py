@@ -0,0 +1,210 @@
+"""
+Streaming forwarding helpers for the proxy routes.
+
+Request bodies are sent upstream chunk by chunk as they arrive, and
+upstream responses are opened with `stream=True` and relayed chunk by
+chunk, so a forwarded body is never held in memory in full. End-to-end
+headers are copied, hop-by-hop ones dropped, and bodies without a known
+length go out with chunked transfer encoding. Request bodies larger than
+PROXY_MAX_REQUEST_BYTES are answered with 413.
+"""
+import logging
+import os
+
+from flask import Response, jsonify, request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from fastjson import PASSTHROUGH, envelope_prefix, is_json
+from resilience import UpstreamUnavailable
+
+CHUNK_SIZE = int(os.environ.get("PROXY_CHUNK_SIZE", str(64 * 1024)))
+MAX_REQUEST_BYTES = int(
+    os.environ.get("PROXY_MAX_REQUEST_BYTES", str(64 * 1024 * 1024))
+)
+
+# RFC 7230 hop-by-hop headers, plus those the local server sets itself
+HOP_BY_HOP_HEADERS = frozenset([
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailer", "transfer-encoding", "upgrade",
+    "content-length", "date", "server",
+    # Tracing headers are answered for this hop by tracing.tag_response
+    "traceparent", "x-request-id",
+])
+
+
+class BodyTooLarge(RequestEntityTooLarge):
+    description = "Request body exceeds PROXY_MAX_REQUEST_BYTES"
+
+
+def too_large(error):
+    return jsonify(
+        {"error": "Request body too large", "limit_bytes": MAX_REQUEST_BYTES}
+    ), 413
+
+
+def install_proxy_limits(app):
+    """Enforce the request body limit and answer 413 as JSON."""
+    if MAX_REQUEST_BYTES:
+        app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_BYTES
+    app.register_error_handler(RequestEntityTooLarge, too_large)
+
+
+def upstream_unavailable(error):
+    response = jsonify(
+        {
+            "error": f"Upstream {error.upstream} service unavailable",
+            "reason": error.reason
+        }
+    )
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 503
+
+
+def install_load_shedding(app):
+    """Answer calls rejected by an upstream's breaker or bulkhead with
+    503 and Retry-After."""
+    app.register_error_handler(UpstreamUnavailable, upstream_unavailable)
+
+
+class SizedBody:
+    """
+    Chunks of a body whose length is known. requests takes the
+    Content-Length from len() and sends the chunks as they come; given an
+    explicit Content-Length header next to a plain generator it would add
+    Transfer-Encoding: chunked as well, which servers such as gunicorn
+    reject.
+    """
+
+    def __init__(self, chunks, length):
+        self._chunks = chunks
+        self._length = length
+
+    def __iter__(self):
+        return self._chunks
+
+    def __len__(self):
+        return self._length
+
+
+def request_body():
+    """
+    Iterate over the incoming request body in CHUNK_SIZE chunks, counting
+    bytes so chunked uploads without a Content-Length are limited too.
+    A body with a Content-Length is forwarded with that length, others
+    with chunked transfer encoding.
+    """
+    length = request.content_length
+    if MAX_REQUEST_BYTES and (length or 0) > MAX_REQUEST_BYTES:
+        raise BodyTooLarge()
+
+    def chunks():
+        received = 0
+        while True:
+            chunk = request.stream.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            received += len(chunk)
+            if MAX_REQUEST_BYTES and received > MAX_REQUEST_BYTES:
+                raise BodyTooLarge()
+            yield chunk
+
+    if length:
+        return SizedBody(chunks(), length)
+    return chunks()
+
+
+def body_headers(headers=None):
+    """
+    Headers describing the incoming body for the upstream request. The
+    framing headers (Content-Length or Transfer-Encoding) are left to the
+    HTTP client, which derives them from request_body().
+    """
+    headers = dict(headers or {})
+    headers.setdefault(
+        "Content-Type", request.content_type or "application/json"
+    )
+    return headers
+
+
+def conditional_headers(incoming):
+    """
+    Headers of the client request `incoming` that let the upstream answer
+    304 or compress the body. Relayed bodies reach the client undecoded,
+    so its own Accept-Encoding is forwarded (identity if it sent none);
+    bodies re-encoded here keep the HTTP client's default instead.
+    """
+    headers = {}
+    if incoming.get("If-None-Match"):
+        headers["If-None-Match"] = incoming["If-None-Match"]
+    if PASSTHROUGH:
+        headers["Accept-Encoding"] = incoming.get(
+            "Accept-Encoding", "identity"
+        )
+    return headers
+
+
+def copy_headers(upstream, keep=("content-length",), drop=()):
+    """End-to-end headers of an upstream response worth passing on."""
+    return {
+        name: value for name, value in upstream.headers.items()
+        if name.lower() in keep
+        or (name.lower() not in HOP_BY_HOP_HEADERS
+            and name.lower() not in drop)
+    }
+
+
+def stream_response(upstream, status=None, envelope=None, key=None,
+                    headers=None):
+    """
+    Relay a response opened with `stream=True`. With `envelope` (a dict)
+    and `key`, the JSON body is nested under `key` next to the envelope's
+    fields, e.g. {"message": "Token is valid", "Added movie": <body>}.
+
+    The upstream bytes are relayed as they arrive (compressed bodies stay
+    compressed); with JSON_PASSTHROUGH=0, or a body that isn't JSON where
+    JSON is expected, the body is read, decoded and re-encoded instead.
+    """
+    status = status or upstream.status_code
+    expects_json = envelope is not None or is_json(upstream)
+    if expects_json and (not PASSTHROUGH or not is_json(upstream)):
+        return _reencode(upstream, status, envelope, key, headers)
+
+    if envelope is None:
+        body = upstream.raw.stream(CHUNK_SIZE, decode_content=False)
+        response_headers = copy_headers(upstream)
+    else:
+        # The envelope changes the length and needs the decoded body
+        body = _enveloped(envelope_prefix(envelope, key),
+                          upstream.iter_content(CHUNK_SIZE), b"}")
+        response_headers = copy_headers(
+            upstream, keep=(), drop=("content-encoding",)
+        )
+    response_headers.update(headers or {})
+
+    response = Response(body, status=status, headers=response_headers,
+                        direct_passthrough=True)
+    response.call_on_close(upstream.close)
+    return response
+
+
+def _enveloped(prefix, chunks, suffix):
+    yield prefix
+    for chunk in chunks:
+        yield chunk
+    yield suffix
+
+
+def _reencode(upstream, status, envelope, key, headers):
+    try:
+        data = upstream.json()
+    except ValueError:
+        logging.error("Upstream answered %s with a non-JSON body",
+                      upstream.status_code)
+        return jsonify(
+            {"error": "Invalid JSON response from upstream service"}
+        ), 500
+    finally:
+        upstream.close()
+    if envelope is not None:
+        data = dict(envelope, **{key: data})
+    return jsonify(data), status, headers or {}
@@ -0,0 +1,19 @@
+from migrations import Migration
+
+COMPONENT = "auth"
+
+MIGRATIONS = [
+    Migration(
+        1,
+        "Create users table",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                id SERIAL PRIMARY KEY,
+                username VARCHAR(255) UNIQUE NOT NULL,
+                password VARCHAR(255) NOT NULL
+            )
+            """,
+        ],
+    ),
+]
@@ -0,0 +1,116 @@
+import logging
+import multiprocessing
+import os
+
+# Gunicorn settings driven by the WEB_* environment variables
+DEFAULT_TIMEOUT = 30
+DEFAULT_GRACEFUL_TIMEOUT = 25  # below the Kubernetes 30s grace period
+
+# Cap on the default worker count: every worker opens its own database
+# pool (and in auth its own bcrypt processes), so a big node should not
+# multiply them unasked. Scale out with replicas or set WEB_WORKERS.
+MAX_DEFAULT_WORKERS = 4
+
+
+def serving_mode():
+    return os.environ.get("SERVE_MODE", "production")
+
+
+def web_workers(default=None):
+    return int(os.environ.get(
+        "WEB_WORKERS",
+        default or min(multiprocessing.cpu_count() * 2 + 1,
+                       MAX_DEFAULT_WORKERS)
+    ))
+
+
+def server_processes(default=None):
+    """
+    Number of processes that will serve requests: the gunicorn workers, or
+    one with SERVE_MODE=development. Per-service budgets (database
+    connections, bcrypt processes) are split between them.
+    """
+    if serving_mode() == "development":
+        return 1
+    return web_workers(default)
+
+
+def check_metrics_dir(workers):
+    """
+    Refuse to start several workers without PROMETHEUS_MULTIPROC_DIR:
+    each would keep its own metrics, and a scrape would see whichever
+    worker answered it. The variable must be set before start-up, as
+    prometheus_client picks its storage when first imported.
+    """
+    if workers <= 1:
+        return
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        raise RuntimeError(
+            f"PROMETHEUS_MULTIPROC_DIR must be set to run {workers} "
+            "gunicorn workers (or set WEB_WORKERS=1)"
+        )
+    if not os.path.isdir(path) or not os.access(path, os.W_OK):
+        raise RuntimeError(
+            f"PROMETHEUS_MULTIPROC_DIR {path!r} is not a writable directory"
+        )
+
+
+def _mark_worker_dead(server, worker):
+    # Drop the exited worker's live gauges from the shared metrics files
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def gunicorn_options(port, workers, worker_class):
+    options = {
+        "bind": f"0.0.0.0:{port}",
+        "workers": workers,
+        "worker_class": worker_class,
+        "threads": int(os.environ.get("WEB_THREADS", "4")),
+        "timeout": int(os.environ.get("WEB_TIMEOUT", DEFAULT_TIMEOUT)),
+        "graceful_timeout": int(os.environ.get(
+            "WEB_GRACEFUL_TIMEOUT", DEFAULT_GRACEFUL_TIMEOUT
+        )),
+        "keepalive": int(os.environ.get("WEB_KEEPALIVE", "5")),
+        "max_requests": int(os.environ.get("WEB_MAX_REQUESTS", "0")),
+        "max_requests_jitter": int(os.environ.get(
+            "WEB_MAX_REQUESTS_JITTER", "0"
+        )),
+        # The app is imported once in the master and forked into the
+        # workers, so start-up work (migrations, imports) is paid once
+        "preload_app": True,
+        "accesslog": os.environ.get("WEB_ACCESS_LOG") or None,
+        "errorlog": "-",
+    }
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        options["child_exit"] = _mark_worker_dead
+    return options
+
+
+def serve(app, port, workers=None, worker_class="gthread"):
+    """
+    Serve a WSGI app object (or an "module:attr" import string for ASGI
+    apps run under uvicorn workers) with a pre-forking gunicorn master.
+    Workers finish in-flight requests on SIGTERM before exiting.
+    """
+    from gunicorn.app.base import BaseApplication
+    from gunicorn.util import import_app
+
+    workers = workers or web_workers()
+    check_metrics_dir(workers)
+
+    class Application(BaseApplication):
+        def load_config(self):
+            options = gunicorn_options(port, workers, worker_class)
+            for key, value in options.items():
+                if value is not None:
+                    self.cfg.set(key, value)
+
+        def load(self):
+            return import_app(app) if isinstance(app, str) else app
+
+    logging.info("Serving on port %s with gunicorn (%s workers)", port,
+                 workers)
+    Application().run()
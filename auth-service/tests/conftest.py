@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+# The service's modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Database tests run in a throwaway schema of the scratch database named
+# by the usual PG* variables; PGOPTIONS points every connection (also the
+# service's own pool) at it
+TEST_SCHEMA = "auth_test"
+os.environ.setdefault("PGOPTIONS", f"-c search_path={TEST_SCHEMA}")
+
+
+@pytest.fixture
+def database():
+    """A connection to an empty test schema (skips without one)."""
+    if not os.environ.get("PGDATABASE"):
+        pytest.skip("PGDATABASE is not set: no scratch database to use")
+    psycopg2 = pytest.importorskip("psycopg2")
+
+    conn = psycopg2.connect("")
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {TEST_SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {TEST_SCHEMA}")
+    conn.commit()
+    yield conn
+    conn.rollback()
+    cur.execute(f"DROP SCHEMA IF EXISTS {TEST_SCHEMA} CASCADE")
+    conn.commit()
+    conn.close()
@@ -0,0 +1,51 @@
+import pytest
+
+pytest.importorskip("bcrypt")
+
+import hashing  # noqa: E402
+
+
+def test_cpus_are_split_between_server_processes(monkeypatch):
+    monkeypatch.delenv("BCRYPT_WORKERS", raising=False)
+    monkeypatch.setattr(hashing.os, "cpu_count", lambda: 8)
+
+    assert hashing.pool_from_env().workers == 8
+    assert hashing.pool_from_env(processes=4).workers == 2
+    assert hashing.pool_from_env(processes=16).workers == 1
+
+
+def test_bcrypt_workers_overrides_the_split(monkeypatch):
+    monkeypatch.setenv("BCRYPT_WORKERS", "3")
+
+    assert hashing.pool_from_env(processes=4).workers == 3
+
+
+def test_hashes_are_checked_in_the_worker_processes():
+    pool = hashing.HashingPool(1, rounds=4)
+
+    hashed = pool.hash_password("s3cret")
+
+    assert hashing.hash_rounds(hashed) == 4
+    assert pool.check_password("s3cret", hashed)
+    assert not pool.check_password("wrong", hashed)
+    assert pool.stats()["hashes"] == 1
+    assert pool.stats()["checks"] == 2
+    assert pool.stats()["pending"] == 0
+
+
+def test_hashes_of_another_cost_need_rehashing():
+    hashed = hashing.HashingPool(1, rounds=4).hash_password("s3cret")
+
+    assert not hashing.HashingPool(1, rounds=4).needs_rehash(hashed)
+    assert hashing.HashingPool(1, rounds=5).needs_rehash(hashed)
+
+
+def test_a_full_queue_fails_fast():
+    pool = hashing.HashingPool(1, rounds=4, max_pending=1)
+    pool._slots.acquire()  # a hash already in flight
+
+    with pytest.raises(hashing.HashQueueFull) as raised:
+        pool.hash_password("s3cret")
+
+    assert raised.value.retry_after >= 1
+    assert pool.stats()["rejected"] == 1
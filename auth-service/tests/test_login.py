@@ -0,0 +1,76 @@
+import base64
+
+import pytest
+
+pytest.importorskip("bcrypt")
+
+import hashing  # noqa: E402
+
+
+@pytest.fixture
+def client(database, monkeypatch):
+    """A test client of the auth app, on a migrated test schema."""
+    import auth
+    from tokens import LEGACY_KID, KeyRing
+
+    assert auth.initialize_schema()
+    monkeypatch.setattr(auth, "hashing_pool", hashing.HashingPool(1, rounds=4))
+    monkeypatch.setattr(auth, "jwt_keys",
+                        KeyRing({LEGACY_KID: "k" * 32}, LEGACY_KID))
+    yield auth.app.test_client()
+    auth.db_pool.closeall()
+
+
+def register(client, username="ada", password="s3cret"):
+    return client.post("/auth/register",
+                       json={"username": username, "password": password})
+
+
+def login(client, username="ada", password="s3cret"):
+    return client.post("/auth/login",
+                       json={"username": username, "password": password})
+
+
+def stored_hash(database, username="ada"):
+    cur = database.cursor()
+    cur.execute("SELECT password FROM users WHERE username = %s",
+                (username,))
+    encoded_hash = cur.fetchone()[0]
+    database.rollback()
+    return base64.b64decode(encoded_hash)
+
+
+def test_login_checks_the_password(client):
+    assert register(client).status_code == 201
+
+    assert login(client).status_code == 200
+    assert "token" in login(client).get_json()
+    assert login(client, password="wrong").status_code == 401
+    assert login(client, username="bob").status_code == 404
+
+
+def test_login_upgrades_hashes_of_another_cost(client, database,
+                                               monkeypatch):
+    import auth
+
+    register(client)
+    monkeypatch.setattr(auth, "hashing_pool", hashing.HashingPool(1, rounds=5))
+
+    assert login(client).status_code == 200
+    assert hashing.hash_rounds(stored_hash(database)) == 5
+    assert auth.hashing_pool.stats()["rehashes"] == 1
+    assert login(client).status_code == 200
+
+
+def test_login_is_turned_away_while_the_queue_is_full(client, monkeypatch):
+    import auth
+
+    register(client)
+    pool = hashing.HashingPool(1, rounds=4, max_pending=1)
+    monkeypatch.setattr(auth, "hashing_pool", pool)
+    pool._slots.acquire()  # a hash already in flight
+
+    response = login(client)
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+import schema
+from migrations import Migration, current_version, run_migrations
+
+
+def test_migrations_apply_once(database):
+    assert run_migrations(database, schema.COMPONENT, schema.MIGRATIONS) \
+        == [1]
+    assert run_migrations(database, schema.COMPONENT, schema.MIGRATIONS) \
+        == []
+    cur = database.cursor()
+    assert current_version(cur, schema.COMPONENT) == 1
+    # Versions are tracked per service sharing the table
+    assert current_version(cur, "catalogue") == 0
+
+
+def test_existing_schema_is_adopted(database):
+    # Tables created before versioning existed
+    database.cursor().execute(schema.MIGRATIONS[0].apply[0])
+    database.commit()
+
+    assert run_migrations(database, schema.COMPONENT, schema.MIGRATIONS) \
+        == [1]
+
+
+def test_failed_migration_is_not_recorded(database):
+    broken = [Migration(1, "broken", ["CREATE TABLE broken (id nope)"])]
+
+    with pytest.raises(Exception):
+        run_migrations(database, schema.COMPONENT, broken)
+    assert current_version(database.cursor(), schema.COMPONENT) == 0
+
+
+def test_concurrent_runs_apply_each_migration_once(database):
+    import psycopg2
+
+    applied = []
+    slow = [Migration(1, "slow", ["SELECT pg_sleep(0.2)",
+                                  "CREATE TABLE once (id INT)"])]
+
+    def run():
+        conn = psycopg2.connect("")
+        try:
+            applied.append(run_migrations(conn, "test", slow))
+        finally:
+            conn.close()
+
+    runs = [threading.Thread(target=run) for _ in range(2)]
+    for run in runs:
+        run.start()
+    for run in runs:
+        run.join()
+
+    assert sorted(applied) == [[], [1]]
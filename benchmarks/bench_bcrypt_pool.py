@@ -0,0 +1,80 @@
+"""
+Benchmark login throughput (bcrypt checks/sec) against hashing worker count.
+
+Drives the auth service's HashingPool directly, with --concurrency request
+threads each verifying a password, for every worker count in --workers.
+No database is needed: the database part of a login is not CPU-bound.
+
+    python benchmarks/bench_bcrypt_pool.py --workers 1,2,4,8 --out bcrypt.json
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+import bcrypt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "auth-service"))
+from hashing import HashingPool, HashQueueFull  # noqa: E402
+
+PASSWORD = "correct horse battery staple"
+
+
+def run(workers, rounds, logins, concurrency):
+    pool = HashingPool(workers, rounds=rounds, max_pending=concurrency)
+    hashed = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt(rounds))
+    # Warm the worker processes up so their start-up is not measured
+    pool.check_password(PASSWORD, hashed)
+
+    def login(_):
+        try:
+            return pool.check_password(PASSWORD, hashed)
+        except HashQueueFull:
+            return None
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as threads:
+        results = list(threads.map(login, range(logins)))
+    elapsed = time.perf_counter() - started
+
+    ok = sum(1 for result in results if result)
+    return {
+        "workers": workers,
+        "logins": logins,
+        "succeeded": ok,
+        "rejected": sum(1 for result in results if result is None),
+        "elapsed_seconds": round(elapsed, 3),
+        "logins_per_second": round(ok / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", default="1,2,4,8",
+                        help="comma-separated worker counts to compare")
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--out", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {
+        "rounds": args.rounds,
+        "concurrency": args.concurrency,
+        "cpu_count": os.cpu_count(),
+        "results": [
+            run(int(workers), args.rounds, args.logins, args.concurrency)
+            for workers in args.workers.split(",")
+        ],
+    }
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark JSON encoding of large movie lists and the cost of each proxy hop.
+
+Encodes --rows synthetic (name, genre, year, id) rows the way the
+catalogue used to (per-row dicts + json.dumps, as jsonify does) and with
+the movie_json encoders, then times what each proxy hop (auth, api) costs
+when it decodes and re-encodes the body versus forwarding the bytes as-is.
+No database or running service is needed.
+
+    python benchmarks/bench_json.py --rows 1000,10000,100000 --out json.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "catalogue-service")
+)
+import movie_json  # noqa: E402
+from fastjson import envelope_prefix, orjson  # noqa: E402
+
+GENRES = ["Drama", "Comedy", "Action", "Horror", "Sci-Fi", "Documentary"]
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return round(statistics.median(samples) * 1000, 3)
+
+
+def encoders(rows):
+    def dicts_stdlib():
+        return json.dumps({
+            "movies": [
+                {"name": row[0], "genre": row[1], "year": row[2]}
+                for row in rows
+            ],
+            "next_cursor": None,
+        }).encode("utf-8")
+
+    def template():
+        saved, movie_json.orjson = movie_json.orjson, None
+        try:
+            return movie_json.encode_movie_page(rows, None)
+        finally:
+            movie_json.orjson = saved
+
+    cases = {"dicts_stdlib": dicts_stdlib, "rows_template": template}
+    if orjson is not None:
+        cases["dicts_orjson"] = lambda: movie_json.encode_movie_page(
+            rows, None
+        )
+    return cases
+
+
+def hops(body):
+    # One proxy hop: what auth and api each do with the catalogue's body
+    cases = {
+        "reencode_stdlib": lambda: json.dumps(json.loads(body)).encode(),
+        "passthrough": lambda: body,
+        # As the proxies nest a streamed body in an envelope
+        "passthrough_wrapped": lambda: envelope_prefix(
+            {"message": "Token is valid"}, "movies"
+        ) + body + b"}",
+    }
+    if orjson is not None:
+        cases["reencode_orjson"] = lambda: orjson.dumps(orjson.loads(body))
+    return cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", default="1000,10000,100000",
+                        help="comma-separated list sizes")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--out", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {"orjson": orjson is not None, "results": []}
+    for size in [int(value) for value in args.rows.split(",")]:
+        rows = [
+            (f"Movie {i}", GENRES[i % len(GENRES)], 1950 + i % 75, i)
+            for i in range(size)
+        ]
+        body = movie_json.encode_movie_page(rows, None)
+        result = {
+            "rows": size,
+            "body_bytes": len(body),
+            "encode_ms": {
+                name: timed(case, args.repeat)
+                for name, case in encoders(rows).items()
+            },
+            "hop_ms": {
+                name: timed(case, args.repeat)
+                for name, case in hops(body).items()
+            },
+        }
+        report["results"].append(result)
+        print(json.dumps(result))
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
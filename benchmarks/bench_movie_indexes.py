@@ -0,0 +1,167 @@
+"""
+Benchmark movie list/delete latency before and after the catalogue index
+migrations.
+
+Seeds a throwaway schema with --rows movies spread over --users users,
+then times the catalogue's list query and delete path with only the base
+table (migration 1) and again after the index migrations (2-4) have run,
+on the denormalized movies table they were written for.
+Connection settings come from the usual PGHOST/PGUSER/PGPASSWORD/
+PGDATABASE variables; point them at a scratch database.
+
+    python benchmarks/bench_movie_indexes.py --rows 1000000 --out idx.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import psycopg2
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "catalogue-service")
+)
+from migrations import run_migrations  # noqa: E402
+import schema  # noqa: E402
+
+BENCH_SCHEMA = "bench_movie_indexes"
+GENRES = ["Drama", "Comedy", "Action", "Horror", "Sci-Fi", "Documentary"]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "samples": len(samples),
+        "mean_ms": statistics.mean(samples) * 1000,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+
+def seed(conn, rows, users):
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO movies (user_id, name, genre, year)
+        SELECT (i %% %s) + 1,
+               'Movie ' || i,
+               (%s::text[])[(i %% %s) + 1],
+               1950 + (i %% 75)
+        FROM generate_series(1, %s) AS i
+        """,
+        (users, GENRES, len(GENRES), rows)
+    )
+    cur.execute("ANALYZE movies")
+    conn.commit()
+    cur.close()
+
+
+def time_list(conn, users, iterations):
+    cur = conn.cursor()
+    samples = []
+    for _ in range(iterations):
+        user_id = random.randint(1, users)
+        started = time.perf_counter()
+        cur.execute(
+            "SELECT name, genre, year FROM movies WHERE user_id = %s",
+            (user_id,)
+        )
+        cur.fetchall()
+        samples.append(time.perf_counter() - started)
+    conn.rollback()
+    cur.close()
+    return summarize(samples)
+
+
+def time_delete(conn, rows, users, iterations):
+    # Same statement as the catalogue DELETE path, rolled back each time so
+    # every iteration sees the full table
+    cur = conn.cursor()
+    samples = []
+    for _ in range(iterations):
+        i = random.randint(1, rows)
+        params = ("Movie %d" % i, 1950 + i % 75, i % users + 1)
+        started = time.perf_counter()
+        cur.execute(
+            "DELETE FROM movies "
+            "WHERE name = %s AND year = %s AND user_id = %s "
+            "RETURNING id, name, genre, year",
+            params
+        )
+        cur.fetchall()
+        samples.append(time.perf_counter() - started)
+        conn.rollback()
+    cur.close()
+    return summarize(samples)
+
+
+def measure(conn, args):
+    return {
+        "list": time_list(conn, args.users, args.iterations),
+        "delete": time_delete(conn, args.rows, args.users, args.iterations),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--out", help="write the JSON report to this file")
+    parser.add_argument("--keep", action="store_true",
+                        help="keep the benchmark schema afterwards")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect("")
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+    cur.execute(f"SET search_path TO {BENCH_SCHEMA}")
+    conn.commit()
+    cur.close()
+
+    try:
+        base = schema.MIGRATIONS[:1]
+        indexes = [m for m in schema.MIGRATIONS if m.version <= 4]
+        run_migrations(conn, schema.COMPONENT, base)
+        seed(conn, args.rows, args.users)
+        before = measure(conn, args)
+
+        run_migrations(conn, schema.COMPONENT, indexes)
+        cur = conn.cursor()
+        cur.execute("ANALYZE movies")
+        conn.commit()
+        cur.close()
+        after = measure(conn, args)
+    finally:
+        if not args.keep:
+            cur = conn.cursor()
+            cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+            conn.commit()
+            cur.close()
+        conn.close()
+
+    report = {
+        "rows": args.rows,
+        "users": args.users,
+        "before_indexes": before,
+        "after_indexes": after,
+    }
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
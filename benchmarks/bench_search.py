@@ -0,0 +1,276 @@
+"""
+Benchmark movie search latency at 1M movies, per search mode.
+
+Seeds a throwaway schema with --rows movies (names drawn from a fixed
+vocabulary, --titles distinct ones) spread over --users users in the
+original one-table layout. Then runs the remaining catalogue migrations,
+timing the conversion to shared titles and genres and comparing the
+tables' size before and after it (once `VACUUM FULL` has reclaimed the
+dropped columns). It then times the catalogue's prefix, full-text and
+trigram search queries for random users and terms. The same searches are
+timed again without the search indexes, next to the old client-side
+alternative of downloading the user's whole list and filtering it.
+Connection settings come from the usual PGHOST/PGUSER/PGPASSWORD/
+PGDATABASE variables; point them at a scratch database.
+
+    python benchmarks/bench_search.py --rows 1000000 --out search.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import psycopg2
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(__file__), "..", "catalogue-service")
+)
+from migrations import run_migrations  # noqa: E402
+import schema  # noqa: E402
+from movie_store import MOVIE_FROM  # noqa: E402
+from search import (  # noqa: E402
+    build_search_sql, parse_search_query, prepare_search
+)
+
+BENCH_SCHEMA = "bench_search"
+GENRES = ["Drama", "Comedy", "Action", "Horror", "Sci-Fi", "Documentary"]
+WORDS = [
+    "silent", "crimson", "midnight", "river", "empire", "shadow", "summer",
+    "garden", "stranger", "winter", "station", "harbor", "golden", "lost",
+    "city", "dream", "journey", "forest", "echo", "mirror", "storm", "night",
+    "island", "paper", "glass", "signal", "orchard", "thunder", "velvet",
+    "wild", "falcon", "horizon", "lantern", "ocean", "secret", "hollow",
+    "silver", "kingdom", "distant", "morning",
+]
+STORAGE_TABLES = ("movies", "titles", "genres")
+SEARCH_INDEXES = ("movies_user_name_tsv_idx", "movies_user_name_trgm_idx",
+                  "movies_user_lower_name_idx")
+# Last migration of the one-table layout the benchmark seeds
+SEED_MIGRATION = 6
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "samples": len(samples),
+        "mean_ms": statistics.mean(samples) * 1000,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+
+def seed(conn, rows, users, titles):
+    # Movie i is the user's j-th, j = i / users, and is title k: each
+    # user's j are distinct and fewer than `titles`, so no user owns a
+    # title twice, while the users' lists overlap once titles < rows.
+    # Three vocabulary words per name, picked by different strides of k.
+    # Returns the number of titles, at least one per movie of a user.
+    per_user = rows // users + 1
+    titles = max(titles, per_user)
+    cur = conn.cursor()
+    cur.execute(
+        """
+        INSERT INTO movies (user_id, name, genre, year)
+        SELECT (i %% %s) + 1,
+               initcap((%s::text[])[(k %% %s) + 1] || ' '
+                       || (%s::text[])[((k / 7) %% %s) + 1] || ' '
+                       || (%s::text[])[((k / 53) %% %s) + 1]) || ' ' || k,
+               (%s::text[])[(i %% %s) + 1],
+               1950 + (k %% 75)
+        FROM generate_series(1, %s) AS i,
+             LATERAL (SELECT ((i / %s) + (i %% %s) * %s) %% %s AS k) AS title
+        """,
+        (users, WORDS, len(WORDS), WORDS, len(WORDS), WORDS, len(WORDS),
+         GENRES, len(GENRES), rows, users, users, per_user, titles)
+    )
+    cur.execute("ANALYZE movies")
+    conn.commit()
+    cur.close()
+    return titles
+
+
+def storage(conn):
+    # Heap (with TOAST) and index bytes of each table that exists yet
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT c.relname, pg_table_size(c.oid), pg_indexes_size(c.oid)
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relname = ANY(%s)
+        """,
+        (BENCH_SCHEMA, list(STORAGE_TABLES))
+    )
+    tables = {
+        name: {"table_bytes": heap, "index_bytes": indexes}
+        for name, heap, indexes in cur.fetchall()
+    }
+    conn.rollback()
+    cur.close()
+    tables["total_bytes"] = sum(
+        table["table_bytes"] + table["index_bytes"]
+        for table in tables.values()
+    )
+    return tables
+
+
+def vacuum_full(conn, tables):
+    # VACUUM cannot run inside a transaction block
+    conn.autocommit = True
+    try:
+        cur = conn.cursor()
+        cur.execute(f"VACUUM FULL {tables}")
+        cur.close()
+    finally:
+        conn.autocommit = False
+
+
+def search_term(mode):
+    word = random.choice(WORDS)
+    if mode == "prefix":
+        return word[:4]
+    if mode == "trigram":
+        # One dropped letter: the typo trigram search is there to forgive
+        cut = random.randint(1, len(word) - 2)
+        return word[:cut] + word[cut + 1:]
+    return word
+
+
+def time_search(conn, mode, users, iterations, limit):
+    cur = conn.cursor()
+    samples = []
+    matches = []
+    for _ in range(iterations):
+        user_id = random.randint(1, users)
+        query = parse_search_query(
+            {"q": search_term(mode), "mode": mode, "limit": str(limit)}
+        )
+        started = time.perf_counter()
+        prepare_search(cur, query)
+        sql, params = build_search_sql(user_id, query)
+        cur.execute(sql, params)
+        matches.append(len(cur.fetchall()))
+        samples.append(time.perf_counter() - started)
+        conn.rollback()
+    cur.close()
+    result = summarize(samples)
+    result["mean_results"] = statistics.mean(matches)
+    return result
+
+
+def time_client_filter(conn, users, iterations):
+    # What clients did before: fetch the whole list, filter it locally
+    cur = conn.cursor()
+    samples = []
+    for _ in range(iterations):
+        user_id = random.randint(1, users)
+        word = random.choice(WORDS)
+        started = time.perf_counter()
+        cur.execute(
+            f"SELECT t.name, g.name, t.year FROM {MOVIE_FROM} "
+            "WHERE m.user_id = %s",
+            (user_id,)
+        )
+        [row for row in cur.fetchall() if word in row[0].lower()]
+        samples.append(time.perf_counter() - started)
+    conn.rollback()
+    cur.close()
+    return summarize(samples)
+
+
+def measure(conn, args):
+    return {
+        mode: time_search(conn, mode, args.users, args.iterations, args.limit)
+        for mode in ("prefix", "fulltext", "trigram")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=100,
+                        help="movies are spread over this many users")
+    parser.add_argument("--titles", type=int, default=100000,
+                        help="distinct (name, year) titles the movies "
+                             "share; --rows gives every movie its own")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20,
+                        help="page size of each search")
+    parser.add_argument("--out", help="write the JSON report to this file")
+    parser.add_argument("--keep", action="store_true",
+                        help="keep the benchmark schema afterwards")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect("")
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+    # public stays on the path for the pg_trgm/btree_gin functions
+    cur.execute(f"SET search_path TO {BENCH_SCHEMA}, public")
+    conn.commit()
+    cur.close()
+
+    try:
+        run_migrations(conn, schema.COMPONENT, [
+            m for m in schema.MIGRATIONS if m.version <= SEED_MIGRATION
+        ])
+        titles = seed(conn, args.rows, args.users, args.titles)
+        storage_before = storage(conn)
+        started = time.perf_counter()
+        run_migrations(conn, schema.COMPONENT, schema.MIGRATIONS)
+        conversion_seconds = time.perf_counter() - started
+        # As the README advises after migrations 9 and 10
+        vacuum_full(conn, "movies, titles")
+        storage_after = storage(conn)
+        cur = conn.cursor()
+        cur.execute("ANALYZE titles")
+        cur.execute("ANALYZE movies")
+        conn.commit()
+        cur.close()
+        indexed = measure(conn, args)
+        client_filter = time_client_filter(conn, args.users, args.iterations)
+
+        cur = conn.cursor()
+        for index in SEARCH_INDEXES:
+            cur.execute(f"DROP INDEX {index}")
+        cur.execute("ANALYZE movies")
+        conn.commit()
+        cur.close()
+        unindexed = measure(conn, args)
+    finally:
+        if not args.keep:
+            cur = conn.cursor()
+            cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+            conn.commit()
+            cur.close()
+        conn.close()
+
+    report = {
+        "rows": args.rows,
+        "users": args.users,
+        "titles": titles,
+        "limit": args.limit,
+        "conversion_seconds": round(conversion_seconds, 3),
+        "storage_before_conversion": storage_before,
+        "storage_after_conversion": storage_after,
+        "search": indexed,
+        "search_without_indexes": unindexed,
+        "client_side_filter": client_filter,
+    }
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
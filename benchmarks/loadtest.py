@@ -0,0 +1,480 @@
+"""
+Load-test the full api -> auth -> catalogue request chain.
+
+`run` starts the three services locally (against a scratch database it
+creates and drops), registers --users users with --movies movies each,
+then drives a weighted register/login/list/add/delete mix from
+--concurrency threads for --duration seconds. It reports latency
+percentiles and throughput per route, plus per-hop timings taken from the
+services' trace spans, and saves everything as JSON. `compare` diffs two
+such reports, e.g. from two commits, and fails on regressions.
+
+Connection settings come from the usual PGHOST/PGUSER/PGPASSWORD variables;
+PGDATABASE is only used to create the scratch database. Other service
+settings (WEB_WORKERS, DB_POOL_MAX, ...) are passed through from the
+environment. Every simulated client comes from 127.0.0.1, so the api's
+per-IP rate limits would throttle the run after a handful of logins: the
+started stack runs with RATE_LIMIT_ENABLED=0 unless --rate-limit is
+given. A stack loaded through --api-url must be started that way too.
+
+    python benchmarks/loadtest.py run --users 50 --movies 200 --out a.json
+    python benchmarks/loadtest.py compare a.json b.json --threshold 10
+"""
+import argparse
+import collections
+import concurrent.futures
+import datetime
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import psycopg2
+import requests
+
+from trace_collector import summarize as summarize_traces
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SERVICES = (
+    # (name, directory, script, port)
+    ("catalogue", "catalogue-service", "catalogue.py", 5001),
+    ("auth", "auth-service", "auth.py", 5000),
+    ("api", "api-service", "api.py", 8080),
+)
+GENRES = ["Drama", "Comedy", "Action", "Horror", "Sci-Fi", "Documentary"]
+DEFAULT_MIX = "register=1,login=2,list=10,add=3,delete=3"
+PASSWORD = "loadtest-password"
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples, errors, elapsed):
+    if not samples:
+        return {"requests": 0, "errors": errors}
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "throughput_rps": round(len(samples) / elapsed, 1),
+        "mean_ms": round(statistics.mean(samples) * 1000, 2),
+        "p50_ms": round(percentile(samples, 50) * 1000, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000, 2),
+    }
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("register", "login", "list", "add", "delete"):
+            raise argparse.ArgumentTypeError(f"Unknown operation: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class ScratchDatabase:
+    """A database created for one run and dropped afterwards."""
+
+    def __init__(self, keep=False):
+        self.name = "loadtest_%d_%d" % (os.getpid(), int(time.time()))
+        self.keep = keep
+
+    def _admin(self):
+        conn = psycopg2.connect(
+            dbname=os.environ.get("PGDATABASE", "postgres")
+        )
+        conn.autocommit = True
+        return conn
+
+    def __enter__(self):
+        conn = self._admin()
+        conn.cursor().execute(f'CREATE DATABASE "{self.name}"')
+        conn.close()
+        return self
+
+    def __exit__(self, *exc):
+        if self.keep:
+            print(f"Keeping database {self.name}", file=sys.stderr)
+            return
+        conn = self._admin()
+        conn.cursor().execute(f'DROP DATABASE IF EXISTS "{self.name}"')
+        conn.close()
+
+
+class Stack:
+    """The three services running as local processes."""
+
+    def __init__(self, database, workdir, bcrypt_rounds, rate_limit=False):
+        self.database = database
+        self.workdir = workdir
+        self.bcrypt_rounds = bcrypt_rounds
+        self.rate_limit = rate_limit
+        self.processes = []
+        self.trace_files = []
+
+    def env(self, name):
+        # Each service's gunicorn workers share a metrics directory
+        metrics_dir = os.path.join(self.workdir, f"metrics-{name}")
+        os.makedirs(metrics_dir, exist_ok=True)
+        env = dict(os.environ)
+        env.update({
+            "PGDATABASE": self.database,
+            "PROMETHEUS_MULTIPROC_DIR": metrics_dir,
+            "AUTH_SERVICE_URL": "http://127.0.0.1:5000",
+            "CATALOGUE_SERVICE_URL": "http://127.0.0.1:5001",
+            "TRACE_EXPORTER": "file",
+            "TRACE_FILE": os.path.join(self.workdir, f"traces-{name}.jsonl"),
+            "LOG_LEVEL": env.get("LOG_LEVEL", "WARNING"),
+        })
+        env.setdefault("SERVE_MODE", "production")
+        if self.bcrypt_rounds:
+            env["BCRYPT_ROUNDS"] = str(self.bcrypt_rounds)
+        if not self.rate_limit:
+            env["RATE_LIMIT_ENABLED"] = "0"
+        return env
+
+    def __enter__(self):
+        try:
+            self.start()
+        except BaseException:
+            self.__exit__()
+            raise
+        return self
+
+    def start(self):
+        for name, directory, script, port in SERVICES:
+            log = open(os.path.join(self.workdir, f"{name}.log"), "w")
+            self.processes.append(subprocess.Popen(
+                [sys.executable, script],
+                cwd=os.path.join(ROOT, directory),
+                env=self.env(name),
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            ))
+            self.trace_files.append(
+                os.path.join(self.workdir, f"traces-{name}.jsonl")
+            )
+            wait_until_ready(f"http://127.0.0.1:{port}/metrics", name)
+
+    def __exit__(self, *exc):
+        # Give the trace exporters a flush interval before shutting down
+        time.sleep(2)
+        for process in reversed(self.processes):
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def wait_until_ready(url, name, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{name} did not become ready at {url}")
+
+
+def seed(api_url, prefix, users, movies, concurrency):
+    """Register and log in `users` users and bulk-import their movies."""
+    def seed_user(index):
+        session = requests.Session()
+        credentials = {"username": f"{prefix}-{index}", "password": PASSWORD}
+        session.post(f"{api_url}/api/register", json=credentials)
+        response = session.post(f"{api_url}/api/login", json=credentials)
+        if response.status_code == 429:
+            raise RuntimeError(
+                "Seeding was rate limited: run the stack with "
+                "RATE_LIMIT_ENABLED=0 (or higher RATE_LIMIT_* budgets)"
+            )
+        response.raise_for_status()
+        token = response.json()["token"]
+        body = "".join(
+            json.dumps({
+                "name": f"Movie {index}-{n}",
+                "genre": GENRES[n % len(GENRES)],
+                "year": 1950 + n % 75,
+            }) + "\n"
+            for n in range(movies)
+        )
+        if movies:
+            response = session.post(
+                f"{api_url}/api/movies/bulk",
+                data=body.encode("utf-8"),
+                headers={"Authorization": token,
+                         "Content-Type": "application/x-ndjson"},
+            )
+            response.raise_for_status()
+        return credentials, token
+
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(seed_user, range(users)))
+
+
+class Worker(threading.Thread):
+    """One simulated client issuing weighted operations until `deadline`."""
+
+    def __init__(self, index, api_url, users, mix, deadline, prefix):
+        super().__init__(daemon=True)
+        self.index = index
+        self.api_url = api_url
+        self.users = users
+        self.operations = list(mix)
+        self.weights = [mix[name] for name in self.operations]
+        self.deadline = deadline
+        self.prefix = prefix
+        self.session = requests.Session()
+        self.samples = collections.defaultdict(list)
+        self.errors = collections.Counter()
+        self.added = []
+        self.counter = 0
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            operation = random.choices(self.operations, self.weights)[0]
+            if operation == "delete" and not self.added:
+                operation = "add"
+            started = time.perf_counter()
+            try:
+                ok = getattr(self, operation)()
+            except requests.exceptions.RequestException:
+                ok = False
+            self.samples[operation].append(time.perf_counter() - started)
+            if not ok:
+                self.errors[operation] += 1
+
+    def _user(self):
+        return random.choice(self.users)
+
+    def register(self):
+        self.counter += 1
+        response = self.session.post(f"{self.api_url}/api/register", json={
+            "username": f"{self.prefix}-w{self.index}-{self.counter}",
+            "password": PASSWORD,
+        })
+        return response.status_code == 201
+
+    def login(self):
+        credentials, _ = self._user()
+        response = self.session.post(
+            f"{self.api_url}/api/login", json=credentials
+        )
+        return response.status_code == 200
+
+    def list(self):
+        _, token = self._user()
+        response = self.session.get(
+            f"{self.api_url}/api/movies", headers={"Authorization": token}
+        )
+        return response.status_code == 200
+
+    def add(self):
+        self.counter += 1
+        _, token = self._user()
+        movie = {
+            "name": f"Load {self.index}-{self.counter}",
+            "genre": random.choice(GENRES),
+            "year": random.randint(1950, 2024),
+        }
+        response = self.session.post(
+            f"{self.api_url}/api/movies", json=movie,
+            headers={"Authorization": token}
+        )
+        if response.status_code == 201:
+            self.added.append((token, movie))
+            return True
+        return False
+
+    def delete(self):
+        token, movie = self.added.pop()
+        response = self.session.delete(
+            f"{self.api_url}/api/movies",
+            json={"name": movie["name"], "year": movie["year"]},
+            headers={"Authorization": token}
+        )
+        return response.status_code == 200
+
+
+def drive(api_url, users, mix, concurrency, duration, prefix):
+    deadline = time.monotonic() + duration
+    workers = [
+        Worker(index, api_url, users, mix, deadline, prefix)
+        for index in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    samples = collections.defaultdict(list)
+    errors = collections.Counter()
+    for worker in workers:
+        for operation, values in worker.samples.items():
+            samples[operation].extend(values)
+        errors.update(worker.errors)
+
+    routes = {
+        operation: summarize(values, errors[operation], elapsed)
+        for operation, values in sorted(samples.items())
+    }
+    every = [value for values in samples.values() for value in values]
+    return routes, summarize(every, sum(errors.values()), elapsed)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    prefix = "lt%d" % int(time.time())
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.datetime.now(
+            datetime.timezone.utc
+        ).isoformat(),
+        "settings": {
+            "users": args.users,
+            "movies_per_user": args.movies,
+            "concurrency": args.concurrency,
+            "duration_seconds": args.duration,
+            "mix": args.mix,
+            "rate_limit": args.rate_limit,
+        },
+    }
+    try:
+        if args.api_url:
+            # Existing stack: no scratch database and no per-hop traces
+            users = seed(args.api_url, prefix, args.users, args.movies,
+                         args.concurrency)
+            routes, total = drive(args.api_url, users, args.mix,
+                                  args.concurrency, args.duration, prefix)
+        else:
+            api_url = "http://127.0.0.1:8080"
+            with ScratchDatabase(keep=args.keep_db) as database, \
+                    Stack(database.name, workdir, args.bcrypt_rounds,
+                          args.rate_limit) as stack:
+                users = seed(api_url, prefix, args.users, args.movies,
+                             args.concurrency)
+                # Only the measured phase belongs in the hop breakdown
+                for path in stack.trace_files:
+                    open(path, "w").close()
+                routes, total = drive(api_url, users, args.mix,
+                                      args.concurrency, args.duration, prefix)
+            report["hops"] = summarize_traces(
+                [path for path in stack.trace_files if os.path.exists(path)]
+            )["hops"]
+        report["routes"] = routes
+        report["total"] = total
+    finally:
+        if args.keep_logs:
+            print(f"Service logs and traces kept in {workdir}",
+                  file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    for operation, stats in report["routes"].items():
+        print(f"{operation:<10} {json.dumps(stats)}")
+    print(f"{'total':<10} {json.dumps(report['total'])}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(f"{baseline.get('commit')} -> {candidate.get('commit')}")
+    regressions = []
+    routes = sorted(set(baseline["routes"]) | set(candidate["routes"]))
+    for route in routes + ["total"]:
+        if route == "total":
+            before, after = baseline["total"], candidate["total"]
+        else:
+            before = baseline["routes"].get(route, {})
+            after = candidate["routes"].get(route, {})
+        cells = []
+        for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            if key not in before or key not in after or not before[key]:
+                cells.append(f"{key}=n/a")
+                continue
+            change = (after[key] - before[key]) / before[key] * 100
+            cells.append(f"{key}={before[key]}->{after[key]} ({change:+.1f}%)")
+            worse = -change if key == "throughput_rps" else change
+            if key in ("p95_ms", "throughput_rps") and \
+                    worse > args.threshold:
+                regressions.append(f"{route} {key} {change:+.1f}%")
+        print(f"{route:<10} " + "  ".join(cells))
+
+    if regressions:
+        print("Regressions over %.0f%%: %s"
+              % (args.threshold, ", ".join(regressions)))
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--users", type=int, default=50)
+    run_parser.add_argument("--movies", type=int, default=200,
+                            help="movies seeded per user")
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--duration", type=float, default=30,
+                            help="seconds of measured load")
+    run_parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                            help="operation weights, e.g. %s" % DEFAULT_MIX)
+    run_parser.add_argument("--bcrypt-rounds", type=int,
+                            help="override BCRYPT_ROUNDS for the run")
+    run_parser.add_argument("--rate-limit", action="store_true",
+                            help="keep the api's rate limiter on")
+    run_parser.add_argument("--api-url",
+                            help="load an already running stack instead")
+    run_parser.add_argument("--keep-db", action="store_true")
+    run_parser.add_argument("--keep-logs", action="store_true")
+    run_parser.add_argument("--out", help="write the JSON report to this file")
+
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=10,
+                                help="percent p95/throughput change that "
+                                     "counts as a regression")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        if isinstance(args.mix, str):
+            args.mix = parse_mix(args.mix)
+        run(args)
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# The benchmarks import each other as top-level modules
+sys.path.insert(0, os.path.dirname(HERE))
@@ -0,0 +1,71 @@
+import argparse
+import json
+
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("requests")
+
+import loadtest  # noqa: E402
+
+
+def report(commit, p95_ms, throughput_rps):
+    stats = {"p50_ms": 1.0, "p95_ms": p95_ms, "p99_ms": p95_ms * 2,
+             "throughput_rps": throughput_rps}
+    return {"commit": commit, "routes": {"list": stats}, "total": stats}
+
+
+def compare(tmp_path, baseline, candidate, threshold=10):
+    paths = []
+    for name, data in (("a.json", baseline), ("b.json", candidate)):
+        path = tmp_path / name
+        path.write_text(json.dumps(data))
+        paths.append(str(path))
+    loadtest.compare(argparse.Namespace(
+        baseline=paths[0], candidate=paths[1], threshold=threshold
+    ))
+
+
+def test_percentiles_pick_the_nearest_rank():
+    samples = [float(n) for n in range(1, 101)]
+
+    assert loadtest.percentile(samples, 50) == 51.0
+    assert loadtest.percentile(samples, 99) == 99.0
+    assert loadtest.percentile([3.0], 95) == 3.0
+
+
+def test_summary_reports_milliseconds_and_throughput():
+    summary = loadtest.summarize([0.01, 0.02, 0.03, 0.04], 1, 2.0)
+
+    assert summary["requests"] == 4
+    assert summary["errors"] == 1
+    assert summary["throughput_rps"] == 2.0
+    assert summary["p50_ms"] == 30.0
+    assert summary["mean_ms"] == 25.0
+    assert loadtest.summarize([], 3, 1.0) == {"requests": 0, "errors": 3}
+
+
+def test_mix_weights_are_parsed():
+    assert loadtest.parse_mix("list=10,add") == {"list": 10.0, "add": 1.0}
+    with pytest.raises(argparse.ArgumentTypeError, match="Unknown"):
+        loadtest.parse_mix("list=10,upload=1")
+
+
+def test_compare_passes_within_the_threshold(tmp_path, capsys):
+    compare(tmp_path, report("a", 10.0, 100.0), report("b", 10.5, 96.0))
+
+    assert "p95_ms=10.0->10.5 (+5.0%)" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("p95_ms, throughput_rps", [
+    (12.0, 100.0),  # slower
+    (10.0, 80.0),   # less throughput
+])
+def test_compare_fails_on_regressions(tmp_path, capsys, p95_ms,
+                                      throughput_rps):
+    with pytest.raises(SystemExit) as exited:
+        compare(tmp_path, report("a", 10.0, 100.0),
+                report("b", p95_ms, throughput_rps))
+
+    assert exited.value.code == 1
+    assert "Regressions over 10%" in capsys.readouterr().out
@@ -0,0 +1,67 @@
+import io
+import json
+import os
+import sys
+import urllib.request
+
+import trace_collector
+
+# The services' tracing module, whose OTLP output the collector reads
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "..", "catalogue-service"))
+
+import tracing  # noqa: E402
+
+
+def exported(monkeypatch, spans):
+    # What OtlpHttpExporter POSTs for `spans`
+    sent = []
+
+    def urlopen(request, timeout):
+        sent.append(request)
+        return io.BytesIO(b"{}")
+
+    monkeypatch.setattr(urllib.request, "urlopen", urlopen)
+    tracing.OtlpHttpExporter("http://collector").export("api", spans)
+    return json.loads(sent[0].data)
+
+
+def span(tracer, name, parent=None, duration_ms=0, error=None):
+    started = tracer.start_span(name, kind="server", parent=parent)
+    tracer.end_span(started, error=error)
+    started.end_ns = started.start_ns + int(duration_ms * 1e6)
+    return started
+
+
+def test_otlp_spans_flatten_to_the_file_format(monkeypatch):
+    tracer = tracing.Tracer("api")
+    root = span(tracer, "GET /api/movies", duration_ms=5)
+    failed = span(tracer, "SELECT", parent=(root.trace_id, root.span_id,
+                                            True), error="boom")
+
+    flat = list(trace_collector.flatten(exported(monkeypatch,
+                                                 [root, failed])))
+
+    assert flat[0] == dict(root.to_dict("api"), attributes={})
+    assert flat[1]["parent_id"] == root.span_id
+    assert flat[1]["error"] == "boom"
+
+
+def test_summary_splits_self_time_from_child_time(tmp_path):
+    spans = [
+        {"service": "api", "trace_id": "t", "span_id": "a",
+         "parent_id": None, "name": "GET /api/movies", "duration_ms": 10.0},
+        {"service": "auth", "trace_id": "t", "span_id": "b",
+         "parent_id": "a", "name": "GET /auth/movies", "duration_ms": 8.0},
+    ]
+    path = tmp_path / "traces.jsonl"
+    path.write_text("".join(json.dumps(s) + "\n" for s in spans))
+
+    summary = trace_collector.summarize([str(path)])
+
+    assert summary["spans"] == 2
+    assert summary["traces"] == 1
+    hops = {hop["span"]: hop for hop in summary["hops"]}
+    assert hops["api: GET /api/movies"]["mean_self_ms"] == 2.0
+    assert hops["auth: GET /auth/movies"]["mean_self_ms"] == 8.0
+    assert summary["hops"][0]["span"] == "auth: GET /auth/movies"
@@ -0,0 +1,153 @@
+"""
+Stand-in OTLP/HTTP trace collector and per-hop latency summary.
+
+`serve` accepts the JSON spans the services export with TRACE_EXPORTER=otlp
+and appends them, flattened, to a JSON-lines file (the same format as
+TRACE_EXPORTER=file). `summary` reads one or more such files and reports,
+per span name, how much time was spent in the span itself (its duration
+minus its children's), which points at the slow hop.
+
+    python benchmarks/trace_collector.py serve --port 4318 --out traces.jsonl
+    python benchmarks/trace_collector.py summary traces.jsonl --out hops.json
+"""
+import argparse
+import collections
+import http.server
+import json
+import statistics
+import sys
+import threading
+
+KINDS = {1: "internal", 2: "server", 3: "client"}
+
+
+def flatten(body):
+    # OTLP/JSON resourceSpans -> the FileExporter's one-dict-per-span shape
+    for resource_spans in body.get("resourceSpans", []):
+        attributes = {
+            a["key"]: a["value"].get("stringValue")
+            for a in resource_spans.get("resource", {}).get("attributes", [])
+        }
+        service = attributes.get("service.name", "unknown")
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                start = int(span["startTimeUnixNano"])
+                end = int(span["endTimeUnixNano"])
+                status = span.get("status", {})
+                yield {
+                    "service": service,
+                    "trace_id": span["traceId"],
+                    "span_id": span["spanId"],
+                    "parent_id": span.get("parentSpanId") or None,
+                    "name": span["name"],
+                    "kind": KINDS.get(span.get("kind"), "internal"),
+                    "start_ns": start,
+                    "end_ns": end,
+                    "duration_ms": (end - start) / 1e6,
+                    "attributes": {
+                        a["key"]: a["value"].get("stringValue")
+                        for a in span.get("attributes", [])
+                    },
+                    "error": (status.get("message") or "error")
+                    if status.get("code") == 2 else None,
+                }
+
+
+def serve(port, out):
+    lock = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                body = json.loads(self.rfile.read(length))
+                spans = list(flatten(body))
+            except (ValueError, KeyError) as e:
+                self.send_error(400, str(e))
+                return
+            with lock, open(out, "a") as f:
+                for span in spans:
+                    f.write(json.dumps(span) + "\n")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    print(f"Collecting spans on :{port}/v1/traces into {out}", file=sys.stderr)
+    server.serve_forever()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(paths):
+    spans = []
+    for path in paths:
+        with open(path) as f:
+            spans.extend(json.loads(line) for line in f if line.strip())
+
+    child_time = collections.defaultdict(float)
+    for span in spans:
+        if span["parent_id"]:
+            child_time[span["parent_id"]] += span["duration_ms"]
+
+    by_name = collections.defaultdict(lambda: {"total": [], "self": []})
+    for span in spans:
+        key = f'{span["service"]}: {span["name"]}'
+        self_ms = max(0.0, span["duration_ms"] - child_time[span["span_id"]])
+        by_name[key]["total"].append(span["duration_ms"])
+        by_name[key]["self"].append(self_ms)
+
+    hops = []
+    for name, times in by_name.items():
+        hops.append({
+            "span": name,
+            "count": len(times["total"]),
+            "p50_ms": round(percentile(times["total"], 0.50), 2),
+            "p95_ms": round(percentile(times["total"], 0.95), 2),
+            "p99_ms": round(percentile(times["total"], 0.99), 2),
+            "mean_self_ms": round(statistics.mean(times["self"]), 2),
+            "total_self_ms": round(sum(times["self"]), 1),
+        })
+    hops.sort(key=lambda hop: hop["total_self_ms"], reverse=True)
+    return {
+        "spans": len(spans),
+        "traces": len({span["trace_id"] for span in spans}),
+        "hops": hops,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve")
+    serve_parser.add_argument("--port", type=int, default=4318)
+    serve_parser.add_argument("--out", default="traces.jsonl")
+    summary_parser = commands.add_parser("summary")
+    summary_parser.add_argument("files", nargs="+")
+    summary_parser.add_argument("--out",
+                                help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.port, args.out)
+        return
+
+    report = summarize(args.files)
+    for hop in report["hops"]:
+        print(f'{hop["span"]:<60} n={hop["count"]:<6} '
+              f'p50={hop["p50_ms"]:>8}ms p95={hop["p95_ms"]:>8}ms '
+              f'self={hop["mean_self_ms"]:>8}ms')
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Ordered add/delete operations on one user's movies, run inside the
+caller's transaction.
+
+Every operation's outcome is read from the RETURNING rows of its one
+write (adds use INSERT ... ON CONFLICT DO NOTHING), so a
+duplicate add or a delete of a missing movie becomes that operation's
+result instead of an error aborting the transaction, and no savepoints
+are needed. Invalid operations are reported without touching the
+database.
+"""
+from bulk_import import MAX_NAME_LENGTH, YEAR_ERROR, parse_year, validate_movie
+from movie_store import DELETE_MOVIE_SQL, insert_movie
+
+OPERATIONS = ("add", "delete")
+
+# Status of an operation that succeeded but was rolled back with its batch
+ROLLED_BACK = 424
+
+
+class InvalidBatch(ValueError):
+    """The request body is not a list of operations."""
+
+
+def parse_batch(data, max_operations):
+    """
+    Return (operations, atomic) from a {"operations": [...], "atomic":
+    bool} body, raising InvalidBatch if it cannot be run at all.
+    """
+    if not isinstance(data, dict):
+        raise InvalidBatch("Body must be a JSON object")
+    operations = data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        raise InvalidBatch("A non-empty list of operations is required")
+    if len(operations) > max_operations:
+        raise InvalidBatch(
+            f"At most {max_operations} operations are accepted per batch"
+        )
+    return operations, bool(data.get('atomic', False))
+
+
+def validate_key(operation):
+    """Return ((name, year), None) for a delete, or (None, error)."""
+    name, year = operation.get('name'), operation.get('year')
+    if not name or not isinstance(name, str) or len(name) > MAX_NAME_LENGTH:
+        return None, "name is required"
+    year = parse_year(year)
+    if year is None:
+        return None, YEAR_ERROR
+    return (name, year), None
+
+
+class MovieBatch:
+    """
+    Run operations for `user_id` on cursor `cur`, collecting one result
+    per operation. `format_movie` turns (id, name, genre, year) rows into
+    the response's movie objects.
+    """
+
+    def __init__(self, cur, user_id, format_movie):
+        self.cur = cur
+        self.user_id = user_id
+        self.format_movie = format_movie
+        self.results = []
+        self.applied = 0
+        self.failed = 0
+
+    def _result(self, index, op, status, **fields):
+        if status < 300:
+            self.applied += 1
+        else:
+            self.failed += 1
+        self.results.append(dict(index=index, op=op, status=status, **fields))
+
+    def run(self, index, operation):
+        op = operation.get('op') if isinstance(operation, dict) else None
+        if op not in OPERATIONS:
+            self._result(index, op, 400,
+                         error="op must be one of: " + ", ".join(OPERATIONS))
+        elif op == "add":
+            self.add(index, operation)
+        else:
+            self.delete(index, operation)
+
+    def add(self, index, operation):
+        movie, error = validate_movie(operation)
+        if error:
+            self._result(index, "add", 400, error=error)
+            return
+        row = insert_movie(self.cur, self.user_id, *movie,
+                           skip_existing=True)
+        if row is None:
+            self._result(index, "add", 409,
+                         error="Movie already exists in the user's list")
+        else:
+            self._result(index, "add", 201, movie=self.format_movie(row))
+
+    def delete(self, index, operation):
+        key, error = validate_key(operation)
+        if error:
+            self._result(index, "delete", 400, error=error)
+            return
+        self.cur.execute(DELETE_MOVIE_SQL, key + (self.user_id,))
+        deleted = self.cur.fetchall()
+        if not deleted:
+            self._result(index, "delete", 404, error="Movie not found")
+        else:
+            self._result(
+                index, "delete", 200,
+                deleted=[self.format_movie(row) for row in deleted]
+            )
+
+    def roll_back(self):
+        """
+        Report the batch as rolled back: operations that succeeded are
+        rewritten as not applied, without the ids they were given.
+        """
+        for index, result in enumerate(self.results):
+            if result["status"] < 300:
+                self.results[index] = dict(
+                    index=result["index"], op=result["op"],
+                    status=ROLLED_BACK,
+                    error="Rolled back: another operation failed"
+                )
+        self.applied = 0
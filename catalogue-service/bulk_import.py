@@ -0,0 +1,261 @@
+import codecs
+import io
+import json
+import re
+import time
+
+CHUNK_SIZE = 64 * 1024
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson",
+                "application/jsonlines")
+
+# Column limits of the movies table, checked up front so a single bad row
+# is reported instead of failing the whole COPY
+MAX_NAME_LENGTH = 255
+MAX_GENRE_LENGTH = 100
+MIN_YEAR, MAX_YEAR = -2 ** 31, 2 ** 31 - 1  # year is an int4
+YEAR_ERROR = f"year must be an integer from {MIN_YEAR} to {MAX_YEAR}"
+
+_INTEGER = re.compile(r"[+-]?[0-9]+")
+
+
+class MalformedStream(ValueError):
+    """The request body is not a well-formed JSON array."""
+
+
+def iter_json_array(stream, chunk_size=CHUNK_SIZE):
+    """
+    Yield the elements of a top-level JSON array read incrementally from
+    a binary stream, so only the element being parsed is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf, pos, eof = "", 0, False
+    state = "start"
+
+    def fill():
+        nonlocal buf, pos, eof
+        chunk = stream.read(chunk_size)
+        eof = not chunk
+        buf = buf[pos:] + utf8.decode(chunk, final=eof)
+        pos = 0
+
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n":
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                raise MalformedStream("Unexpected end of JSON array")
+            fill()
+            continue
+
+        char = buf[pos]
+        if state == "start":
+            if char != "[":
+                raise MalformedStream("Expected a JSON array")
+            pos += 1
+            state = "first"
+        elif state == "sep":
+            if char == "]":
+                return
+            if char != ",":
+                raise MalformedStream(
+                    "Expected ',' or ']' in JSON array"
+                )
+            pos += 1
+            state = "item"
+        elif state == "first" and char == "]":
+            return
+        else:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except ValueError as e:
+                if eof:
+                    raise MalformedStream(str(e))
+                fill()
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(buf) and not eof:
+                fill()
+                continue
+            yield value
+            pos = end
+            state = "sep"
+
+
+def iter_ndjson(stream):
+    """
+    Yield (value, error) for each non-blank line of an NDJSON stream; a
+    line that is not valid JSON yields an error instead of aborting.
+    """
+    for line in iter(stream.readline, b""):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line), None
+        except ValueError as e:
+            yield None, f"Invalid JSON: {e}"
+
+
+def parse_year(value):
+    """
+    Return `value` as a year the movies table can hold, or None. JSON
+    integers and strings of digits are years; bools and floats (which
+    int() would silently truncate) are not.
+    """
+    if isinstance(value, str) and _INTEGER.fullmatch(value.strip()):
+        value = int(value)
+    if type(value) is not int or not MIN_YEAR <= value <= MAX_YEAR:
+        return None
+    return value
+
+
+def validate_movie(row):
+    """
+    Return ((name, genre, year), None) for a valid movie object or
+    (None, error message) otherwise.
+    """
+    if not isinstance(row, dict):
+        return None, "Movie must be a JSON object"
+    name, genre, year = row.get('name'), row.get('genre'), row.get('year')
+    if not name or not genre or not year:
+        return None, "All fields (name, genre, year) are required"
+    if not isinstance(name, str) or len(name) > MAX_NAME_LENGTH:
+        return None, f"name must be a string of at most {MAX_NAME_LENGTH} characters"
+    if not isinstance(genre, str) or len(genre) > MAX_GENRE_LENGTH:
+        return None, f"genre must be a string of at most {MAX_GENRE_LENGTH} characters"
+    year = parse_year(year)
+    if year is None:
+        return None, YEAR_ERROR
+    return (name, genre, year), None
+
+
+def _copy_escape(value):
+    return (value.replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+class MovieImporter:
+    """
+    Load validated movies for one user in batches inside the caller's
+    transaction.
+
+    Each batch is COPY'd into a temporary staging table, its new titles
+    and genres are created, and it is moved into `movies` with INSERT ...
+    ON CONFLICT DO NOTHING, so rows the user already owns are reported as
+    duplicates rather than aborting the load.
+    """
+
+    def __init__(self, cur, user_id, batch_size=1000, max_errors=1000):
+        self.cur = cur
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.received = 0
+        self.inserted = 0
+        self.rejected = 0
+        self.errors = []
+        self._batch = []
+        self._seen = set()
+        self._started = time.monotonic()
+
+        cur.execute(
+            """
+            CREATE TEMP TABLE movie_import (
+                name VARCHAR(255) NOT NULL,
+                genre VARCHAR(100) NOT NULL,
+                year INT NOT NULL
+            ) ON COMMIT DROP
+            """
+        )
+
+    def reject(self, index, message):
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"index": index, "error": message})
+
+    def add_invalid(self, index, message):
+        self.received += 1
+        self.reject(index, message)
+
+    def add(self, index, row):
+        self.received += 1
+        movie, error = validate_movie(row)
+        if error:
+            self.reject(index, error)
+            return
+        key = (movie[0], movie[2])
+        if key in self._seen:
+            self.reject(index, "Duplicate movie in import")
+            return
+        self._seen.add(key)
+        self._batch.append((index, movie))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._batch:
+            return
+        buf = io.StringIO()
+        for _, (name, genre, year) in self._batch:
+            buf.write(f"{_copy_escape(name)}\t{_copy_escape(genre)}\t{year}\n")
+        buf.seek(0)
+
+        self.cur.execute("TRUNCATE movie_import")
+        self.cur.copy_expert(
+            "COPY movie_import (name, genre, year) FROM STDIN", buf
+        )
+        self.cur.execute(
+            """
+            INSERT INTO genres (name)
+            SELECT DISTINCT genre FROM movie_import
+            WHERE NOT EXISTS (
+                SELECT 1 FROM genres g WHERE g.name = movie_import.genre
+            )
+            ON CONFLICT (name) DO NOTHING
+            """
+        )
+        self.cur.execute(
+            """
+            INSERT INTO titles (name, year)
+            SELECT name, year FROM movie_import
+            WHERE NOT EXISTS (
+                SELECT 1 FROM titles t
+                WHERE t.name = movie_import.name AND t.year = movie_import.year
+            )
+            ON CONFLICT (name, year) DO NOTHING
+            """
+        )
+        self.cur.execute(
+            """
+            WITH new AS (
+                INSERT INTO movies (user_id, title_id, genre_id, name, year)
+                SELECT %s, t.id, g.id, t.name, t.year
+                FROM movie_import i
+                JOIN titles t ON t.name = i.name AND t.year = i.year
+                JOIN genres g ON g.name = i.genre
+                ON CONFLICT (user_id, title_id) DO NOTHING
+                RETURNING title_id
+            )
+            SELECT t.name, t.year FROM new JOIN titles t ON t.id = new.title_id
+            """,
+            (self.user_id,)
+        )
+        inserted = {(name, year) for name, year in self.cur.fetchall()}
+        self.inserted += len(inserted)
+        for index, (name, _, year) in self._batch:
+            if (name, year) not in inserted:
+                self.reject(index, "Movie already exists in the user's list")
+        self._batch = []
+
+    def report(self):
+        elapsed = time.monotonic() - self._started
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "errors_truncated": self.rejected > len(self.errors),
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(self.inserted / elapsed, 1)
+            if elapsed > 0 else None,
+        }
@@ -1,13 +1,44 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 import psycopg2
 from psycopg2 import OperationalError
+from db_pool import DB_POOL_COUNTERS, pool_from_env
+from migrations import run_migrations
+import schema
+from serving import serve, server_processes, serving_mode
+from instrumentation import instrument_app, register_stats
+from log_config import configure_logging
+from tracing import trace_app
+from fastjson import install_json_provider
+from movie_json import encode_movie_page, movie_json
+from movie_cache import LocalBackend, cache_from_env
+from singleflight import singleflight_from_env
+from etags import bump_version, list_etag, movie_version, pack, unpack
+from compression import ENCODINGS, compress_response
+from listing import (
+    InvalidListQuery, build_list_sql, cache_variant, encode_cursor,
+    parse_list_query
+)
+from bulk_import import (
+    NDJSON_TYPES, MalformedStream, MovieImporter, iter_json_array, iter_ndjson
+)
+from batch import InvalidBatch, MovieBatch, parse_batch
+from movie_store import DELETE_MOVIE_SQL, MOVIE_FROM, insert_movie
+from search import (
+    build_search_sql, encode_search_cursor, parse_search_query, prepare_search
+)
+import csv
+import io
 import os
 import logging
+import time
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
+# Set up logging (LOG_LEVEL, LOG_FORMAT, LOG_DEBUG_SAMPLE_RATE)
+configure_logging("catalogue")
 
 app = Flask(__name__)
+install_json_provider(app)
+instrument_app(app, "catalogue")
+trace_app(app, "catalogue")
 
 # Database configuration (read from environment variables)
 DB_HOST = os.environ.get("PGHOST", "postgres")
@@ -15,66 +46,137 @@ DB_USER = os.environ.get("PGUSER", "admin")
 DB_PASSWORD = os.environ.get("PGPASSWORD", "admin")
 DB_NAME = os.environ.get("PGDATABASE", "movieApp")
 
-# Function to establish a database connection
+DB_CONNECTION_PARAMS = {
+    "host": DB_HOST,
+    "port": 5432,
+    "database": DB_NAME,
+    "user": DB_USER,
+    "password": DB_PASSWORD,
+}
+
+# Serialized movie list bodies per user (MOVIE_CACHE_* variables)
+movie_cache = cache_from_env()
+
+# Server processes (WEB_WORKERS), between which the database connections
+# of this instance are split. The local movie cache is per process and
+# only sees invalidations from its own process, so keep one worker
+# (scaling with threads) unless the cache is shared.
+SERVER_PROCESSES = server_processes(
+    default=1 if isinstance(movie_cache.backend, LocalBackend) else None
+)
+
+# Shared connection pool (bounds configured via DB_POOL_* variables)
+db_pool = pool_from_env(DB_CONNECTION_PARAMS, processes=SERVER_PROCESSES)
+
+# Largest number of movies accepted by one bulk delete
+BULK_DELETE_MAX = int(os.environ.get("BULK_DELETE_MAX", "1000"))
+
+# Rows fetched per round trip by the export's server-side cursor, and
+# bytes buffered before a chunk of the export is sent
+EXPORT_ITERSIZE = int(os.environ.get("EXPORT_ITERSIZE", "2000"))
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Bulk import limits: rows per COPY batch and rows per request
+BULK_IMPORT_BATCH_SIZE = int(os.environ.get("BULK_IMPORT_BATCH_SIZE", "1000"))
+BULK_IMPORT_MAX_ROWS = int(os.environ.get("BULK_IMPORT_MAX_ROWS", "100000"))
+
+# Largest number of operations accepted by one batch
+BATCH_MAX_OPERATIONS = int(os.environ.get("BATCH_MAX_OPERATIONS", "1000"))
+
+# Coalesces concurrent identical list reads (SINGLEFLIGHT_* variables)
+list_flights = singleflight_from_env()
+
+# Export pool and cache counters on /metrics
+register_stats(
+    "db_pool", "pool",
+    lambda: {"postgres": db_pool.stats()},
+    counters=DB_POOL_COUNTERS
+)
+register_stats(
+    "movie_cache", "cache",
+    lambda: {"movies": movie_cache.stats()},
+    counters=("hits", "misses", "invalidations", "stale_writes_skipped",
+              "backend_errors", "evictions")
+)
+register_stats(
+    "singleflight", "flight",
+    lambda: {"movie_list": list_flights.stats()},
+    counters=("leaders", "coalesced", "wait_timeouts")
+)
+
+# Function to check out a pooled database connection
 def get_db_connection():
-    connection_params = {
-        "host": DB_HOST,
-        "port": 5432,
-        "database": DB_NAME,
-        "user": DB_USER,
-        "password": DB_PASSWORD,
-    }
     try:
-        conn = psycopg2.connect(**connection_params)
+        conn = db_pool.getconn()
         return conn, None  # Connection succeeded, return it
     except OperationalError as e:
         return None, {
             "error": 
-                f"Error connecting to the database: {str(e)}", 
-                "parameters": connection_params
+                f"Error connecting to the database: {str(e)}",
+                "parameters": DB_CONNECTION_PARAMS
             }
 
-# Function to initialize 'movies' table in the database
-def initialize_table():
-    conn, _ = get_db_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-
-            # Create `movies` table
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS movies (
-                    id SERIAL PRIMARY KEY,
-                    user_id INT NOT NULL,
-                    name VARCHAR(255) NOT NULL,
-                    genre VARCHAR(100) NOT NULL,
-                    year INT NOT NULL
-                )
-                """
-            )
+# Function to hand a connection back to the pool
+def release_db_connection(conn):
+    db_pool.putconn(conn)
 
-            conn.commit()  # Save changes
-            cur.close()
-            return True
-        finally:
-            conn.close()
-    return False
+# Function to bring the database schema up to date (see schema.py)
+def initialize_schema():
+    conn, error_info = get_db_connection()
+    if not conn:
+        logging.debug("Database not reachable yet: %s", error_info["error"])
+        return False
+    try:
+        applied = run_migrations(conn, schema.COMPONENT, schema.MIGRATIONS)
+        logging.debug("Applied schema migrations: %s", applied)
+        return True
+    except psycopg2.Error as e:
+        logging.error("Schema migration failed: %s", e)
+        return False
+    finally:
+        release_db_connection(conn)
+
+# Format an (id, name, genre, year) row
+def format_movie(row):
+    return {
+        "id": row[0],
+        "name": row[1],
+        "genre": row[2],
+        "year": row[3]
+    }
 
 # Route to test the database connection
 @app.route('/catalogue/test-db', methods=['GET'])
 def test_db_connection():
     conn, error_info = get_db_connection()
     if conn:
+        release_db_connection(conn)
         return jsonify({"message": "Database connected."}), 200
     # If connection failed, return debug info
     return jsonify(error_info), 500
 
+# Route to inspect connection pool usage and exhaustion counters
+@app.route('/catalogue/stats', methods=['GET'])
+def service_stats():
+    return jsonify(
+        {
+            "db_pool": db_pool.stats(),
+            "movie_cache": movie_cache.stats(),
+            "singleflight": list_flights.stats()
+        }
+    ), 200
+
 # Get Movie list for a user
 @app.route('/catalogue/movies', methods=['GET'])
 def get_movies():
-    data = request.get_json()
-    user_id = data.get('user_id')
+    # user_id comes in the JSON body (or the query string); paging and
+    # filtering options always come in the query string
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('user_id') or request.args.get('user_id')
 
     if not user_id:
         return jsonify(
@@ -83,52 +185,235 @@ def get_movies():
             }
         ), 400
 
-    # Get movies for the given user from the database
-    conn, error_info = get_db_connection()
-    if conn:
-        try:
-            cur = conn.cursor()
-
-            # Fetch movies associated with the user ID
-            cur.execute(
-                """
-                SELECT name, genre, year
-                FROM movies
-                WHERE user_id = %s
-                """,
-                (user_id,)
+    try:
+        query = parse_list_query(request.args)
+    except InvalidListQuery as e:
+        return jsonify({"error": str(e)}), 400
+
+    variant = cache_variant(query)
+    if variant is not None:
+        cached = movie_cache.get(user_id, variant)
+        if cached is not None:
+            etag, body = unpack(cached)
+            return list_response(body, etag)
+
+    # Identical reads arriving while one is running share its result
+    # instead of each taking a connection and running the same query.
+    # The cache generation is part of the key, so a read starting after a
+    # write the cache has seen never joins one that predates it.
+    generation = movie_cache.begin_read(user_id)
+    key = (str(user_id), generation, query,
+           request.headers.get("If-None-Match"))
+    if_none_match = request.if_none_match
+    try:
+        etag, body = list_flights.do(
+            key,
+            lambda: load_movie_list(
+                user_id, query, variant, generation, if_none_match
             )
+        )
+    except DatabaseUnavailable as e:
+        return jsonify(e.error_info), 500
+    except psycopg2.Error as e:
+        return jsonify({"error": f"Error fetching movies: {str(e)}"}), 500
+
+    if body is None:
+        return not_modified(etag)
+    return list_response(body, etag)
+
+class DatabaseUnavailable(Exception):
+    def __init__(self, error_info):
+        super().__init__(error_info["error"])
+        self.error_info = error_info
+
+# Function to get one page of movies for the given user from the database,
+# as (etag, body); body is None when `if_none_match` already matches
+def load_movie_list(user_id, query, variant, generation, if_none_match):
+    conn, error_info = get_db_connection()
+    if not conn:
+        raise DatabaseUnavailable(error_info)
+    try:
+        cur = conn.cursor()
 
-            movies = cur.fetchall()
-            logging.debug(movies)
+        # The version is read before the list: a write committing in
+        # between can only make the body newer than its ETag, which
+        # costs the client one extra download, never a stale list
+        etag = list_etag(user_id, movie_version(cur, user_id), query)
+        if if_none_match.contains_weak(etag):
+            cur.close()
+            return etag, None
 
+        # Keyset pagination: filters, sort and cursor are all in SQL
+        sql, params = build_list_sql(user_id, query)
+        cur.execute(sql, params)
 
-            if not movies:
-                return jsonify(
-                    {
-                        "message": "No movies found for this user"
-                    }
-                ), 200
+        movies = cur.fetchall()
+        cur.close()
+        logging.debug("Fetched %d movies for user %s", len(movies), user_id)
 
-            # Format the movie list
-            movie_list = [
+        if not movies and not query.after:
+            body = jsonify(
                 {
-                    "name": movie[0], 
-                    "genre": movie[1], 
-                    "year": movie[2]
-                } 
-                for movie in movies
-            ]
+                    "message": "No movies found for this user"
+                }
+            ).get_data()
+        else:
+            page = movies[:query.limit]
+            next_cursor = None
+            if len(movies) > query.limit:
+                next_cursor = encode_cursor(query.sort, page[-1])
+
+            # Encode the rows straight to JSON bytes
+            body = encode_movie_page(page, next_cursor)
+
+        if variant is not None:
+            movie_cache.set(user_id, pack(etag, body), generation, variant)
+        return etag, body
+    finally:
+        release_db_connection(conn)
+
+# Function to answer a list request with `body`, or 304 if the client
+# already holds the version tagged `etag`
+def list_response(body, etag):
+    if request.if_none_match.contains_weak(etag):
+        return not_modified(etag)
+    response = Response(body, status=200, mimetype="application/json")
+    response.set_etag(etag, weak=True)
+    return compress_response(response, request.accept_encodings)
+
+# Function to build a bodiless 304 for `etag`
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    if ENCODINGS:
+        response.vary.add("Accept-Encoding")
+    return response
+
+# Search a user's movies by name: prefix, full-text or trigram similarity
+@app.route('/catalogue/movies/search', methods=['GET'])
+def search_movies():
+    # Like the list, user_id comes in the JSON body (or the query string)
+    data = request.get_json(silent=True) or {}
+    user_id = data.get('user_id') or request.args.get('user_id')
 
+    if not user_id:
+        return jsonify({"error": "User_id is required"}), 400
+
+    try:
+        query = parse_search_query(request.args)
+    except InvalidListQuery as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn, error_info = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            prepare_search(cur, query)
+            sql, params = build_search_sql(user_id, query)
+            cur.execute(sql, params)
+            rows = cur.fetchall()
             cur.close()
-            return jsonify({"movies": movie_list}), 200
+
+            page = rows[:query.limit]
+            next_cursor = None
+            if len(rows) > query.limit:
+                next_cursor = encode_search_cursor(query, page[-1])
+
+            return jsonify(
+                {
+                    "movies": [
+                        {
+                            "name": row[0],
+                            "genre": row[1],
+                            "year": row[2],
+                            "score": round(row[4], 4)
+                        }
+                        for row in page
+                    ],
+                    "next_cursor": next_cursor
+                }
+            ), 200
         except psycopg2.Error as e:
-            return jsonify({"error": f"Error fetching movies: {str(e)}"}), 500
+            return jsonify({"error": f"Error searching movies: {str(e)}"}), 500
         finally:
-            conn.close()
+            release_db_connection(conn)
 
     return jsonify(error_info), 500
 
+# Encode export rows as NDJSON or CSV, yielding ~EXPORT_CHUNK_SIZE chunks
+def encode_export(rows, export_format):
+    buf = io.StringIO()
+    if export_format == "csv":
+        writer = csv.writer(buf)
+        writer.writerow(["name", "genre", "year"])
+        write = writer.writerow
+    else:
+        def write(row):
+            buf.write(movie_json(row))
+            buf.write("\n")
+
+    for row in rows:
+        write(row)
+        if buf.tell() >= EXPORT_CHUNK_SIZE:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+# Stream a user's whole catalogue without materializing it in memory
+@app.route('/catalogue/movies/export', methods=['GET'])
+def export_movies():
+    user_id = request.args.get('user_id', type=int)
+    export_format = request.args.get('format', 'ndjson')
+
+    if not user_id:
+        return jsonify({"error": "User_id is required"}), 400
+    if export_format not in EXPORT_FORMATS:
+        return jsonify(
+            {
+                "error": "format must be one of: "
+                         + ", ".join(sorted(EXPORT_FORMATS))
+            }
+        ), 400
+
+    conn, error_info = get_db_connection()
+    if not conn:
+        return jsonify(error_info), 500
+
+    def generate():
+        # Named (server-side) cursor: rows arrive EXPORT_ITERSIZE at a time
+        cur = conn.cursor(name="movie_export")
+        cur.itersize = EXPORT_ITERSIZE
+        try:
+            cur.execute(
+                f"SELECT t.name, g.name, t.year FROM {MOVIE_FROM} "
+                "WHERE m.user_id = %s ORDER BY m.id",
+                (user_id,)
+            )
+            for chunk in encode_export(cur, export_format):
+                yield chunk
+        except psycopg2.Error:
+            # Headers are already sent; all we can do is cut the stream
+            logging.exception("Export for user %s failed", user_id)
+        finally:
+            try:
+                cur.close()
+            except psycopg2.Error:
+                pass  # the connection is rolled back on release anyway
+
+    response = Response(
+        stream_with_context(generate()),
+        status=200,
+        mimetype=EXPORT_FORMATS[export_format]
+    )
+    response.headers["Content-Disposition"] = (
+        f'attachment; filename="movies.{export_format}"'
+    )
+    # Also runs when the client disconnects before the stream starts
+    response.call_on_close(lambda: release_db_connection(conn))
+    return response
+
 @app.route('/catalogue/movies', methods=['POST'])
 def add_movie():
     data = request.get_json()
@@ -150,35 +435,31 @@ def add_movie():
         try:
             cur = conn.cursor()
 
-            # Insert new movie for the user_id
-            cur.execute(
-                """
-                INSERT INTO movies (user_id, name, genre, year)
-                VALUES (%s, %s, %s, %s)
-                RETURNING id, name, genre, year
-                """,
-                (user_id, name, genre, year)
-            )
-
-            new_movie = cur.fetchone()
+            # Insert new movie for the user_id, creating its title and
+            # genre if this is their first use
+            new_movie = insert_movie(cur, user_id, name, genre, year)
+            bump_version(cur, user_id)
             conn.commit()  # Save changes
             cur.close()
+            movie_cache.invalidate(user_id)
 
             return jsonify(
                 {
                     "message": "Movie added successfully",
-                    "movie": {
-                        "id": new_movie[0],
-                        "name": new_movie[1],
-                        "genre": new_movie[2],
-                        "year": new_movie[3]
-                    }
+                    "movie": format_movie(new_movie)
                 }
             ), 201
+        except psycopg2.IntegrityError:
+            # Rejected by the unique (user_id, title_id) index
+            return jsonify(
+                {
+                    "error": "Movie already exists in the user's list"
+                }
+            ), 409
         except psycopg2.Error as e:
             return jsonify({"error": f"Error adding movie: {str(e)}"}), 500
         finally:
-            conn.close()
+            release_db_connection(conn)
 
     return jsonify(error_info), 500
 
@@ -202,37 +483,248 @@ def delete_movie():
         try:
             cur = conn.cursor()
 
-            # Check if the movie exists
-            cur.execute(
-                "SELECT id FROM movies "
-                "WHERE name = %s AND year = %s AND user_id = %s",
-                (name, year, user_id)
-            )
-            movie = cur.fetchone()
+            # Delete the movie and report the removed rows in one statement
+            cur.execute(DELETE_MOVIE_SQL, (name, year, user_id))
+            deleted = cur.fetchall()
 
-            if not movie:
+            if not deleted:
                 return jsonify({"error": "Movie not found"}), 404
 
-            # Delete the movie
+            bump_version(cur, user_id)
+            conn.commit()
+            cur.close()
+            movie_cache.invalidate(user_id)
+
+            return jsonify(
+                {
+                    "message": "Movie deleted successfully",
+                    "deleted_count": len(deleted),
+                    "deleted": [format_movie(movie) for movie in deleted]
+                }
+            ), 200
+        except psycopg2.Error as e:
+            return jsonify({"error": f"Error deleting movie: {str(e)}"}), 500
+        finally:
+            release_db_connection(conn)
+
+    return jsonify(error_info), 500
+
+# Bulk import of a JSON array or NDJSON stream of movies
+@app.route('/catalogue/movies/bulk', methods=['POST'])
+def import_movies_bulk():
+    # The body is the movie list itself, so the owner comes in the query
+    user_id = request.args.get('user_id', type=int)
+    if not user_id:
+        return jsonify({"error": "User_id is required"}), 400
+
+    if request.mimetype in NDJSON_TYPES:
+        rows = iter_ndjson(request.stream)
+    else:
+        rows = ((row, None) for row in iter_json_array(request.stream))
+
+    conn, error_info = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            importer = MovieImporter(
+                cur, user_id, batch_size=BULK_IMPORT_BATCH_SIZE
+            )
+
+            # Rows are validated and loaded as they arrive; the whole
+            # import commits or rolls back as one transaction
+            for index, (row, error) in enumerate(rows):
+                if index >= BULK_IMPORT_MAX_ROWS:
+                    return jsonify(
+                        {
+                            "error": "Too many movies in one import "
+                                     f"(max {BULK_IMPORT_MAX_ROWS})"
+                        }
+                    ), 413
+                if error:
+                    importer.add_invalid(index, error)
+                else:
+                    importer.add(index, row)
+            importer.flush()
+            if importer.inserted:
+                bump_version(cur, user_id)
+
+            conn.commit()
+            cur.close()
+            if importer.inserted:
+                movie_cache.invalidate(user_id)
+
+            report = importer.report()
+            report["message"] = "Bulk import finished"
+            return jsonify(report), 200
+        except MalformedStream as e:
+            return jsonify({"error": f"Malformed movie list: {str(e)}"}), 400
+        except psycopg2.Error as e:
+            return jsonify({"error": f"Error importing movies: {str(e)}"}), 500
+        finally:
+            release_db_connection(conn)
+
+    return jsonify(error_info), 500
+
+# Parse a list of {"name", "year"} objects or [name, year] pairs
+def parse_movie_keys(items):
+    if not isinstance(items, list) or not items:
+        return None, "A non-empty list of movies is required"
+    if len(items) > BULK_DELETE_MAX:
+        return None, f"At most {BULK_DELETE_MAX} movies can be deleted at once"
+    names, years = [], []
+    for index, item in enumerate(items):
+        if isinstance(item, dict):
+            name, year = item.get('name'), item.get('year')
+        elif isinstance(item, (list, tuple)) and len(item) == 2:
+            name, year = item
+        else:
+            name, year = None, None
+        try:
+            year = int(year)
+        except (TypeError, ValueError):
+            year = None
+        if not name or not isinstance(name, str) or not year:
+            return None, f"Movie at index {index} needs a name and a year"
+        names.append(name)
+        years.append(year)
+    return (names, years), None
+
+@app.route('/catalogue/movies/bulk', methods=['DELETE'])
+def delete_movies_bulk():
+    data = request.get_json()
+    user_id = data.get('user_id')
+
+    if not user_id:
+        return jsonify({"error": "User_id is required"}), 400
+
+    keys, error = parse_movie_keys(data.get('movies'))
+    if error:
+        return jsonify({"error": error}), 400
+    names, years = keys
+
+    conn, error_info = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+
+            # All pairs go in as two parallel arrays: one statement, one scan
             cur.execute(
-                "DELETE FROM movies "
-                "WHERE name = %s AND year = %s AND user_id = %s",
-                (name, year, user_id)
+                """
+                DELETE FROM movies m USING titles t, genres g
+                WHERE t.id = m.title_id AND g.id = m.genre_id
+                  AND m.user_id = %s
+                  AND (t.name, t.year) IN (
+                      SELECT * FROM unnest(%s::varchar[], %s::int[])
+                  )
+                RETURNING m.id, t.name, g.name, t.year
+                """,
+                (user_id, names, years)
             )
+            deleted = cur.fetchall()
+            if deleted:
+                bump_version(cur, user_id)
             conn.commit()
             cur.close()
+            if deleted:
+                movie_cache.invalidate(user_id)
+
+            removed = {(movie[1], movie[3]) for movie in deleted}
+            not_found = [
+                {"name": name, "year": year}
+                for name, year in zip(names, years)
+                if (name, year) not in removed
+            ]
+            return jsonify(
+                {
+                    "message": "Movies deleted successfully",
+                    "deleted_count": len(deleted),
+                    "deleted": [format_movie(movie) for movie in deleted],
+                    "not_found": not_found
+                }
+            ), 200
+        except psycopg2.Error as e:
+            return jsonify({"error": f"Error deleting movies: {str(e)}"}), 500
+        finally:
+            release_db_connection(conn)
+
+    return jsonify(error_info), 500
+
+# Ordered add/delete operations in one transaction, one result each
+@app.route('/catalogue/movies/batch', methods=['POST'])
+def run_movie_batch():
+    # The body is the operation list, so the owner comes in the query
+    user_id = request.args.get('user_id', type=int)
+    if not user_id:
+        return jsonify({"error": "User_id is required"}), 400
 
-            return jsonify({"message": "Movie deleted successfully"}), 200
+    try:
+        operations, atomic = parse_batch(
+            request.get_json(silent=True), BATCH_MAX_OPERATIONS
+        )
+    except InvalidBatch as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn, error_info = get_db_connection()
+    if conn:
+        try:
+            cur = conn.cursor()
+            batch = MovieBatch(cur, user_id, format_movie)
+            for index, operation in enumerate(operations):
+                batch.run(index, operation)
+
+            # atomic: all operations apply or none does
+            rolled_back = atomic and batch.failed
+            if rolled_back:
+                batch.roll_back()
+            committed = batch.applied > 0
+            if committed:
+                bump_version(cur, user_id)
+                conn.commit()
+            else:
+                conn.rollback()
+            cur.close()
+            if committed:
+                movie_cache.invalidate(user_id)
+
+            if rolled_back:
+                message = "Batch rolled back"
+            elif committed:
+                message = "Batch applied"
+            else:
+                message = "No operation applied"
+            return jsonify(
+                {
+                    "message": message,
+                    "committed": committed,
+                    "applied": batch.applied,
+                    "failed": batch.failed,
+                    "results": batch.results
+                }
+            ), 409 if rolled_back else 200
         except psycopg2.Error as e:
-            return jsonify({"error": f"Error deleting movie: {str(e)}"}), 500
+            return jsonify({"error": f"Error running batch: {str(e)}"}), 500
         finally:
-            conn.close()
+            release_db_connection(conn)
 
     return jsonify(error_info), 500
 
 if __name__ == '__main__':
-    logging.debug("Trying to initialize 'movies' table in database...")
-    while not initialize_table():
-        pass
-    logging.debug("'movies' table created in database.")
-    app.run(debug=True, host='0.0.0.0', port=5001)
+    logging.debug("Migrating 'movies' schema in database...")
+    while not initialize_schema():
+        time.sleep(1)
+    logging.debug("'movies' schema is up to date.")
+    # Workers are forked from this process: don't hand them its connections
+    db_pool.closeall()
+
+    # SERVE_MODE=development keeps the single-process debug server
+    if serving_mode() == "development":
+        app.run(debug=True, host='0.0.0.0', port=5001)
+    else:
+        local_cache = isinstance(movie_cache.backend, LocalBackend)
+        if local_cache and SERVER_PROCESSES > 1:
+            logging.warning(
+                "%d workers with the local movie cache: lists may be "
+                "stale for up to MOVIE_CACHE_TTL seconds after a write",
+                SERVER_PROCESSES
+            )
+        serve(app, 5001, workers=SERVER_PROCESSES)
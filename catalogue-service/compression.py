@@ -0,0 +1,65 @@
+"""
+Accept-Encoding negotiation for response bodies held in memory.
+
+Bodies of at least COMPRESS_MIN_BYTES are compressed with the client's
+preferred encoding among COMPRESS_ENCODINGS (brotli needs the optional
+`brotli` package). Smaller bodies cost more to compress than they save
+and go out as-is. The proxies relay compressed bodies without decoding
+them, so the client's Accept-Encoding is what gets negotiated here.
+"""
+import gzip
+import logging
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", "4"))
+
+
+def _encodings():
+    configured = [
+        name.strip() for name in
+        os.environ.get("COMPRESS_ENCODINGS", "br,gzip").split(",")
+        if name.strip()
+    ]
+    if "br" in configured and brotli is None:
+        logging.info("brotli is not installed; br compression disabled")
+        configured.remove("br")
+    return [name for name in configured if name in ("br", "gzip")]
+
+
+# Supported encodings in server preference order (empty: disabled)
+ENCODINGS = _encodings()
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_response(response, accept_encodings):
+    """
+    Compress an in-memory `response` in place for `accept_encodings`
+    (request.accept_encodings), marking it as varying on Accept-Encoding.
+    """
+    if not ENCODINGS:
+        return response
+    response.vary.add("Accept-Encoding")
+    if (response.is_streamed or response.direct_passthrough
+            or "Content-Encoding" in response.headers):
+        return response
+    body = response.get_data()
+    if len(body) < MIN_BYTES:
+        return response
+    encoding = accept_encodings.best_match(ENCODINGS)
+    if encoding is None:
+        return response
+    response.set_data(compress(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    return response
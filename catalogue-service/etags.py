@@ -0,0 +1,55 @@
+"""
+Per-user catalogue versions and the movie list ETags derived from them.
+
+Every write to a user's movies bumps movie_versions.version in the same
+transaction, so a list's ETag (that version plus a digest of the user and
+the list query) changes whenever the list may have. Answering a
+conditional GET then costs one primary-key lookup instead of the list
+query. Cached list bodies are stored together with their ETag, so a cache
+hit can answer 304 without touching the database at all.
+"""
+import hashlib
+
+
+def movie_version(cur, user_id):
+    """Current catalogue version of `user_id` (0 before any write)."""
+    cur.execute(
+        "SELECT version FROM movie_versions WHERE user_id = %s",
+        (user_id,)
+    )
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+
+def bump_version(cur, user_id):
+    """
+    Bump the catalogue version of `user_id` inside the caller's
+    transaction. The row stays locked until commit, so call it last.
+    """
+    cur.execute(
+        """
+        INSERT INTO movie_versions (user_id, version) VALUES (%s, 1)
+        ON CONFLICT (user_id)
+        DO UPDATE SET version = movie_versions.version + 1
+        """,
+        (user_id,)
+    )
+
+
+def list_etag(user_id, version, query):
+    """Opaque (unquoted) ETag for one list query at one version."""
+    digest = hashlib.blake2b(
+        repr((str(user_id), tuple(query))).encode("utf-8"), digest_size=8
+    ).hexdigest()
+    return f"{version}-{digest}"
+
+
+def pack(etag, body):
+    """Cache value holding a list body and its ETag."""
+    return etag.encode("ascii") + b" " + body
+
+
+def unpack(value):
+    """Split a cached value into (etag, body)."""
+    etag, body = bytes(value).split(b" ", 1)
+    return etag.decode("ascii"), body
@@ -0,0 +1,149 @@
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+    REGISTRY, generate_latest
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Latency buckets from 1ms to 10s: sized for both DB queries and full hops
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request, by route",
+    ["service", "method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests currently being handled",
+    ["service"],
+    multiprocess_mode="livesum",
+)
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds",
+    "Time until an upstream service answered (headers received)",
+    ["upstream", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds",
+    "Time spent executing a database statement",
+    ["statement"],
+    buckets=LATENCY_BUCKETS,
+)
+DB_POOL_CHECKOUT_LATENCY = Histogram(
+    "db_pool_checkout_duration_seconds",
+    "Time spent waiting for a pooled database connection",
+    buckets=LATENCY_BUCKETS,
+)
+ERRORS = Counter(
+    "http_request_exceptions",
+    "Requests that ended in an unhandled exception",
+    ["service", "route"],
+)
+
+
+class StatsCollector:
+    """
+    Export the stats() dicts our pools and caches already keep as
+    Prometheus metrics named <prefix>_<key>, with one label set per source.
+    Keys listed in `counters` are exported as counters, the rest as gauges;
+    non-numeric values are skipped.
+    """
+
+    def __init__(self, prefix, label, sources, counters=()):
+        self.prefix = prefix
+        self.label = label
+        self.sources = sources
+        self.counters = set(counters)
+
+    def collect(self):
+        families = {}
+        for source_name, stats in self.sources().items():
+            for key, value in stats.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                family = families.get(key)
+                if family is None:
+                    name = f"{self.prefix}_{key}"
+                    if key in self.counters:
+                        family = CounterMetricFamily(name, key, labels=[self.label])
+                    else:
+                        family = GaugeMetricFamily(name, key, labels=[self.label])
+                    families[key] = family
+                family.add_metric([source_name], value)
+        return list(families.values())
+
+
+_stats_collectors = {}
+
+
+def register_stats(prefix, label, sources, counters=()):
+    # Registering a prefix again replaces its collector: api.py and the
+    # async gateway it serves (api_async.py) export the same stats from
+    # one process
+    previous = _stats_collectors.pop(prefix, None)
+    if previous is not None:
+        REGISTRY.unregister(previous)
+    collector = StatsCollector(prefix, label, sources, counters)
+    REGISTRY.register(collector)
+    _stats_collectors[prefix] = collector
+
+
+def _metrics_registry():
+    # Under a multi-worker server every process writes its samples to
+    # PROMETHEUS_MULTIPROC_DIR and any worker can aggregate them
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        # Pool/cache stats are per process: add this worker's view
+        for collector in _stats_collectors.values():
+            registry.register(collector)
+        return registry
+    return REGISTRY
+
+
+def metrics_payload():
+    """Return the Prometheus text exposition and its content type."""
+    return generate_latest(_metrics_registry()), CONTENT_TYPE_LATEST
+
+
+def metrics_response():
+    payload, content_type = metrics_payload()
+    return Response(payload, content_type=content_type)
+
+
+def instrument_app(app, service):
+    """
+    Time every request of a Flask app by route and expose /metrics.
+    """
+    def start_timer():
+        g.request_started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.labels(service).inc()
+
+    def record_latency(response):
+        started = g.pop("request_started", None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            REQUEST_LATENCY.labels(
+                service, request.method, route, response.status_code
+            ).observe(time.perf_counter() - started)
+        return response
+
+    def finish(error):
+        if error is not None:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            ERRORS.labels(service, route).inc()
+        REQUESTS_IN_FLIGHT.labels(service).dec()
+
+    app.before_request(start_timer)
+    app.after_request(record_latency)
+    app.teardown_request(finish)
+    app.add_url_rule("/metrics", "metrics", metrics_response)
@@ -0,0 +1,139 @@
+import base64
+import collections
+import json
+import os
+
+DEFAULT_PAGE_SIZE = int(os.environ.get("MOVIES_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.environ.get("MOVIES_MAX_PAGE_SIZE", "1000"))
+
+# Sort option -> (column, direction). Every order is made total by `id`.
+# Movies keep copies of their title's name and year (see movie_store.py),
+# so a page is read in order from a (user_id, [genre_id,] column, id)
+# index and stops after `limit` rows.
+SORTS = {
+    "name": ("name", "ASC"),
+    "-name": ("name", "DESC"),
+    "year": ("year", "ASC"),
+    "-year": ("year", "DESC"),
+}
+SORT_COLUMN_INDEX = {"name": 0, "genre": 1, "year": 2}
+# Column -> its expression over LIST_FROM
+COLUMN_SQL = {"name": "m.name", "year": "m.year"}
+# Movies `m` with their genre `g`; the titles join is not needed
+LIST_FROM = "movies m JOIN genres g ON g.id = m.genre_id"
+
+ListQuery = collections.namedtuple(
+    "ListQuery",
+    ["limit", "after", "genre", "year_min", "year_max", "sort"]
+)
+
+
+class InvalidListQuery(ValueError):
+    pass
+
+
+def encode_cursor(sort, row):
+    # Rows are (name, genre, year, id): the cursor stores the sort value
+    # and id of the last row returned
+    column = SORTS[sort][0]
+    payload = {"s": sort, "k": [row[SORT_COLUMN_INDEX[column]], row[3]]}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, sort):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        value, last_id = payload["k"]
+        if payload["s"] != sort:
+            raise InvalidListQuery("Cursor was issued for a different sort")
+        return value, int(last_id)
+    except InvalidListQuery:
+        raise
+    except (ValueError, TypeError, KeyError):
+        raise InvalidListQuery("Invalid cursor")
+
+
+def int_arg(args, name):
+    value = args.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidListQuery(f"{name} must be an integer")
+
+
+def parse_list_query(args):
+    """
+    Build a ListQuery from request query arguments, raising
+    InvalidListQuery on bad input.
+    """
+    sort = args.get("sort") or "name"
+    if sort not in SORTS:
+        raise InvalidListQuery(
+            "sort must be one of: " + ", ".join(sorted(SORTS))
+        )
+    limit = int_arg(args, "limit")
+    if limit is None:
+        limit = DEFAULT_PAGE_SIZE
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise InvalidListQuery(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    after = args.get("after") or None
+    return ListQuery(
+        limit=limit,
+        after=decode_cursor(after, sort) if after else None,
+        genre=args.get("genre") or None,
+        year_min=int_arg(args, "year_min"),
+        year_max=int_arg(args, "year_max"),
+        sort=sort,
+    )
+
+
+def build_list_sql(user_id, query):
+    """
+    Return (sql, params) selecting one page plus one extra row, which
+    tells whether another page follows.
+    """
+    column, direction = SORTS[query.sort]
+    column = COLUMN_SQL[column]
+    conditions = ["m.user_id = %s"]
+    params = [user_id]
+    if query.genre:
+        # Compared as one id, so the genre's index range is read in order
+        conditions.append(
+            "m.genre_id = (SELECT id FROM genres WHERE name = %s)"
+        )
+        params.append(query.genre)
+    if query.year_min is not None:
+        conditions.append("m.year >= %s")
+        params.append(query.year_min)
+    if query.year_max is not None:
+        conditions.append("m.year <= %s")
+        params.append(query.year_max)
+    if query.after:
+        operator = ">" if direction == "ASC" else "<"
+        conditions.append(f"({column}, m.id) {operator} (%s, %s)")
+        params.extend(query.after)
+
+    sql = (
+        f"SELECT m.name, g.name, m.year, m.id FROM {LIST_FROM} "
+        f"WHERE {' AND '.join(conditions)} "
+        f"ORDER BY {column} {direction}, m.id {direction} "
+        "LIMIT %s"
+    )
+    params.append(query.limit + 1)
+    return sql, params
+
+
+def cache_variant(query):
+    """
+    Cache field for a first-page query, or None when the page should not
+    be cached (follow-up pages are addressed by one-off cursors).
+    """
+    if query.after:
+        return None
+    parts = (query.sort, query.limit, query.genre, query.year_min,
+             query.year_max)
+    return "|".join("" if part is None else str(part) for part in parts)
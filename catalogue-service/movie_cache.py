@@ -0,0 +1,246 @@
+import collections
+import logging
+import os
+import threading
+import time
+
+
+class LocalBackend:
+    """
+    In-process LRU store of per-key field maps with a per-key TTL, plus a
+    write generation per key.
+
+    Implements the same get/set/invalidate interface as the shared
+    backends, so it doubles as a local stand-in for them in development.
+    Its generations are only seen by this process.
+
+    Generations are an LRU of the same maxsize as the entries. A key
+    without one reads as the highest generation evicted so far, so a
+    generation taken before an eviction never matches again.
+    """
+
+    def __init__(self, maxsize=10000, max_fields=16):
+        self.maxsize = maxsize
+        self.max_fields = max_fields
+        self._entries = collections.OrderedDict()
+        self._generations = collections.OrderedDict()
+        self._generation_floor = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key, field):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            fields, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return fields.get(field)
+
+    def _generation(self, key):
+        return self._generations.get(key, self._generation_floor)
+
+    def generation(self, key):
+        with self._lock:
+            return self._generation(key)
+
+    def set(self, key, field, value, ttl, generation):
+        now = time.monotonic()
+        with self._lock:
+            if self._generation(key) != generation:
+                return False
+            entry = self._entries.get(key)
+            if entry is None or now >= entry[1]:
+                # The TTL runs from the first field cached for the key, so
+                # no field outlives it
+                entry = ({}, now + ttl)
+                self._entries[key] = entry
+            fields = entry[0]
+            if field in fields or len(fields) < self.max_fields:
+                fields[field] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generations[key] = self._generation(key) + 1
+            self._generations.move_to_end(key)
+            while len(self._generations) > self.maxsize:
+                _, evicted = self._generations.popitem(last=False)
+                self._generation_floor = max(
+                    self._generation_floor, evicted)
+            self._entries.pop(key, None)
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class RedisBackend:
+    """
+    Cache store shared by every catalogue replica, one hash per key. Needs
+    the optional `redis` package; eviction is left to the Redis maxmemory
+    policy.
+
+    A key's generation is a counter next to its hash that invalidate()
+    INCRs. set() stores under WATCH of that counter, so a body read
+    before a write on any replica is dropped rather than stored.
+    """
+
+    # Generation counters outlive any read, or a reset counter could
+    # match a generation taken before the reset
+    GENERATION_TTL = 86400
+
+    def __init__(self, url, prefix="movies:", max_fields=16):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.max_fields = max_fields
+        self.evictions = 0
+        self._watch_error = redis.WatchError
+
+    def _generation_key(self, key):
+        return self.prefix + "generation:" + key
+
+    def get(self, key, field):
+        return self.client.hget(self.prefix + key, field)
+
+    def generation(self, key):
+        return int(self.client.get(self._generation_key(key)) or 0)
+
+    def set(self, key, field, value, ttl, generation):
+        name = self.prefix + key
+        with self.client.pipeline() as pipe:
+            try:
+                # An invalidate() from here to EXEC aborts the store
+                pipe.watch(self._generation_key(key))
+                current = int(pipe.get(self._generation_key(key)) or 0)
+                if current != generation:
+                    return False
+                count = pipe.hlen(name)
+                if count >= self.max_fields:
+                    return True
+                pipe.multi()
+                pipe.hset(name, field, value)
+                # Only the first field sets the expiry, as in LocalBackend
+                if count == 0:
+                    pipe.expire(name, max(1, int(ttl)))
+                pipe.execute()
+            except self._watch_error:
+                return False
+        return True
+
+    def invalidate(self, key):
+        with self.client.pipeline() as pipe:
+            pipe.incr(self._generation_key(key))
+            pipe.expire(self._generation_key(key), self.GENERATION_TTL)
+            pipe.delete(self.prefix + key)
+            pipe.execute()
+
+    def size(self):
+        return None
+
+
+class MovieListCache:
+    """
+    Read-through cache of serialized movie list bodies, keyed by user and
+    by a query variant (sort, filters, page size) within the user.
+
+    Writers call invalidate() after committing. Readers take a generation
+    token with begin_read() before querying the database and pass it to
+    set(), which drops the body if a write for that user happened in the
+    meantime, so a slow read can never re-populate the cache with a list
+    that predates the write. The generation is kept by the backend: with
+    RedisBackend this holds for writes made through any replica, with
+    LocalBackend only for writes made through this process.
+    """
+
+    def __init__(self, backend, ttl=60.0):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "stale_writes_skipped": 0,
+            "backend_errors": 0,
+        }
+
+    def _increment(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, user_id, variant=""):
+        try:
+            body = self.backend.get(str(user_id), variant)
+        except Exception:
+            # The cache must never take the read path down with it
+            logging.exception("Movie cache lookup failed")
+            self._increment("backend_errors")
+            body = None
+        self._increment("hits" if body is not None else "misses")
+        return body
+
+    def begin_read(self, user_id):
+        """Generation token for set(), or None if it can't be read."""
+        try:
+            return self.backend.generation(str(user_id))
+        except Exception:
+            logging.exception("Movie cache generation lookup failed")
+            self._increment("backend_errors")
+            return None
+
+    def set(self, user_id, body, generation, variant=""):
+        if generation is None:
+            return
+        try:
+            stored = self.backend.set(
+                str(user_id), variant, body, self.ttl, generation
+            )
+        except Exception:
+            logging.exception("Movie cache store failed")
+            self._increment("backend_errors")
+            return
+        if not stored:
+            self._increment("stale_writes_skipped")
+
+    def invalidate(self, user_id):
+        self._increment("invalidations")
+        try:
+            self.backend.invalidate(str(user_id))
+        except Exception:
+            logging.exception("Movie cache invalidation failed")
+            self._increment("backend_errors")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["evictions"] = self.backend.evictions
+        stats["size"] = self.backend.size()
+        stats["backend"] = type(self.backend).__name__
+        return stats
+
+
+# Build the movie list cache from the MOVIE_CACHE_* environment variables
+def cache_from_env():
+    backend_name = os.environ.get("MOVIE_CACHE_BACKEND", "local")
+    if backend_name == "redis":
+        backend = RedisBackend(
+            os.environ.get("MOVIE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+        )
+    else:
+        backend = LocalBackend(
+            maxsize=int(os.environ.get("MOVIE_CACHE_SIZE", "10000"))
+        )
+    return MovieListCache(
+        backend,
+        ttl=float(os.environ.get("MOVIE_CACHE_TTL", "60")),
+    )
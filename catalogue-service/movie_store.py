@@ -0,0 +1,125 @@
+"""
+Reads and writes of the normalized movie schema (schema.py migrations
+7-10).
+
+A user's movie is an (id, user_id, title_id, genre_id) row; its title
+lives once in the shared `titles` table and its genre in the `genres`
+lookup, however many users own it. The row also keeps copies of its
+title's name and year, the keys its list is sorted and searched by, so
+list pages are read in index order (see listing.py) and a search only
+visits the user's own movies (see search.py). Handlers keep speaking in
+(name, genre, year): reads join through MOVIE_FROM, and writes resolve
+the names to ids here, creating titles and genres on first use. Titles
+and genres are never deleted or changed, so an id once read stays valid
+and the copies stay in step.
+"""
+import threading
+
+# FROM clause resolving movies `m` to t.name, g.name (genre) and t.year
+MOVIE_FROM = (
+    "movies m JOIN titles t ON t.id = m.title_id "
+    "JOIN genres g ON g.id = m.genre_id"
+)
+
+# A user's movie as a (id, name, genre, year) row, as format_movie expects
+MOVIE_ROW = "m.id, t.name, g.name, t.year"
+
+# Genre name -> id, for genres read back committed; there are few genres
+# and every write needs one, so most writes skip the lookup
+MAX_CACHED_GENRES = 10000
+_genre_ids = {}
+_genre_lock = threading.Lock()
+
+
+# Whether a row was written by the current transaction, which may still
+# roll back (xmin is the 32-bit form of the writing transaction's id)
+WRITTEN_HERE = (
+    "xmin::text = (txid_current_if_assigned() %% 4294967296)::text"
+)
+
+
+def _lookup_or_insert(cur, select, insert, params):
+    # Read first so existing names cost no sequence value, then insert,
+    # then read again: a conflicting row inserted concurrently is
+    # committed by the time ON CONFLICT gives up, so a new statement
+    # sees it. `select` returns (id, written here).
+    cur.execute(select, params)
+    row = cur.fetchone()
+    if row is not None:
+        return row[0], not row[1]
+    cur.execute(insert, params)
+    row = cur.fetchone()
+    if row is not None:
+        return row[0], False
+    cur.execute(select, params)
+    return cur.fetchone()[0], True
+
+
+def genre_id(cur, name):
+    """Id of genre `name`, created in the caller's transaction if new."""
+    cached = _genre_ids.get(name)
+    if cached is not None:
+        return cached
+    genre, committed = _lookup_or_insert(
+        cur,
+        f"SELECT id, {WRITTEN_HERE} FROM genres WHERE name = %s",
+        "INSERT INTO genres (name) VALUES (%s) "
+        "ON CONFLICT (name) DO NOTHING RETURNING id",
+        (name,)
+    )
+    # An id inserted by this transaction, even by an earlier statement,
+    # may still be rolled back
+    if committed:
+        with _genre_lock:
+            if len(_genre_ids) < MAX_CACHED_GENRES:
+                _genre_ids[name] = genre
+    return genre
+
+
+def title_id(cur, name, year):
+    """Id of title (`name`, `year`), created if new."""
+    title, _ = _lookup_or_insert(
+        cur,
+        f"SELECT id, {WRITTEN_HERE} FROM titles "
+        "WHERE name = %s AND year = %s",
+        "INSERT INTO titles (name, year) VALUES (%s, %s) "
+        "ON CONFLICT (name, year) DO NOTHING RETURNING id",
+        (name, year)
+    )
+    return title
+
+
+def insert_movie(cur, user_id, name, genre, year, skip_existing=False):
+    """
+    Add a movie to the user's list and return its (id, name, genre, year)
+    row. An existing (name, year) raises IntegrityError, or with
+    `skip_existing` returns None.
+    """
+    conflict = ("ON CONFLICT (user_id, title_id) DO NOTHING"
+                if skip_existing else "")
+    cur.execute(
+        f"""
+        WITH new AS (
+            INSERT INTO movies (user_id, title_id, genre_id, name, year)
+            VALUES (%s, %s, %s, %s, %s)
+            {conflict}
+            RETURNING id, title_id, genre_id
+        )
+        SELECT new.id, t.name, g.name, t.year
+        FROM new
+        JOIN titles t ON t.id = new.title_id
+        JOIN genres g ON g.id = new.genre_id
+        """,
+        (user_id, title_id(cur, name, year), genre_id(cur, genre), name,
+         year)
+    )
+    return cur.fetchone()
+
+
+# Delete one (name, year) from a user's list; params (name, year, user_id)
+DELETE_MOVIE_SQL = f"""
+    DELETE FROM movies m USING titles t, genres g
+    WHERE t.id = m.title_id AND g.id = m.genre_id
+      AND t.name = %s AND t.year = %s AND m.user_id = %s
+    RETURNING {MOVIE_ROW}
+"""
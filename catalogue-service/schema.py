@@ -0,0 +1,305 @@
+import logging
+import os
+
+from migrations import Migration
+
+COMPONENT = "catalogue"
+
+# Movies converted per transaction by migration 8
+CONVERSION_BATCH_SIZE = int(
+    os.environ.get("SCHEMA_CONVERSION_BATCH_SIZE", "50000")
+)
+
+
+# Removed duplicates listed in the log by migration 3 (all are kept in
+# movies_removed_duplicates)
+LOGGED_DUPLICATES = 100
+
+
+def remove_duplicate_movies(cur):
+    """
+    Keep the oldest copy of any duplicate (user_id, name, year) and
+    enforce uniqueness. The removed rows are kept in
+    movies_removed_duplicates and logged, so they can be reviewed or
+    restored by hand.
+    """
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS movies_removed_duplicates (
+            id INT PRIMARY KEY,
+            user_id INT NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            genre VARCHAR(100) NOT NULL,
+            year INT NOT NULL,
+            kept_id INT NOT NULL,
+            removed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+        """
+    )
+    cur.execute(
+        """
+        WITH removed AS (
+            DELETE FROM movies m
+            USING movies older
+            WHERE m.user_id = older.user_id
+              AND m.name = older.name
+              AND m.year = older.year
+              AND m.id > older.id
+              AND NOT EXISTS (
+                  SELECT 1 FROM movies oldest
+                  WHERE oldest.user_id = older.user_id
+                    AND oldest.name = older.name
+                    AND oldest.year = older.year
+                    AND oldest.id < older.id
+              )
+            RETURNING m.id, m.user_id, m.name, m.genre, m.year,
+                      older.id AS kept_id
+        )
+        INSERT INTO movies_removed_duplicates
+            (id, user_id, name, genre, year, kept_id)
+        SELECT * FROM removed
+        ON CONFLICT (id) DO NOTHING
+        RETURNING id, kept_id
+        """
+    )
+    removed = sorted(cur.fetchall())
+    if removed:
+        logging.warning(
+            "Removed %d duplicate movies, copied to "
+            "movies_removed_duplicates; removed id -> kept id: %s%s",
+            len(removed),
+            ", ".join(f"{id} -> {kept}"
+                      for id, kept in removed[:LOGGED_DUPLICATES]),
+            " ..." if len(removed) > LOGGED_DUPLICATES else ""
+        )
+    cur.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS movies_user_name_year_key "
+        "ON movies (user_id, name, year)"
+    )
+
+
+def convert_movies_batch(cur):
+    """
+    Fill movies.title_id and movies.genre_id for the next id range of
+    CONVERSION_BATCH_SIZE unconverted movies, creating the titles and
+    genres they refer to. Returns True once every movie is converted.
+    Unconverted rows are found through movies_unconverted_idx, so an
+    interrupted conversion resumes with the rows it had not reached.
+    """
+    cur.execute("SELECT MIN(id) FROM movies WHERE title_id IS NULL")
+    start = cur.fetchone()[0]
+    if start is None:
+        return True
+    end = start + CONVERSION_BATCH_SIZE
+    cur.execute(
+        """
+        INSERT INTO genres (name)
+        SELECT DISTINCT genre FROM movies
+        WHERE id >= %s AND id < %s AND title_id IS NULL
+        ON CONFLICT (name) DO NOTHING
+        """,
+        (start, end)
+    )
+    cur.execute(
+        """
+        INSERT INTO titles (name, year)
+        SELECT DISTINCT name, year FROM movies
+        WHERE id >= %s AND id < %s AND title_id IS NULL
+        ON CONFLICT (name, year) DO NOTHING
+        """,
+        (start, end)
+    )
+    cur.execute(
+        """
+        UPDATE movies m
+        SET title_id = t.id, genre_id = g.id
+        FROM titles t, genres g
+        WHERE m.id >= %s AND m.id < %s AND m.title_id IS NULL
+          AND t.name = m.name AND t.year = m.year
+          AND g.name = m.genre
+        """,
+        (start, end)
+    )
+    logging.info("Converted movies with ids %d to %d", start, end - 1)
+    return False
+
+
+COMPACT_MOVIES_SQL = [
+    "ALTER TABLE movies ALTER COLUMN title_id SET NOT NULL",
+    "ALTER TABLE movies ALTER COLUMN genre_id SET NOT NULL",
+    "DROP INDEX IF EXISTS movies_unconverted_idx",
+    # Replaces the (user_id, name, year) key
+    "CREATE UNIQUE INDEX IF NOT EXISTS movies_user_title_key "
+    "ON movies (user_id, title_id)",
+    "DROP INDEX IF EXISTS movies_user_name_year_key",
+    # name and year stay as copies of the title's (titles never change),
+    # so migration 4's (user_id, name, id) and (user_id, year, id)
+    # indexes keep serving list pages in order; the genre one moves to
+    # the genre id
+    "CREATE INDEX IF NOT EXISTS movies_user_genre_id_name_id_idx "
+    "ON movies (user_id, genre_id, name, id)",
+    "DROP INDEX IF EXISTS movies_user_id_idx",
+    "DROP INDEX IF EXISTS movies_user_name_trgm_idx",
+    "DROP INDEX IF EXISTS movies_user_lower_name_idx",
+    # Dropping the columns drops the remaining indexes built on them
+    "ALTER TABLE movies DROP COLUMN IF EXISTS name_tsv, "
+    "DROP COLUMN IF EXISTS genre",
+    # Name search moves to the shared titles
+    "CREATE INDEX IF NOT EXISTS titles_name_tsv_idx "
+    "ON titles USING gin (name_tsv)",
+    "CREATE INDEX IF NOT EXISTS titles_name_trgm_idx "
+    "ON titles USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS titles_lower_name_idx "
+    "ON titles (lower(name) text_pattern_ops)",
+]
+
+
+def compact_movies(cur):
+    """
+    Convert the movies written since migration 8 finished (by instances
+    still running the previous release), then drop the converted
+    columns. The table lock keeps new ones from arriving in between.
+    """
+    cur.execute("LOCK TABLE movies IN ACCESS EXCLUSIVE MODE")
+    while not convert_movies_batch(cur):
+        pass
+    for statement in COMPACT_MOVIES_SQL:
+        cur.execute(statement)
+
+
+MIGRATIONS = [
+    Migration(
+        1,
+        "Create movies table",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS movies (
+                id SERIAL PRIMARY KEY,
+                user_id INT NOT NULL,
+                name VARCHAR(255) NOT NULL,
+                genre VARCHAR(100) NOT NULL,
+                year INT NOT NULL
+            )
+            """,
+        ],
+    ),
+    Migration(
+        2,
+        "Index movies by user_id",
+        [
+            "CREATE INDEX IF NOT EXISTS movies_user_id_idx "
+            "ON movies (user_id)",
+        ],
+    ),
+    Migration(
+        3,
+        "Unique (user_id, name, year) per movie",
+        remove_duplicate_movies,
+    ),
+    Migration(
+        4,
+        "Keyset pagination indexes for movie listing",
+        [
+            "CREATE INDEX IF NOT EXISTS movies_user_name_id_idx "
+            "ON movies (user_id, name, id)",
+            "CREATE INDEX IF NOT EXISTS movies_user_year_id_idx "
+            "ON movies (user_id, year, id)",
+            "CREATE INDEX IF NOT EXISTS movies_user_genre_name_id_idx "
+            "ON movies (user_id, genre, name, id)",
+        ],
+    ),
+    Migration(
+        5,
+        "Per-user catalogue versions for movie list ETags",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS movie_versions (
+                user_id INT PRIMARY KEY,
+                version BIGINT NOT NULL
+            )
+            """,
+        ],
+    ),
+    Migration(
+        6,
+        "Full-text, trigram and prefix search indexes on movie names",
+        [
+            # btree_gin lets the GIN indexes lead with user_id, so a
+            # search only visits the searching user's entries
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            "CREATE EXTENSION IF NOT EXISTS btree_gin",
+            # 'simple' keeps every word: titles like "It" or "Her" are
+            # stop words to the language configurations
+            """
+            ALTER TABLE movies ADD COLUMN IF NOT EXISTS name_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('simple', name)) STORED
+            """,
+            "CREATE INDEX IF NOT EXISTS movies_user_name_tsv_idx "
+            "ON movies USING gin (user_id, name_tsv)",
+            "CREATE INDEX IF NOT EXISTS movies_user_name_trgm_idx "
+            "ON movies USING gin (user_id, name gin_trgm_ops)",
+            "CREATE INDEX IF NOT EXISTS movies_user_lower_name_idx "
+            "ON movies (user_id, lower(name) text_pattern_ops)",
+        ],
+    ),
+    Migration(
+        7,
+        "Shared titles and genres lookup tables",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS genres (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(100) NOT NULL UNIQUE
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS titles (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                year INT NOT NULL,
+                name_tsv tsvector
+                    GENERATED ALWAYS AS (to_tsvector('simple', name)) STORED,
+                UNIQUE (name, year)
+            )
+            """,
+            "ALTER TABLE movies ADD COLUMN IF NOT EXISTS title_id INT "
+            "REFERENCES titles (id)",
+            "ALTER TABLE movies ADD COLUMN IF NOT EXISTS genre_id INT "
+            "REFERENCES genres (id)",
+            # The rows migration 8 has still to convert
+            "CREATE INDEX IF NOT EXISTS movies_unconverted_idx "
+            "ON movies (id) WHERE title_id IS NULL",
+        ],
+    ),
+    Migration(
+        8,
+        "Convert movies to title and genre ids",
+        convert_movies_batch,
+        batched=True,
+    ),
+    Migration(
+        9,
+        "Movies refer to their title and genre by id",
+        compact_movies,
+    ),
+    Migration(
+        10,
+        "Search indexes on each user's movies again",
+        [
+            # Indexes on the shared titles made a search visit every
+            # matching title in the catalogue. Built over the movies'
+            # copies of the name, they lead with user_id as migration 6's
+            # did; the tsvector is an expression, not a stored column.
+            "CREATE INDEX IF NOT EXISTS movies_user_name_tsv_idx "
+            "ON movies USING gin (user_id, to_tsvector('simple', name))",
+            "CREATE INDEX IF NOT EXISTS movies_user_name_trgm_idx "
+            "ON movies USING gin (user_id, name gin_trgm_ops)",
+            "CREATE INDEX IF NOT EXISTS movies_user_lower_name_idx "
+            "ON movies (user_id, lower(name) text_pattern_ops)",
+            # Dropping the column drops its index
+            "ALTER TABLE titles DROP COLUMN IF EXISTS name_tsv",
+            "DROP INDEX IF EXISTS titles_name_trgm_idx",
+            "DROP INDEX IF EXISTS titles_lower_name_idx",
+        ],
+    ),
+]
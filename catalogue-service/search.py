@@ -0,0 +1,159 @@
+import base64
+import collections
+import json
+import os
+
+from listing import (
+    DEFAULT_PAGE_SIZE, LIST_FROM, MAX_PAGE_SIZE, InvalidListQuery, int_arg
+)
+
+# Accepted search string lengths, and the pg_trgm word similarity a
+# trigram match needs (pg_trgm.word_similarity_threshold)
+MIN_QUERY_LENGTH = 2
+MAX_QUERY_LENGTH = 255
+TRIGRAM_THRESHOLD = float(os.environ.get("SEARCH_TRIGRAM_THRESHOLD", "0.5"))
+
+# Mode -> (match condition, score expression) on the movie `m`, each
+# using the search string once as a parameter. Every condition is served
+# by an index on (user_id, name) from schema.py migration 10, so a search
+# only visits the searching user's movies.
+MODES = {
+    # Case-insensitive name prefix; shorter names (closer to the typed
+    # prefix) score higher
+    "prefix": (
+        "lower(m.name) LIKE %s",
+        "(length(%s)::real / length(m.name))",
+    ),
+    # Words of the query, websearch syntax ("quoted phrase", -excluded)
+    "fulltext": (
+        "to_tsvector('simple', m.name) "
+        "@@ websearch_to_tsquery('simple', %s)",
+        "ts_rank(to_tsvector('simple', m.name), "
+        "websearch_to_tsquery('simple', %s))",
+    ),
+    # Typo-tolerant: names with a part sharing enough trigrams with the
+    # query (word similarity, so a short query can match a long title)
+    "trigram": (
+        "%s <%% m.name",
+        "word_similarity(%s, m.name)",
+    ),
+}
+DEFAULT_MODE = "fulltext"
+
+SearchQuery = collections.namedtuple(
+    "SearchQuery",
+    ["text", "mode", "limit", "after", "genre", "year_min", "year_max"]
+)
+
+
+def _like_prefix(text):
+    escaped = (text.lower().replace("\\", "\\\\")
+               .replace("%", "\\%").replace("_", "\\_"))
+    return escaped + "%"
+
+
+def encode_search_cursor(query, row):
+    # Rows are (name, genre, year, id, score): results are ordered by
+    # score (descending), name and id, and the cursor stores all three
+    payload = {"m": query.mode, "q": query.text,
+               "k": [row[4], row[0], row[3]]}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_search_cursor(cursor, mode, text):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        score, name, last_id = payload["k"]
+        if payload["m"] != mode or payload["q"] != text:
+            raise InvalidListQuery("Cursor was issued for a different search")
+        return float(score), str(name), int(last_id)
+    except InvalidListQuery:
+        raise
+    except (ValueError, TypeError, KeyError):
+        raise InvalidListQuery("Invalid cursor")
+
+
+def parse_search_query(args):
+    """
+    Build a SearchQuery from request query arguments (q, mode, limit,
+    after, genre, year_min, year_max), raising InvalidListQuery on bad
+    input.
+    """
+    text = " ".join((args.get("q") or "").split())
+    if not MIN_QUERY_LENGTH <= len(text) <= MAX_QUERY_LENGTH:
+        raise InvalidListQuery(
+            f"q must be between {MIN_QUERY_LENGTH} and {MAX_QUERY_LENGTH} "
+            "characters"
+        )
+    mode = args.get("mode") or DEFAULT_MODE
+    if mode not in MODES:
+        raise InvalidListQuery(
+            "mode must be one of: " + ", ".join(sorted(MODES))
+        )
+    limit = int_arg(args, "limit")
+    if limit is None:
+        limit = DEFAULT_PAGE_SIZE
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise InvalidListQuery(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    after = args.get("after") or None
+    return SearchQuery(
+        text=text,
+        mode=mode,
+        limit=limit,
+        after=decode_search_cursor(after, mode, text) if after else None,
+        genre=args.get("genre") or None,
+        year_min=int_arg(args, "year_min"),
+        year_max=int_arg(args, "year_max"),
+    )
+
+
+def prepare_search(cur, query):
+    """Session settings a search needs, local to the current transaction."""
+    if query.mode == "trigram":
+        cur.execute(
+            "SELECT set_config("
+            "'pg_trgm.word_similarity_threshold', %s, true)",
+            (str(TRIGRAM_THRESHOLD),)
+        )
+
+
+def build_search_sql(user_id, query):
+    """
+    Return (sql, params) selecting one page of ranked matches plus one
+    extra row, which tells whether another page follows.
+    """
+    match, score = MODES[query.mode]
+    term = _like_prefix(query.text) if query.mode == "prefix" else query.text
+    conditions = ["m.user_id = %s", match]
+    params = [user_id, term]
+    if query.genre:
+        conditions.append("g.name = %s")
+        params.append(query.genre)
+    if query.year_min is not None:
+        conditions.append("m.year >= %s")
+        params.append(query.year_min)
+    if query.year_max is not None:
+        conditions.append("m.year <= %s")
+        params.append(query.year_max)
+
+    # Score the matches once, then page through them by (score desc,
+    # name, id); -score turns that into a single ascending row comparison.
+    # The scores are real: widened to float8 here, the value ordered by is
+    # exactly the one the cursor carries back, so rows tied on a page's
+    # last score are not skipped.
+    sql = (
+        "SELECT name, genre, year, id, score FROM ("
+        "SELECT m.name, g.name AS genre, m.year, m.id, "
+        f"({score})::float8 AS score FROM {LIST_FROM} "
+        f"WHERE {' AND '.join(conditions)}"
+        ") AS matches "
+    )
+    params.insert(0, query.text)
+    if query.after:
+        sql += "WHERE (-score, name, id) > (-%s::float8, %s, %s) "
+        params.extend(query.after)
+    sql += "ORDER BY score DESC, name, id LIMIT %s"
+    params.append(query.limit + 1)
+    return sql, params
@@ -0,0 +1,85 @@
+"""
+Coalescing of concurrent identical calls (single-flight).
+
+The first caller for a key runs the function; callers arriving with the
+same key while it runs wait for it and share its result (or exception)
+instead of repeating the work. Nothing is kept once the call finishes:
+this only deduplicates calls that overlap in time, within one process.
+"""
+import logging
+import os
+import threading
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Followers wait at most `wait_timeout` seconds for the leader, then run
+    the function themselves so a stuck call cannot hold them all. With
+    `enabled` false every caller runs the function.
+    """
+
+    def __init__(self, wait_timeout=10.0, enabled=True):
+        self.wait_timeout = wait_timeout
+        self.enabled = enabled
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "coalesced": 0, "wait_timeouts": 0}
+
+    def do(self, key, function):
+        if not self.enabled:
+            return function()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self._stats["leaders"] += 1
+                leader = True
+            else:
+                self._stats["coalesced"] += 1
+                leader = False
+
+        if not leader:
+            if call.done.wait(self.wait_timeout):
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            logging.warning("Coalesced call still running after %ss; "
+                            "running it again", self.wait_timeout)
+            with self._lock:
+                self._stats["wait_timeouts"] += 1
+            return function()
+
+        try:
+            call.result = function()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
+
+
+# Build a single-flight group from the SINGLEFLIGHT_* environment variables
+def singleflight_from_env():
+    return SingleFlight(
+        wait_timeout=float(os.environ.get("SINGLEFLIGHT_WAIT", "10")),
+        enabled=os.environ.get("SINGLEFLIGHT_ENABLED", "1")
+        not in ("0", "false"),
+    )
@@ -0,0 +1,73 @@
+import os
+import sys
+
+import pytest
+
+# The service's modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Database tests run in a throwaway schema of the scratch database named
+# by the usual PG* variables; PGOPTIONS points every connection (also the
+# service's own pool) at it
+TEST_SCHEMA = "catalogue_test"
+REQUIRED_EXTENSIONS = ("pg_trgm", "btree_gin")
+os.environ.setdefault(
+    "PGOPTIONS", f"-c search_path={TEST_SCHEMA},public"
+)
+
+
+@pytest.fixture(scope="session")
+def database():
+    """A connection to the migrated test schema (skips without one)."""
+    if not os.environ.get("PGDATABASE"):
+        pytest.skip("PGDATABASE is not set: no scratch database to use")
+    psycopg2 = pytest.importorskip("psycopg2")
+    from migrations import run_migrations
+    import schema
+
+    conn = psycopg2.connect("")
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT count(*) FROM pg_available_extensions WHERE name = ANY(%s)",
+        (list(REQUIRED_EXTENSIONS),)
+    )
+    if cur.fetchone()[0] < len(REQUIRED_EXTENSIONS):
+        conn.close()
+        pytest.skip("the search migrations need pg_trgm and btree_gin")
+    cur.execute(f"DROP SCHEMA IF EXISTS {TEST_SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {TEST_SCHEMA}")
+    conn.commit()
+    run_migrations(conn, schema.COMPONENT, schema.MIGRATIONS)
+    yield conn
+    conn.rollback()
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {TEST_SCHEMA} CASCADE")
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def cur(database):
+    """A cursor on emptied movie tables, rolled back afterwards."""
+    import movie_store
+
+    movie_store._genre_ids.clear()
+    cur = database.cursor()
+    cur.execute(
+        "TRUNCATE movies, titles, genres, movie_versions RESTART IDENTITY"
+    )
+    database.commit()
+    yield cur
+    database.rollback()
+    cur.close()
+
+
+@pytest.fixture
+def client(cur, monkeypatch):
+    """A test client of the catalogue app, on the emptied test tables."""
+    import catalogue
+    from movie_cache import LocalBackend, MovieListCache
+
+    monkeypatch.setattr(catalogue, "movie_cache",
+                        MovieListCache(LocalBackend()))
+    return catalogue.app.test_client()
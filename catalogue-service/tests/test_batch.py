@@ -0,0 +1,91 @@
+import pytest
+
+from batch import ROLLED_BACK, InvalidBatch, parse_batch
+
+
+def add(name, year=2000, genre="Drama"):
+    return {"op": "add", "name": name, "genre": genre, "year": year}
+
+
+def delete(name, year=2000):
+    return {"op": "delete", "name": name, "year": year}
+
+
+def run(client, operations, atomic=False, user_id=1):
+    return client.post(
+        f"/catalogue/movies/batch?user_id={user_id}",
+        json={"operations": operations, "atomic": atomic}
+    )
+
+
+def listed(client, user_id=1):
+    body = client.get(f"/catalogue/movies?user_id={user_id}").get_json()
+    return sorted(movie["name"] for movie in body.get("movies", []))
+
+
+def test_parse_batch_rejects_bad_bodies():
+    with pytest.raises(InvalidBatch):
+        parse_batch([], 10)
+    with pytest.raises(InvalidBatch):
+        parse_batch({"operations": []}, 10)
+    with pytest.raises(InvalidBatch):
+        parse_batch({"operations": [{}] * 11}, 10)
+    assert parse_batch({"operations": [{}], "atomic": 1}, 10) == ([{}], True)
+
+
+def test_operations_run_in_order(client):
+    response = run(client, [
+        add("Alien"), add("Heat"), delete("Alien"), add("Heat"), {"op": "x"}
+    ])
+    body = response.get_json()
+
+    assert response.status_code == 200
+    assert [r["status"] for r in body["results"]] == [201, 201, 200, 409, 400]
+    assert body["committed"] is True
+    assert (body["applied"], body["failed"]) == (3, 2)
+    assert listed(client) == ["Heat"]
+
+
+def test_atomic_rollback_reports_nothing_applied(client):
+    response = run(client, [add("Alien"), delete("Heat")], atomic=True)
+    body = response.get_json()
+
+    assert response.status_code == 409
+    assert body["committed"] is False
+    assert body["applied"] == 0
+    rolled_back, failed = body["results"]
+    assert rolled_back["status"] == ROLLED_BACK
+    assert "movie" not in rolled_back
+    assert failed["status"] == 404
+    assert listed(client) == []
+
+
+def test_batch_with_nothing_applied_is_not_committed(client):
+    response = run(client, [delete("Alien"), add("", 1999)])
+    body = response.get_json()
+
+    assert response.status_code == 200
+    assert body["committed"] is False
+    assert (body["applied"], body["failed"]) == (0, 2)
+
+
+def test_out_of_range_year_fails_only_its_operation(client):
+    response = run(client, [
+        add("Alien"), add("Heat", year=99999999999), delete("Ran", year=1.5)
+    ])
+    body = response.get_json()
+
+    assert response.status_code == 200
+    assert [r["status"] for r in body["results"]] == [201, 400, 400]
+    assert body["results"][1]["error"].startswith("year must")
+    assert listed(client) == ["Alien"]
+
+
+def test_out_of_range_year_rolls_back_an_atomic_batch(client):
+    response = run(client, [add("Alien"), add("Heat", year=2 ** 31)],
+                   atomic=True)
+    body = response.get_json()
+
+    assert response.status_code == 409
+    assert [r["status"] for r in body["results"]] == [ROLLED_BACK, 400]
+    assert listed(client) == []
@@ -0,0 +1,121 @@
+import io
+import json
+
+import pytest
+
+from bulk_import import (
+    MalformedStream, iter_json_array, iter_ndjson, validate_movie
+)
+
+
+def test_json_array_is_parsed_across_chunk_boundaries():
+    values = [{"name": "Heat é", "year": 1995}, 12345, "x", [1, 2], None]
+    raw = json.dumps(values, ensure_ascii=False).encode("utf-8")
+
+    for chunk_size in (1, 2, 3, 7, 64):
+        stream = io.BytesIO(raw)
+        assert list(iter_json_array(stream, chunk_size)) == values
+
+
+@pytest.mark.parametrize("raw", [b"{}", b"[1, 2", b"[1 2]", b"[1,]", b""])
+def test_malformed_arrays_are_rejected(raw):
+    with pytest.raises(MalformedStream):
+        list(iter_json_array(io.BytesIO(raw), 2))
+
+
+def test_ndjson_reports_bad_lines_without_stopping():
+    stream = io.BytesIO(b'{"a": 1}\n\nnot json\n{"b": 2}\n')
+
+    rows = list(iter_ndjson(stream))
+    assert [row for row, _ in rows] == [{"a": 1}, None, {"b": 2}]
+    assert rows[1][1].startswith("Invalid JSON")
+
+
+@pytest.mark.parametrize("row, error", [
+    ({"name": "Heat", "genre": "Crime", "year": "1995"}, None),
+    ({"name": "Heat", "genre": "Crime"}, "All fields"),
+    ({"name": "x" * 256, "genre": "Crime", "year": 1995}, "name must"),
+    ({"name": "Heat", "genre": "Crime", "year": "soon"}, "year must"),
+    ({"name": "Heat", "genre": "Crime", "year": 1995.7}, "year must"),
+    ({"name": "Heat", "genre": "Crime", "year": 1995.0}, "year must"),
+    ({"name": "Heat", "genre": "Crime", "year": True}, "year must"),
+    ({"name": "Heat", "genre": "Crime", "year": "1_995"}, "year must"),
+    ({"name": "Heat", "genre": "Crime", "year": 2 ** 31}, "year must"),
+    ({"name": "Heat", "genre": "Crime", "year": -2 ** 31 - 1}, "year must"),
+    ({"name": "Heat", "genre": "Crime", "year": 99999999999}, "year must"),
+    ([], "Movie must be a JSON object"),
+])
+def test_validate_movie(row, error):
+    movie, message = validate_movie(row)
+
+    if error is None:
+        assert movie == ("Heat", "Crime", 1995)
+    else:
+        assert message.startswith(error)
+
+
+@pytest.mark.parametrize("mimetype", ["application/json",
+                                      "application/x-ndjson"])
+def test_import_loads_valid_rows_in_batches(client, monkeypatch, mimetype):
+    import catalogue
+
+    monkeypatch.setattr(catalogue, "BULK_IMPORT_BATCH_SIZE", 2)
+    client.post("/catalogue/movies", json={
+        "user_id": 1, "name": "Heat", "genre": "Crime", "year": 1995
+    })
+    rows = [
+        {"name": "Alien", "genre": "Horror", "year": 1979},
+        {"name": "Heat", "genre": "Crime", "year": 1995},
+        {"name": "Ran", "genre": "Drama", "year": 1985},
+        {"name": "Alien", "genre": "Horror", "year": 1979},
+        {"name": "Up"},
+        {"name": "Tab\tand\\slash", "genre": "New\ngenre", "year": 2001},
+    ]
+    if mimetype == "application/json":
+        body = json.dumps(rows)
+    else:
+        body = "\n".join(json.dumps(row) for row in rows)
+
+    response = client.post("/catalogue/movies/bulk?user_id=1", data=body,
+                           content_type=mimetype)
+
+    report = response.get_json()
+    assert response.status_code == 200
+    assert (report["received"], report["inserted"], report["rejected"]) \
+        == (6, 3, 3)
+    assert [error["index"] for error in report["errors"]] == [1, 3, 4]
+    listed = client.get("/catalogue/movies?user_id=1").get_json()["movies"]
+    assert sorted((m["name"], m["genre"], m["year"]) for m in listed) == [
+        ("Alien", "Horror", 1979), ("Heat", "Crime", 1995),
+        ("Ran", "Drama", 1985), ("Tab\tand\\slash", "New\ngenre", 2001),
+    ]
+
+
+def test_years_the_table_cannot_hold_are_rejected_per_row(client):
+    rows = [
+        {"name": "Heat", "genre": "Crime", "year": 99999999999},
+        {"name": "Ran", "genre": "Drama", "year": 1985.5},
+        {"name": "Alien", "genre": "Horror", "year": 1979},
+        {"name": "Max", "genre": "Drama", "year": 2 ** 31 - 1},
+    ]
+
+    response = client.post("/catalogue/movies/bulk?user_id=1", json=rows)
+
+    report = response.get_json()
+    assert response.status_code == 200
+    assert (report["inserted"], report["rejected"]) == (2, 2)
+    assert [error["index"] for error in report["errors"]] == [0, 1]
+    assert all(error["error"].startswith("year must")
+               for error in report["errors"])
+
+
+def test_malformed_import_is_rolled_back(client):
+    response = client.post(
+        "/catalogue/movies/bulk?user_id=1",
+        data='[{"name": "Heat", "genre": "Crime", "year": 1995}, oops]',
+        content_type="application/json",
+    )
+
+    assert response.status_code == 400
+    assert client.get("/catalogue/movies?user_id=1").get_json() \
+        .get("movies") is None
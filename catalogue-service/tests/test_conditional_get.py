@@ -0,0 +1,123 @@
+import gzip
+
+import pytest
+
+import compression
+import etags
+
+LIST = "/catalogue/movies?user_id=1"
+
+
+def add(client, name, user_id=1):
+    response = client.post("/catalogue/movies", json={
+        "user_id": user_id, "name": name, "genre": "Drama", "year": 2000
+    })
+    assert response.status_code == 201
+
+
+def test_cached_values_keep_their_etag():
+    assert etags.unpack(etags.pack("3-abc", b'{"movies": []}')) == (
+        "3-abc", b'{"movies": []}'
+    )
+
+
+def test_list_etags_differ_by_user_version_and_query():
+    tags = {
+        etags.list_etag(1, 1, ("name", 20)),
+        etags.list_etag(2, 1, ("name", 20)),
+        etags.list_etag(1, 2, ("name", 20)),
+        etags.list_etag(1, 1, ("-year", 20)),
+    }
+
+    assert len(tags) == 4
+
+
+def test_unchanged_lists_answer_not_modified(client):
+    add(client, "Heat")
+    etag = client.get(LIST).headers["ETag"]
+    assert etag.startswith('W/"')
+
+    response = client.get(LIST, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.get_data() == b""
+    assert response.headers["ETag"] == etag
+
+
+def test_not_modified_needs_no_database_on_a_cache_hit(client,
+                                                       monkeypatch):
+    import catalogue
+
+    add(client, "Heat")
+    etag = client.get(LIST).headers["ETag"]
+    monkeypatch.setattr(catalogue, "get_db_connection",
+                        lambda: (None, {"error": "down"}))
+
+    assert client.get(LIST, headers={"If-None-Match": etag}) \
+        .status_code == 304
+
+
+def test_uncached_pages_are_checked_against_the_version(client,
+                                                       monkeypatch):
+    import catalogue
+
+    add(client, "Heat")
+    add(client, "Alien")
+    cursor = client.get(LIST + "&limit=1").get_json()["next_cursor"]
+    page = LIST + "&limit=1&after=" + cursor  # follow-up pages: no cache
+    etag = client.get(page).headers["ETag"]
+
+    def no_list_query(*args):
+        raise AssertionError("the list query ran")
+
+    monkeypatch.setattr(catalogue, "build_list_sql", no_list_query)
+    assert client.get(page, headers={"If-None-Match": etag}) \
+        .status_code == 304
+
+
+def test_writes_change_the_etag(client):
+    add(client, "Heat")
+    etag = client.get(LIST).headers["ETag"]
+    other_user = client.get("/catalogue/movies?user_id=2").headers["ETag"]
+
+    add(client, "Alien")
+    add(client, "Ran", user_id=2)
+    response = client.get(LIST, headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert client.get("/catalogue/movies?user_id=2",
+                      headers={"If-None-Match": other_user}) \
+        .status_code == 200
+    assert [m["name"] for m in response.get_json()["movies"]] == [
+        "Alien", "Heat"
+    ]
+
+
+@pytest.fixture
+def compressing(monkeypatch):
+    monkeypatch.setattr(compression, "ENCODINGS", ["gzip"])
+    monkeypatch.setattr(compression, "MIN_BYTES", 200)
+
+
+def test_large_lists_are_gzipped_on_request(client, compressing):
+    for name in ("Heat", "Alien", "Ran", "Brazil", "Ikiru", "Vertigo"):
+        add(client, name)
+    plain = client.get(LIST)
+
+    response = client.get(LIST, headers={"Accept-Encoding": "gzip"})
+
+    assert plain.headers.get("Content-Encoding") is None
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.get_data()) == plain.get_data()
+    assert response.headers["ETag"] == plain.headers["ETag"]
+
+
+def test_small_lists_go_out_as_is(client, compressing):
+    add(client, "Heat")
+
+    response = client.get(LIST, headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers.get("Content-Encoding") is None
+    assert response.get_json()["movies"][0]["name"] == "Heat"
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+from db_pool import ConnectionPool, PoolTimeout, pool_from_env  # noqa: E402
+
+
+@pytest.fixture
+def pool():
+    """A one-connection pool on the scratch database (PG* variables)."""
+    if not os.environ.get("PGDATABASE"):
+        pytest.skip("PGDATABASE is not set: no scratch database to use")
+    pool = ConnectionPool({}, minconn=0, maxconn=1, wait_timeout=0.1)
+    yield pool
+    pool.closeall()
+
+
+def test_connection_budget_is_split_between_processes(monkeypatch):
+    monkeypatch.delenv("DB_POOL_MAX", raising=False)
+    monkeypatch.setenv("DB_MAX_CONNECTIONS", "20")
+
+    assert pool_from_env({}, processes=1).maxconn == 20
+    assert pool_from_env({}, processes=4).maxconn == 5
+    assert pool_from_env({}, processes=64).maxconn == 1
+
+
+def test_pool_max_overrides_the_split(monkeypatch):
+    monkeypatch.setenv("DB_POOL_MAX", "3")
+    monkeypatch.setenv("DB_POOL_MIN", "8")
+
+    pool = pool_from_env({}, processes=4)
+    assert (pool.minconn, pool.maxconn) == (3, 3)
+
+
+def test_connections_are_reused(pool):
+    conn = pool.getconn()
+    pool.putconn(conn)
+
+    assert pool.getconn() is conn
+    stats = pool.stats()
+    assert (stats["checkouts"], stats["connections_created"]) == (2, 1)
+
+
+def test_exhausted_pool_times_out(pool):
+    pool.getconn()
+
+    with pytest.raises(PoolTimeout) as raised:
+        pool.getconn(timeout=0.05)
+    # Callers handling connection failures handle it unchanged
+    assert isinstance(raised.value, psycopg2.OperationalError)
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_waiter_gets_the_returned_connection(pool):
+    conn = pool.getconn()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.getconn(5)))
+    waiter.start()
+    while not pool.stats()["waiting"]:
+        time.sleep(0.01)
+    pool.putconn(conn)
+    waiter.join()
+
+    assert got == [conn]
+
+
+def test_returned_connection_is_rolled_back(pool):
+    conn = pool.getconn()
+    conn.cursor().execute("SELECT 1")
+    pool.putconn(conn)
+
+    assert conn.get_transaction_status() == \
+        psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+def test_dead_connection_is_replaced(pool):
+    pool.health_check_interval = 0
+    conn = pool.getconn()
+    pid = conn.get_backend_pid()
+    pool.putconn(conn)
+    killer = psycopg2.connect("")
+    killer.cursor().execute("SELECT pg_terminate_backend(%s)", (pid,))
+    killer.close()
+
+    fresh = pool.getconn()
+    assert fresh is not conn
+    assert pool.stats()["health_check_failures"] == 1
+
+
+def test_idle_connections_are_closed(pool):
+    pool.idle_timeout = 0
+    conn = pool.getconn()
+    pool.putconn(conn)
+
+    assert pool.getconn() is not conn
+    assert conn.closed
+
+
+def test_forked_child_opens_its_own_connections(pool):
+    conn = pool.getconn()
+    pool._pid = -1  # as seen from a forked worker
+
+    assert pool.getconn() is not conn
+    assert not conn.closed  # still the parent's to use
+    conn.close()
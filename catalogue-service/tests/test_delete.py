@@ -0,0 +1,61 @@
+import pytest
+
+
+@pytest.fixture
+def movies(client):
+    for user_id, name, year in ((1, "Heat", 1995), (1, "Alien", 1979),
+                                (1, "Ran", 1985), (2, "Heat", 1995)):
+        client.post("/catalogue/movies", json={
+            "user_id": user_id, "name": name, "genre": "Drama", "year": year
+        })
+    return client
+
+
+def names(client, user_id):
+    body = client.get(f"/catalogue/movies?user_id={user_id}").get_json()
+    return [movie["name"] for movie in body.get("movies", [])]
+
+
+def test_delete_returns_the_removed_movie(movies):
+    response = movies.delete("/catalogue/movies", json={
+        "user_id": 1, "name": "Heat", "year": 1995
+    })
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["deleted_count"] == 1
+    assert body["deleted"][0]["name"] == "Heat"
+    assert names(movies, 1) == ["Alien", "Ran"]
+    assert names(movies, 2) == ["Heat"]
+
+
+def test_delete_of_a_missing_movie_is_404(movies):
+    response = movies.delete("/catalogue/movies", json={
+        "user_id": 1, "name": "Heat", "year": 1996
+    })
+
+    assert response.status_code == 404
+    assert names(movies, 1) == ["Alien", "Heat", "Ran"]
+
+
+def test_bulk_delete_reports_what_was_not_found(movies):
+    response = movies.delete("/catalogue/movies/bulk", json={
+        "user_id": 1,
+        "movies": [{"name": "Heat", "year": 1995}, ["Ran", "1985"],
+                   {"name": "Up", "year": 2009}],
+    })
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert sorted(m["name"] for m in body["deleted"]) == ["Heat", "Ran"]
+    assert body["not_found"] == [{"name": "Up", "year": 2009}]
+    assert names(movies, 1) == ["Alien"]
+
+
+@pytest.mark.parametrize("movies_arg", [[], [{"name": "Heat"}], [["Heat"]]])
+def test_bulk_delete_rejects_bad_keys(client, movies_arg):
+    response = client.delete("/catalogue/movies/bulk", json={
+        "user_id": 1, "movies": movies_arg
+    })
+
+    assert response.status_code == 400
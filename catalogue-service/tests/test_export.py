@@ -0,0 +1,67 @@
+import csv
+import io
+import json
+
+import pytest
+
+
+@pytest.fixture
+def movies(client):
+    for name, year in (("Heat", 1995), ('Say "Hi", Bob', 2001)):
+        client.post("/catalogue/movies", json={
+            "user_id": 1, "name": name, "genre": "Drama", "year": year
+        })
+    client.post("/catalogue/movies", json={
+        "user_id": 2, "name": "Ran", "genre": "Drama", "year": 1985
+    })
+    return client
+
+
+def test_export_streams_ndjson(movies):
+    with movies.get("/catalogue/movies/export?user_id=1") as response:
+        body = response.get_data()
+
+    assert response.mimetype == "application/x-ndjson"
+    assert "movies.ndjson" in response.headers["Content-Disposition"]
+    rows = [json.loads(line) for line in body.splitlines()]
+    assert rows == [
+        {"name": "Heat", "genre": "Drama", "year": 1995},
+        {"name": 'Say "Hi", Bob', "genre": "Drama", "year": 2001},
+    ]
+
+
+def test_export_streams_csv_in_chunks(movies, monkeypatch):
+    import catalogue
+
+    monkeypatch.setattr(catalogue, "EXPORT_CHUNK_SIZE", 1)
+    monkeypatch.setattr(catalogue, "EXPORT_ITERSIZE", 1)
+    with movies.get("/catalogue/movies/export?user_id=1&format=csv") as \
+            response:
+        chunks = list(response.response)
+
+    assert response.mimetype == "text/csv"
+    assert len(chunks) == 2  # a chunk per row, the header with the first
+    rows = csv.reader(io.StringIO(b"".join(chunks).decode()))
+    assert list(rows) == [
+        ["name", "genre", "year"],
+        ["Heat", "Drama", "1995"],
+        ['Say "Hi", Bob', "Drama", "2001"],
+    ]
+
+
+def test_export_rejects_bad_queries(client):
+    assert client.get(
+        "/catalogue/movies/export?user_id=1&format=xml"
+    ).status_code == 400
+    assert client.get("/catalogue/movies/export").status_code == 400
+
+
+def test_export_returns_its_connection_when_closed(movies):
+    import catalogue
+
+    # A client that hangs up before reading still gets it released
+    response = movies.get("/catalogue/movies/export?user_id=1")
+    assert catalogue.db_pool.stats()["in_use"] == 1
+    response.close()
+
+    assert catalogue.db_pool.stats()["in_use"] == 0
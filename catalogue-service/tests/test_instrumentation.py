@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip("prometheus_client")
+
+from flask import Flask  # noqa: E402
+
+from instrumentation import (  # noqa: E402
+    instrument_app, metrics_payload, register_stats
+)
+
+
+def test_stats_are_exported_per_source():
+    register_stats("test_pool", "pool", lambda: {
+        "a": {"checkouts": 3, "size": 2, "backend": "x", "ok": True},
+    }, counters=("checkouts",))
+
+    payload = metrics_payload()[0].decode()
+    assert 'test_pool_checkouts_total{pool="a"} 3.0' in payload
+    assert 'test_pool_size{pool="a"} 2.0' in payload
+    assert "test_pool_backend" not in payload
+    assert "test_pool_ok" not in payload
+
+
+def test_registering_a_prefix_again_replaces_it():
+    register_stats("test_cache", "cache", lambda: {"a": {"hits": 1}})
+    register_stats("test_cache", "cache", lambda: {"b": {"hits": 2}})
+
+    payload = metrics_payload()[0].decode()
+    assert 'test_cache_hits{cache="b"} 2.0' in payload
+    assert 'cache="a"' not in payload
+
+
+def test_requests_are_timed_by_route():
+    app = Flask(__name__)
+    instrument_app(app, "test")
+    app.add_url_rule("/items/<int:item>", "item", lambda item: "ok")
+    client = app.test_client()
+    client.get("/items/1")
+    client.get("/items/2")
+
+    payload = client.get("/metrics").get_data(as_text=True)
+    assert ('http_request_duration_seconds_count{method="GET",'
+            'route="/items/<int:item>",service="test",status="200"} 2.0'
+            in payload)
@@ -0,0 +1,122 @@
+import pytest
+
+from listing import (
+    InvalidListQuery, build_list_sql, encode_cursor, parse_list_query
+)
+from movie_store import insert_movie
+
+MOVIES = [
+    ("Heat", "Crime", 1995),
+    ("Alien", "Horror", 1979),
+    ("Aliens", "Action", 1986),
+    ("Brazil", "Comedy", 1985),
+    ("Ran", "Drama", 1985),
+    ("Up", "Comedy", 2009),
+    ("Fargo", "Crime", 1996),
+]
+
+
+def list_pages(cur, user_id, args):
+    """Follow next cursors to the end; return every row seen."""
+    rows, after = [], None
+    while True:
+        query = parse_list_query(dict(args, after=after))
+        cur.execute(*build_list_sql(user_id, query))
+        page = cur.fetchall()
+        rows.extend(page[:query.limit])
+        if len(page) <= query.limit:
+            return rows
+        after = encode_cursor(query.sort, page[query.limit - 1])
+
+
+@pytest.fixture
+def movies(cur):
+    for name, genre, year in MOVIES:
+        insert_movie(cur, 1, name, genre, year)
+    insert_movie(cur, 2, "Amadeus", "Drama", 1984)
+    return cur
+
+
+def test_cursor_is_bound_to_its_sort():
+    cursor = encode_cursor("year", ("Heat", "Crime", 1995, 7))
+
+    assert parse_list_query({"sort": "year", "after": cursor}).after == \
+        (1995, 7)
+    with pytest.raises(InvalidListQuery):
+        parse_list_query({"sort": "name", "after": cursor})
+
+
+@pytest.mark.parametrize("sort, key, reverse", [
+    ("name", lambda m: m[0], False),
+    ("-name", lambda m: m[0], True),
+    ("year", lambda m: m[2], False),
+    ("-year", lambda m: m[2], True),
+])
+def test_pages_follow_the_sort(movies, sort, key, reverse):
+    rows = list_pages(movies, 1, {"sort": sort, "limit": "2"})
+
+    assert sorted(row[:3] for row in rows) == sorted(MOVIES)
+    assert [key(row[:3]) for row in rows] == \
+        sorted(map(key, MOVIES), reverse=reverse)
+    # Ties (1985) are broken by id in the sort's direction
+    ids = [row[3] for row in rows if row[2] == 1985]
+    assert ids == sorted(ids, reverse=reverse)
+
+
+def test_filters_apply(movies):
+    rows = list_pages(movies, 1, {
+        "genre": "Crime", "year_min": "1990", "year_max": "1995",
+        "limit": "1",
+    })
+
+    assert [row[:3] for row in rows] == [("Heat", "Crime", 1995)]
+    assert list_pages(movies, 1, {"genre": "Western"}) == []
+
+
+@pytest.mark.parametrize("args, index", [
+    ({"sort": "name"}, "movies_user_name_id_idx"),
+    ({"sort": "-year"}, "movies_user_year_id_idx"),
+    ({"genre": "Crime"}, "movies_user_genre_id_name_id_idx"),
+])
+def test_pages_are_read_in_index_order(movies, args, index):
+    # No sort step: the page comes straight off the index, and the scan
+    # stops once the page is full
+    movies.execute("SET LOCAL enable_seqscan = off")
+    query = parse_list_query(dict(args, after=encode_cursor(
+        args.get("sort", "name"), ("Brazil", "Comedy", 1985, 4)
+    )))
+    sql, params = build_list_sql(1, query)
+    movies.execute("EXPLAIN " + sql, params)
+    plan = "\n".join(row[0] for row in movies.fetchall())
+
+    assert index in plan
+    assert "Sort" not in plan
+
+
+def test_list_route_pages_with_next_cursor(client):
+    for year in range(2000, 2005):
+        client.post("/catalogue/movies", json={
+            "user_id": 1, "name": f"Film {year}", "genre": "Drama",
+            "year": year
+        })
+
+    seen, after = [], ""
+    while True:
+        body = client.get(
+            f"/catalogue/movies?user_id=1&sort=-year&limit=2&after={after}"
+        ).get_json()
+        seen.extend(movie["year"] for movie in body["movies"])
+        after = body["next_cursor"]
+        if after is None:
+            break
+
+    assert seen == [2004, 2003, 2002, 2001, 2000]
+
+
+@pytest.mark.parametrize("args", [
+    "sort=rating", "limit=0", "limit=many", "year_min=old", "after=!!",
+])
+def test_list_route_rejects_bad_queries(client, args):
+    response = client.get(f"/catalogue/movies?user_id=1&{args}")
+
+    assert response.status_code == 400
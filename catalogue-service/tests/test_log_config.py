@@ -0,0 +1,111 @@
+import json
+import logging
+import sys
+import threading
+
+import log_config
+from tracing import tracer
+
+
+class Collect(logging.Handler):
+    """Keeps the records handed to it, and the thread that handled them."""
+
+    def __init__(self, block=None):
+        super().__init__()
+        self.records = []
+        self.threads = set()
+        self.block = block
+
+    def emit(self, record):
+        if self.block is not None:
+            self.block.wait(5)
+        self.threads.add(threading.current_thread())
+        self.records.append(record)
+
+
+def record(level=logging.INFO, msg="hello %s", args=("world",), **extra):
+    entry = logging.LogRecord("movies", level, __file__, 1, msg, args, None)
+    entry.__dict__.update(extra)
+    return entry
+
+
+def test_records_are_formatted_as_json_lines():
+    formatter = log_config.JsonFormatter("catalogue")
+
+    line = formatter.format(record(trace_id="abc", user_id=7))
+
+    entry = json.loads(line)
+    assert entry["message"] == "hello world"
+    assert entry["level"] == "INFO"
+    assert entry["service"] == "catalogue"
+    assert entry["trace_id"] == "abc"
+    assert entry["user_id"] == 7
+    assert "\n" not in line
+
+
+def test_exceptions_are_kept_in_the_line():
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        failed = logging.LogRecord("movies", logging.ERROR, __file__, 1,
+                                   "failed", (), sys.exc_info())
+
+    entry = json.loads(log_config.JsonFormatter("catalogue").format(failed))
+    assert "ValueError: boom" in entry["exception"]
+
+
+def test_debug_records_are_sampled():
+    sampler = log_config.DebugSampler(0.0)
+
+    assert not sampler.filter(record(logging.DEBUG))
+    assert sampler.filter(record(logging.INFO))
+    assert log_config.DebugSampler(1.0).filter(record(logging.DEBUG))
+
+
+def test_records_are_handled_on_the_listener_thread():
+    target = Collect()
+    handler = log_config.BackgroundHandler(target, 100)
+    span = tracer.start_span("request")
+    token = tracer.activate(span)
+    try:
+        handler.handle(record())
+    finally:
+        tracer.deactivate(token)
+    handler.stop()
+
+    [handled] = target.records
+    assert threading.current_thread() not in target.threads
+    # Formatting was left to the listener; the trace was captured here
+    assert handled.args == ("world",)
+    assert handled.trace_id == span.trace_id
+
+
+def test_a_full_queue_drops_instead_of_blocking():
+    release = threading.Event()
+    target = Collect(block=release)
+    handler = log_config.BackgroundHandler(target, 1)
+    try:
+        for _ in range(5):
+            handler.handle(record())
+        # One record is being written, one is queued, the rest dropped
+        assert handler.dropped >= 3
+    finally:
+        release.set()
+        handler.stop()
+    assert len(target.records) + handler.dropped == 5
+
+
+def test_configure_logging_replaces_the_root_handlers(monkeypatch):
+    root = logging.getLogger()
+    saved_handlers, saved_level = root.handlers[:], root.level
+    monkeypatch.setenv("LOG_LEVEL", "warning")
+    try:
+        handler = log_config.configure_logging("catalogue")
+
+        assert root.handlers == [handler]
+        assert root.level == logging.WARNING
+        assert isinstance(handler.target.formatter, log_config.JsonFormatter)
+        handler.stop()
+    finally:
+        root.handlers[:] = saved_handlers
+        root.setLevel(saved_level)
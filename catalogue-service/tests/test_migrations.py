@@ -0,0 +1,151 @@
+import pytest
+
+import schema
+from migrations import Migration, current_version, run_migrations
+
+SCRATCH_SCHEMA = "catalogue_migration_test"
+
+
+@pytest.fixture
+def scratch(database):
+    """A connection to an empty schema (the extensions come from the
+    test schema next to it on the search path)."""
+    import psycopg2
+
+    from conftest import TEST_SCHEMA
+
+    cur = database.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCRATCH_SCHEMA} CASCADE")
+    cur.execute(f"CREATE SCHEMA {SCRATCH_SCHEMA}")
+    database.commit()
+    conn = psycopg2.connect(
+        "", options=f"-c search_path={SCRATCH_SCHEMA},{TEST_SCHEMA}"
+    )
+    yield conn
+    conn.close()
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCRATCH_SCHEMA} CASCADE")
+    database.commit()
+
+
+def seed_old_layout(conn, rows):
+    run_migrations(conn, schema.COMPONENT,
+                   [m for m in schema.MIGRATIONS if m.version <= 7])
+    cur = conn.cursor()
+    cur.executemany(
+        "INSERT INTO movies (user_id, name, genre, year) "
+        "VALUES (%s, %s, %s, %s)",
+        rows
+    )
+    conn.commit()
+    return cur
+
+
+ROWS = [
+    (1, "Heat", "Crime", 1995),
+    (2, "Heat", "Crime", 1995),
+    (1, "Alien", "Horror", 1979),
+    (3, "Ran", "Drama", 1985),
+    (2, "Up", "Comedy", 2009),
+]
+
+
+def test_migrations_must_be_ordered(scratch):
+    with pytest.raises(ValueError):
+        run_migrations(scratch, "test", [
+            Migration(2, "b", []), Migration(1, "a", [])
+        ])
+
+
+def test_conversion_commits_each_batch_and_resumes(scratch, monkeypatch):
+    monkeypatch.setattr(schema, "CONVERSION_BATCH_SIZE", 2)
+    cur = seed_old_layout(scratch, ROWS)
+
+    calls = []
+
+    def interrupted(cur):
+        calls.append(True)
+        if len(calls) > 1:
+            raise RuntimeError("interrupted")
+        return schema.convert_movies_batch(cur)
+
+    with pytest.raises(RuntimeError):
+        run_migrations(scratch, schema.COMPONENT, [
+            Migration(8, "Convert movies", interrupted, batched=True)
+        ])
+    cur.execute("SELECT count(*) FROM movies WHERE title_id IS NOT NULL")
+    assert cur.fetchone()[0] == 2
+    assert current_version(cur, schema.COMPONENT) == 7
+    scratch.rollback()
+
+    assert run_migrations(scratch, schema.COMPONENT, schema.MIGRATIONS) \
+        == [8, 9, 10]
+    cur.execute(
+        "SELECT m.user_id, t.name, g.name, t.year, m.name, m.year "
+        "FROM movies m JOIN titles t ON t.id = m.title_id "
+        "JOIN genres g ON g.id = m.genre_id ORDER BY m.id"
+    )
+    assert [row[:4] for row in cur.fetchall()] == ROWS
+    cur.execute("SELECT count(*) FROM titles")
+    assert cur.fetchone()[0] == 4
+
+
+def test_compaction_converts_late_writes(scratch):
+    # Rows written by the previous release after migration 8 finished
+    cur = seed_old_layout(scratch, ROWS[:1])
+    run_migrations(scratch, schema.COMPONENT, [schema.MIGRATIONS[7]])
+    cur.execute(
+        "INSERT INTO movies (user_id, name, genre, year) "
+        "VALUES (4, 'Brazil', 'Comedy', 1985)"
+    )
+    scratch.commit()
+
+    run_migrations(scratch, schema.COMPONENT, schema.MIGRATIONS)
+    cur.execute("SELECT count(*) FROM movies WHERE title_id IS NULL")
+    assert cur.fetchone()[0] == 0
+    cur.execute(
+        "SELECT count(*) FROM information_schema.columns "
+        "WHERE table_schema = %s AND table_name = 'movies' "
+        "AND column_name IN ('genre', 'name_tsv')",
+        (SCRATCH_SCHEMA,)
+    )
+    assert cur.fetchone()[0] == 0
+
+
+def test_search_indexes_are_on_the_users_movies(scratch):
+    cur = seed_old_layout(scratch, ROWS)
+    run_migrations(scratch, schema.COMPONENT, schema.MIGRATIONS)
+
+    cur.execute(
+        "SELECT tablename FROM pg_indexes WHERE schemaname = %s "
+        "AND indexname LIKE %s",
+        (SCRATCH_SCHEMA, "%name_t%")
+    )
+    assert {row[0] for row in cur.fetchall()} <= {"movies"}
+    cur.execute(
+        "SELECT count(*) FROM information_schema.columns "
+        "WHERE table_schema = %s AND table_name = 'titles' "
+        "AND column_name = 'name_tsv'",
+        (SCRATCH_SCHEMA,)
+    )
+    assert cur.fetchone()[0] == 0
+
+
+def test_duplicates_are_kept_aside_and_logged(scratch, caplog):
+    run_migrations(scratch, schema.COMPONENT, schema.MIGRATIONS[:2])
+    cur = scratch.cursor()
+    cur.executemany(
+        "INSERT INTO movies (user_id, name, genre, year) "
+        "VALUES (%s, %s, %s, %s)",
+        [ROWS[0], ROWS[0], ROWS[1], ROWS[0][:2] + ("Drama", 1995)]
+    )
+    scratch.commit()
+
+    run_migrations(scratch, schema.COMPONENT, schema.MIGRATIONS[:3])
+
+    cur.execute("SELECT id FROM movies ORDER BY id")
+    assert cur.fetchall() == [(1,), (3,)]
+    cur.execute("SELECT id, genre, kept_id FROM movies_removed_duplicates "
+                "ORDER BY id")
+    assert cur.fetchall() == [(2, "Crime", 1), (4, "Drama", 1)]
+    assert "Removed 2 duplicate movies" in caplog.text
+    assert "2 -> 1, 4 -> 1" in caplog.text
@@ -0,0 +1,121 @@
+import os
+import uuid
+
+import pytest
+
+from movie_cache import LocalBackend, MovieListCache, RedisBackend
+
+
+def test_local_backend_expires_and_evicts(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("movie_cache.time.monotonic", lambda: now[0])
+    backend = LocalBackend(maxsize=2)
+    for key in ("1", "2", "3"):
+        assert backend.set(key, "", key.encode(), 10, 0)
+
+    assert backend.get("1", "") is None
+    assert backend.evictions == 1
+    assert backend.get("3", "") == b"3"
+    now[0] += 10
+    assert backend.get("3", "") is None
+
+
+def test_read_before_a_write_is_not_stored():
+    cache = MovieListCache(LocalBackend())
+    generation = cache.begin_read(1)
+    cache.invalidate(1)
+    cache.set(1, b"stale", generation)
+
+    assert cache.get(1) is None
+    assert cache.stats()["stale_writes_skipped"] == 1
+
+    cache.set(1, b"fresh", cache.begin_read(1))
+    assert cache.get(1) == b"fresh"
+
+
+def test_generations_are_shared_through_the_backend():
+    # Two replicas over one store: a write through either one keeps the
+    # other's slower read out of the cache
+    backend = LocalBackend()
+    reader, writer = MovieListCache(backend), MovieListCache(backend)
+    generation = reader.begin_read(1)
+    writer.invalidate(1)
+    reader.set(1, b"stale", generation)
+
+    assert writer.get(1) is None
+
+
+def test_local_generations_are_bounded():
+    backend = LocalBackend(maxsize=2)
+    stale = backend.generation("1")
+    for key in ("1", "2", "3"):
+        backend.invalidate(key)
+
+    assert len(backend._generations) == 2
+    # "1" lost its generation, but a read from before its write still
+    # cannot be stored
+    assert not backend.set("1", "", b"stale", 10, stale)
+    assert backend.set("1", "", b"fresh", 10, backend.generation("1"))
+    assert backend.get("1", "") == b"fresh"
+
+
+def test_backend_errors_do_not_fail_reads():
+    class Broken:
+        evictions = 0
+
+        def __getattr__(self, name):
+            def fail(*args):
+                raise OSError("down")
+            return fail
+
+    cache = MovieListCache(Broken())
+    generation = cache.begin_read(1)
+    cache.set(1, b"body", generation)
+    cache.invalidate(1)
+
+    assert generation is None
+    assert cache.get(1) is None
+    assert cache._stats["backend_errors"] == 3
+
+
+@pytest.fixture
+def redis_backends():
+    redis = pytest.importorskip("redis")
+    url = os.environ.get("MOVIE_CACHE_REDIS_URL", "redis://localhost:6379/0")
+    prefix = f"movies-test-{uuid.uuid4().hex}:"
+    backends = [RedisBackend(url, prefix=prefix) for _ in range(2)]
+    try:
+        backends[0].client.ping()
+    except redis.exceptions.ConnectionError:
+        pytest.skip(f"No Redis server at {url}")
+    yield backends
+    for name in backends[0].client.scan_iter(prefix + "*"):
+        backends[0].client.delete(name)
+
+
+def test_redis_generation_spans_replicas(redis_backends):
+    reader, writer = (MovieListCache(b) for b in redis_backends)
+    generation = reader.begin_read(1)
+    writer.invalidate(1)
+    reader.set(1, b"stale", generation)
+
+    assert writer.get(1) is None
+    reader.set(1, b"fresh", reader.begin_read(1))
+    assert writer.get(1) == b"fresh"
+
+
+def test_lists_are_cached_until_a_write(client):
+    import catalogue
+
+    def names():
+        body = client.get("/catalogue/movies?user_id=1").get_json()
+        return [movie["name"] for movie in body.get("movies", [])]
+
+    add = {"user_id": 1, "genre": "Drama", "year": 2000}
+    client.post("/catalogue/movies", json=dict(add, name="Heat"))
+    assert names() == ["Heat"]
+    assert names() == ["Heat"]
+    assert catalogue.movie_cache.stats()["hits"] == 1
+
+    client.post("/catalogue/movies", json=dict(add, name="Alien"))
+    assert names() == ["Alien", "Heat"]
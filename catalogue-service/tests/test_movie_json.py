@@ -0,0 +1,104 @@
+import datetime
+import decimal
+import json
+
+import pytest
+from flask import Flask
+
+import fastjson
+import movie_json
+
+ROWS = [
+    ("Amélie", "Comedy", 2001),
+    ('Say "Hi"\\\n', "Dra\tma", 1999),
+    ("  \x00", "</script>", 0),
+]
+
+
+@pytest.fixture(params=["orjson", "template"])
+def encoder(request, monkeypatch):
+    """encode_movie_page with and without orjson."""
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(movie_json, "orjson", None)
+    return movie_json.encode_movie_page
+
+
+def test_rows_encode_as_movie_objects():
+    for row in ROWS:
+        assert json.loads(movie_json.movie_json(row + ("extra",))) == {
+            "name": row[0], "genre": row[1], "year": row[2]
+        }
+
+
+@pytest.mark.parametrize("next_cursor", [None, 'abc"def'])
+def test_pages_match_the_standard_encoder(encoder, next_cursor):
+    expected = {
+        "movies": [{"name": n, "genre": g, "year": y} for n, g, y in ROWS],
+        "next_cursor": next_cursor,
+    }
+
+    body = encoder(ROWS, next_cursor)
+
+    assert json.loads(body) == expected
+    assert body == json.dumps(expected, separators=(",", ":"),
+                              ensure_ascii=False).encode("utf-8")
+
+
+def test_empty_pages(encoder):
+    assert encoder([], None) == b'{"movies":[],"next_cursor":null}'
+
+
+def test_fast_provider_matches_flask_output():
+    pytest.importorskip("orjson")
+    data = {
+        "when": datetime.datetime(2024, 5, 1, 12, 30,
+                                  tzinfo=datetime.timezone.utc),
+        "day": datetime.date(2024, 5, 1),
+        "price": decimal.Decimal("9.50"),
+        "name": "Amélie",
+        "ids": [1, 2],
+    }
+    app = Flask(__name__)
+    with app.app_context():
+        standard = app.json.response(data).get_json()
+        fastjson.install_json_provider(app)
+        assert isinstance(app.json, fastjson.FastJSONProvider)
+        fast = app.json.response(data)
+
+    assert fast.get_json() == standard
+    assert fast.get_data().endswith(b"\n")
+
+
+def test_std_provider_can_be_forced(monkeypatch):
+    monkeypatch.setenv("JSON_PROVIDER", "std")
+    app = Flask(__name__)
+
+    fastjson.install_json_provider(app)
+
+    assert not isinstance(app.json, fastjson.FastJSONProvider)
+
+
+def test_non_ascii_is_sent_as_utf8_not_escaped():
+    pytest.importorskip("orjson")
+    app = Flask(__name__)
+    with app.app_context():
+        standard = app.json.response({"name": "Amélie"}).get_data()
+        fastjson.install_json_provider(app)
+        fast = app.json.response({"name": "Amélie"}).get_data()
+
+    assert b"\\u00e9" in standard
+    assert "Amélie".encode("utf-8") in fast
+    assert json.loads(fast) == json.loads(standard)
+
+
+def test_encoded_bodies_are_nested_without_decoding():
+    body = fastjson.dumps({"movies": [], "next_cursor": None})
+
+    wrapped = fastjson.envelope_prefix({"message": "ok"}, "data") + body \
+        + b"}"
+
+    assert json.loads(wrapped) == {
+        "message": "ok", "data": {"movies": [], "next_cursor": None}
+    }
@@ -0,0 +1,57 @@
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+import movie_store  # noqa: E402
+from movie_store import (  # noqa: E402
+    DELETE_MOVIE_SQL, MOVIE_FROM, genre_id, insert_movie, title_id
+)
+
+
+def test_titles_and_genres_are_shared_between_users(cur):
+    first = insert_movie(cur, 1, "Alien", "Horror", 1979)
+    second = insert_movie(cur, 2, "Alien", "Horror", 1979)
+
+    assert first[1:] == second[1:] == ("Alien", "Horror", 1979)
+    cur.execute("SELECT count(*) FROM titles")
+    assert cur.fetchone()[0] == 1
+    cur.execute("SELECT count(*) FROM genres")
+    assert cur.fetchone()[0] == 1
+
+
+def test_duplicate_movie_of_a_user(cur):
+    insert_movie(cur, 1, "Alien", "Horror", 1979)
+
+    assert insert_movie(cur, 1, "Alien", "Drama", 1979,
+                        skip_existing=True) is None
+    with pytest.raises(psycopg2.IntegrityError):
+        insert_movie(cur, 1, "Alien", "Horror", 1979)
+
+
+def test_genre_written_by_a_rolled_back_transaction_is_not_cached(
+        database, cur):
+    insert_movie(cur, 1, "Alien", "Horror", 1979)
+    # Read back by a later statement of the same transaction
+    insert_movie(cur, 1, "Halloween", "Horror", 1978)
+    database.rollback()
+
+    assert "Horror" not in movie_store._genre_ids
+    assert insert_movie(cur, 1, "Alien", "Horror", 1979)[2] == "Horror"
+
+
+def test_committed_genre_is_cached(database, cur):
+    genre = genre_id(cur, "Horror")
+    database.commit()
+
+    assert genre_id(cur, "Horror") == genre
+    assert movie_store._genre_ids["Horror"] == genre
+
+
+def test_delete_returns_the_joined_row(cur):
+    movie = insert_movie(cur, 1, "Alien", "Horror", 1979)
+    title_id(cur, "Aliens", 1986)
+
+    cur.execute(DELETE_MOVIE_SQL, ("Alien", 1979, 1))
+    assert cur.fetchall() == [movie]
+    cur.execute(f"SELECT count(*) FROM {MOVIE_FROM}")
+    assert cur.fetchone()[0] == 0
@@ -0,0 +1,85 @@
+import pytest
+
+from listing import InvalidListQuery
+from movie_store import insert_movie
+from search import (
+    build_search_sql, encode_search_cursor, parse_search_query,
+    prepare_search
+)
+
+
+def search_pages(cur, user_id, args):
+    """Follow next cursors to the end; return every row seen."""
+    rows, after = [], None
+    while True:
+        query = parse_search_query(dict(args, after=after))
+        prepare_search(cur, query)
+        sql, params = build_search_sql(user_id, query)
+        cur.execute(sql, params)
+        page = cur.fetchall()
+        rows.extend(page[:query.limit])
+        if len(page) <= query.limit:
+            return rows
+        after = encode_search_cursor(query, page[query.limit - 1])
+
+
+def test_cursor_is_bound_to_its_search():
+    query = parse_search_query({"q": "star", "mode": "fulltext"})
+    cursor = encode_search_cursor(query, ("Star", "Drama", 1977, 4, 0.25))
+
+    assert parse_search_query(
+        {"q": "star", "mode": "fulltext", "after": cursor}
+    ).after == (0.25, "Star", 4)
+    with pytest.raises(InvalidListQuery):
+        parse_search_query({"q": "wars", "mode": "fulltext", "after": cursor})
+
+
+@pytest.mark.parametrize("mode, text", [
+    ("fulltext", "film"),
+    ("prefix", "fil"),
+])
+def test_pages_through_tied_scores(cur, mode, text):
+    # Same-length names: every match has the same, non-round score
+    for i in range(23):
+        insert_movie(cur, 1, f"Film {i:03d}", "Drama", 2000)
+    insert_movie(cur, 1, "Other", "Drama", 2000)
+    insert_movie(cur, 2, "Film 999", "Drama", 2000)
+
+    rows = search_pages(cur, 1, {"q": text, "mode": mode, "limit": "5"})
+
+    names = [row[0] for row in rows]
+    assert names == [f"Film {i:03d}" for i in range(23)]
+    assert len({row[4] for row in rows}) == 1
+
+
+def test_filters_apply_to_matches(cur):
+    insert_movie(cur, 1, "Night Train", "Drama", 1990)
+    insert_movie(cur, 1, "Night Shift", "Comedy", 2010)
+
+    rows = search_pages(cur, 1, {"q": "night", "genre": "Comedy"})
+    assert [row[0] for row in rows] == ["Night Shift"]
+    rows = search_pages(cur, 1, {"q": "night", "year_max": "2000"})
+    assert [row[0] for row in rows] == ["Night Train"]
+
+
+@pytest.mark.parametrize("mode, index", [
+    ("prefix", "movies_user_lower_name_idx"),
+    ("fulltext", "movies_user_name_tsv_idx"),
+    ("trigram", "movies_user_name_trgm_idx"),
+])
+def test_matches_come_from_the_users_index(cur, mode, index):
+    # The user's movies are found through the index on their own names,
+    # not by matching every title and joining back
+    for i in range(200):
+        insert_movie(cur, 1 + i % 2, f"Film {i:03d}", "Drama", 2000)
+    insert_movie(cur, 1, "Night Train", "Drama", 1990)
+    cur.execute("ANALYZE movies")
+    cur.execute("SET LOCAL enable_seqscan = off")
+    query = parse_search_query({"q": "night", "mode": mode})
+    prepare_search(cur, query)
+    sql, params = build_search_sql(1, query)
+    cur.execute("EXPLAIN " + sql, params)
+    plan = "\n".join(row[0] for row in cur.fetchall())
+
+    assert index in plan
+    assert "titles" not in plan
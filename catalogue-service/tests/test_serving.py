@@ -0,0 +1,47 @@
+import pytest
+
+import serving
+
+
+def test_default_workers_are_capped(monkeypatch):
+    monkeypatch.delenv("WEB_WORKERS", raising=False)
+    monkeypatch.setattr(serving.multiprocessing, "cpu_count", lambda: 32)
+
+    assert serving.web_workers() == serving.MAX_DEFAULT_WORKERS
+    assert serving.web_workers(default=1) == 1
+
+
+def test_small_nodes_keep_the_cpu_formula(monkeypatch):
+    monkeypatch.delenv("WEB_WORKERS", raising=False)
+    monkeypatch.setattr(serving.multiprocessing, "cpu_count", lambda: 1)
+
+    assert serving.web_workers() == 3
+
+
+def test_explicit_worker_count_wins(monkeypatch):
+    monkeypatch.setenv("WEB_WORKERS", "9")
+
+    assert serving.web_workers(default=1) == 9
+    monkeypatch.setenv("SERVE_MODE", "development")
+    assert serving.server_processes() == 1
+
+
+def test_one_worker_needs_no_metrics_dir(monkeypatch):
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+
+    serving.check_metrics_dir(1)
+
+
+def test_several_workers_need_a_metrics_dir(monkeypatch, tmp_path):
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    with pytest.raises(RuntimeError, match="PROMETHEUS_MULTIPROC_DIR"):
+        serving.check_metrics_dir(4)
+
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path / "missing"))
+    with pytest.raises(RuntimeError, match="not a writable directory"):
+        serving.check_metrics_dir(4)
+
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    serving.check_metrics_dir(4)
+    assert serving.gunicorn_options(8000, 4, "gthread")["child_exit"] \
+        is serving._mark_worker_dead
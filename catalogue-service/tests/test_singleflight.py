@@ -0,0 +1,171 @@
+import threading
+import time
+
+from singleflight import SingleFlight
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def run_together(flights, key, function, callers):
+    """Call flights.do(key, function) from `callers` threads at once;
+    returns their results (or exceptions)."""
+    results = [None] * callers
+
+    def call(index):
+        try:
+            results[index] = flights.do(key, function)
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=call, args=(i,))
+               for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_overlapping_calls_share_one_run():
+    flights = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def load():
+        runs.append(1)
+        release.wait(5)
+        return "page"
+
+    threads, results = run_together(flights, "k", load, 5)
+    wait_for(lambda: flights.stats()["coalesced"] == 4)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["page"] * 5
+    assert len(runs) == 1
+    assert flights.stats() == {"leaders": 1, "coalesced": 4,
+                               "wait_timeouts": 0, "in_flight": 0}
+
+
+def test_followers_share_the_leaders_error():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def load():
+        release.wait(5)
+        raise LookupError("no database")
+
+    threads, results = run_together(flights, "k", load, 3)
+    wait_for(lambda: flights.stats()["coalesced"] == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert all(isinstance(result, LookupError) for result in results)
+
+
+def test_calls_after_the_flight_run_again():
+    flights = SingleFlight()
+    runs = []
+
+    assert flights.do("k", lambda: runs.append(1) or len(runs)) == 1
+    assert flights.do("k", lambda: runs.append(1) or len(runs)) == 2
+    assert flights.do("other", lambda: "x") == "x"
+
+
+def test_followers_stop_waiting_for_a_stuck_leader():
+    flights = SingleFlight(wait_timeout=0.05)
+    release = threading.Event()
+    leader = threading.Thread(
+        target=flights.do, args=("k", lambda: release.wait(5))
+    )
+    leader.start()
+    wait_for(lambda: flights.stats()["in_flight"] == 1)
+
+    try:
+        assert flights.do("k", lambda: "own") == "own"
+        assert flights.stats()["wait_timeouts"] == 1
+    finally:
+        release.set()
+        leader.join()
+
+
+def test_disabled_flights_always_run():
+    flights = SingleFlight(enabled=False)
+    release = threading.Event()
+    started = []
+
+    def load():
+        started.append(1)
+        release.wait(5)
+        return "page"
+
+    threads, results = run_together(flights, "k", load, 3)
+    wait_for(lambda: len(started) == 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["page"] * 3
+
+
+def test_identical_list_reads_run_one_query(client, monkeypatch):
+    import catalogue
+
+    client.post("/catalogue/movies", json={
+        "user_id": 1, "name": "Heat", "genre": "Drama", "year": 1995
+    })
+    flights = SingleFlight()
+    monkeypatch.setattr(catalogue, "list_flights", flights)
+    release = threading.Event()
+    load_movie_list = catalogue.load_movie_list
+    queries = []
+
+    def slow_load(*args):
+        queries.append(1)
+        release.wait(5)
+        return load_movie_list(*args)
+
+    monkeypatch.setattr(catalogue, "load_movie_list", slow_load)
+    responses = []
+
+    def read():
+        app_client = catalogue.app.test_client()
+        responses.append(app_client.get("/catalogue/movies?user_id=1"))
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: flights.stats()["coalesced"] == 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(queries) == 1
+    assert [r.get_json()["movies"][0]["name"] for r in responses] == \
+        ["Heat"] * 4
+
+
+def test_reads_after_a_write_do_not_join_older_flights(client,
+                                                      monkeypatch):
+    import catalogue
+
+    keys = []
+    flights = SingleFlight()
+    do = flights.do
+    monkeypatch.setattr(flights, "do",
+                        lambda key, function: keys.append(key)
+                        or do(key, function))
+    monkeypatch.setattr(catalogue, "list_flights", flights)
+
+    client.get("/catalogue/movies?user_id=1")
+    client.post("/catalogue/movies", json={
+        "user_id": 1, "name": "Heat", "genre": "Drama", "year": 1995
+    })
+    client.get("/catalogue/movies?user_id=1")
+
+    assert keys[0] != keys[1]